@@ -1,40 +1,105 @@
 import logging
+import signal
 import time
+from functools import partial
+from threading import RLock
 
 from apscheduler.schedulers.background import BackgroundScheduler
-
-from aircon import FujitsuAircon, StaticFujitsuAircon
-from composer import Composer
+from pyowm import OWM
+
+from away_from_home import log
+from away_from_home.aircon import AirconPool, AutoDiscoveringFujitsuAircon, FujitsuAircon, StaticFujitsuAircon, \
+    ZmoteDirectory, STORE_KEY_PREFIX as ZMOTE_STORE_KEY_PREFIX
+from away_from_home.commands import CommandQueue
+from away_from_home.composer import Composer, STORE_KEY_PREFIX as COMPOSER_STORE_KEY_PREFIX
+from away_from_home.expirer import TimerWheel
+from away_from_home.fujitsu import FujitsuState, encode
+from away_from_home.heartbeat import ACTIVE_KEY, Heartbeat
+from away_from_home.limiter import RateLimiter
+from away_from_home.policy import compile_policy
+from away_from_home.provider import OWMProvider, ProviderChain
+from away_from_home.store import Store
+from away_from_home.tracing import Tracer
+from away_from_home.weather import Weather, STORE_KEY_PREFIX as WEATHER_STORE_KEY_PREFIX
 from config import *
-from heartbeat import Heartbeat
-from weather import Weather
 
 if __name__ == '__main__':
-    handler = logging.StreamHandler()
-    handler.setFormatter(
-        logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    )
-
     class_names_to_log = [
         Weather.__name__,
         'Connector',
         'Transport',
         'Discoverer',
+        RateLimiter.__name__,
+        ProviderChain.__name__,
         FujitsuAircon.__name__,
+        AirconPool.__name__,
+        ZmoteDirectory.__name__,
+        CommandQueue.__name__,
         Composer.__name__,
+        Tracer.__name__,
         Heartbeat.__name__,
+        Store.__name__,
+        'Journal',
+        TimerWheel.__name__,
         'apscheduler.scheduler',
         'apscheduler.executors.default',
+        'away_from_home',
     ]
 
-    for cls in class_names_to_log:
-        logger = logging.getLogger(cls)
-        logger.setLevel(logging.DEBUG)
-        logger.addHandler(handler)
+    log.setup(class_names_to_log)
+
+    # debug tracing is off by default; list class names in TRACE_PATH and send SIGUSR1 to turn it on without a restart
+    log.install_tracing_switch(TRACE_PATH, class_names_to_log)
 
     logger = logging.getLogger('away_from_home')
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(handler)
+
+    # compiled up front so a bad policy stops us here rather than on the first run
+    policy = compile_policy(POLICY) if POLICY is not None else None
+
+    # the recorded codes, or generated ones for FUJITSU_STATE; encoded up front for the same reason
+    fujitsu_state = FujitsuState(power=True, **FUJITSU_STATE) if FUJITSU_STATE is not None else None
+    if fujitsu_state is not None:
+        encode(fujitsu_state)
+
+    # one wheel for every timeout in the process (heartbeat peer expiry, cache eviction) rather than a thread polling
+    # for each
+    logger.debug('creating TimerWheel object')
+    timer_wheel = TimerWheel()
+    timer_wheel.start()
+
+    # the last weather and the last aircon action are replicated from the active node to standby peers and journaled
+    # to disk, so whichever node takes over (or restarts) starts warm rather than re-fetching weather and re-sending IR
+    # commands
+    logger.debug('creating Store object')
+    store = Store(
+        replicated=[WEATHER_STORE_KEY_PREFIX, COMPOSER_STORE_KEY_PREFIX],
+        path=STORE_PATH,
+        persisted=[WEATHER_STORE_KEY_PREFIX, COMPOSER_STORE_KEY_PREFIX, ZMOTE_STORE_KEY_PREFIX],
+        compact_every=STORE_COMPACT_EVERY,
+    )
+
+    logger.debug('creating Heartbeat object with priority %s', HA_PRIORITY)
+    heartbeat = Heartbeat(priority=HA_PRIORITY, timer_wheel=timer_wheel, store=store)
+    store.replicate(heartbeat)
+
+    logger.debug('creating RateLimiter object')
+    limiter = RateLimiter(
+        rate=OWM_REQUESTS_PER_MINUTE / 60.0,
+        burst=OWM_BURST,
+        path=OWM_BUDGET_PATH,
+    )
+
+    logger.debug('creating ProviderChain object')
+    providers = [OWMProvider(OWM(OWM_KEY))]
+    if OWM_FALLBACK_KEY is not None:
+        providers.append(OWMProvider(OWM(OWM_FALLBACK_KEY), name='owm_fallback'))
+
+    provider = ProviderChain(
+        providers=providers,
+        timeout=PROVIDER_TIMEOUT,
+        failure_threshold=PROVIDER_FAILURE_THRESHOLD,
+        reset_timeout=PROVIDER_RESET_TIMEOUT,
+    )
 
     logger.debug('creating Weather object')
     weather = Weather(
@@ -42,52 +107,139 @@ if __name__ == '__main__':
         lat=LAT,
         lon=LON,
         cache_period=CACHE_PERIOD,
+        background_refresh=BACKGROUND_REFRESH,
+        max_staleness=MAX_STALENESS,
+        timeout=REFRESH_TIMEOUT,
+        cache_path=CACHE_PATH,
+        limiter=limiter,
+        history_size=HISTORY_SIZE,
+        forecast_period=FORECAST_PERIOD,
+        provider=provider,
+        store=store,
     )
+    weather.start()
 
-    logger.debug('creating StaticFujitsuAircon object')
-    aircon = StaticFujitsuAircon(
-        ip=IP,
+    logger.debug('creating AirconPool object')
+    pool = AirconPool(
+        aircon_class=partial(FujitsuAircon, state=fujitsu_state),
         retries=RETRIES,
+        idle_timeout=ZMOTE_IDLE_TIMEOUT,
+        timer_wheel=timer_wheel,
+    )
+
+    logger.debug('creating ZmoteDirectory object')
+    directory = ZmoteDirectory(
+        ttl=ZMOTE_DISCOVERY_TTL,
+        store=store,
+        timer_wheel=timer_wheel,
     )
 
+    # a fixed IP if one's configured, otherwise the zmote with UUID, found through the directory
+    if IP is not None:
+        logger.debug('creating StaticFujitsuAircon object')
+        aircon = StaticFujitsuAircon(
+            ip=IP,
+            retries=RETRIES,
+            pool=pool,
+            state=fujitsu_state,
+        )
+    else:
+        logger.debug('creating AutoDiscoveringFujitsuAircon object')
+        aircon = AutoDiscoveringFujitsuAircon(
+            uuid=UUID,
+            retries=RETRIES,
+            directory=directory,
+            state=fujitsu_state,
+            pool=pool,
+        )
+        directory.start()
+
+    logger.debug('creating Tracer object')
+    tracer = Tracer(
+        capacity=DECISION_TRACE_BUFFER_SIZE,
+        path=DECISION_TRACE_PATH,
+    )
+
+    logger.debug('creating CommandQueue object')
+    commands = CommandQueue(
+        aircon=aircon,
+        timer_wheel=timer_wheel,
+        retries=RETRIES,
+        interval=IR_RETRY_INTERVAL,
+        tracer=tracer,
+    )
+    commands.start()
+
     logger.debug('creating Composer object')
     composer = Composer(
         weather=weather,
-        aircon=aircon,
+        aircon=commands,
         on_threshold=ON_THRESHOLD,
-        off_threshold=OFF_THRESHOLD
+        off_threshold=OFF_THRESHOLD,
+        smoothed=SMOOTHED,
+        pre_cool_minutes=PRE_COOL_MINUTES,
+        store=store,
+        event_driven=EVENT_DRIVEN,
+        policy=policy,
+        tracer=tracer,
     )
 
     logger.debug('running Composer once to ensure everything works')
-    composer.run()
-
-    logger.debug('creating Heartbeat object with priority {0}'.format(HA_PRIORITY))
-    heartbeat = Heartbeat(priority=HA_PRIORITY)
-    heartbeat.start()
-
-    logger.debug('sleeping for 5 seconds')
-    time.sleep(5)
+    composer.run().result()
 
     logger.debug('creating BackgroundScheduler object')
     sched = BackgroundScheduler()
     sched.start()
 
     composer_run_job = None
+    composer_run_job_lock = RLock()
 
-    while 1:
-        try:
-            if heartbeat.active and composer_run_job is None:
+    # called on whichever thread heartbeat publishes from, as soon as we go active or into standby
+    def handle_active(key, active, old_active):
+        global composer_run_job
+
+        with composer_run_job_lock:
+            if active and composer_run_job is None:
                 logger.info('going into active')
-                composer_run_job = sched.add_job(composer.run, 'cron', second=CRON_SECONDS)
-            elif not heartbeat.active and composer_run_job is not None:
+                if EVENT_DRIVEN:
+                    composer.start()
+                    composer_run_job = sched.add_job(composer.run, 'cron', minute=SAFETY_NET_CRON_MINUTES, second=0)
+                else:
+                    composer_run_job = sched.add_job(composer.run, 'cron', second=CRON_SECONDS)
+            elif not active and composer_run_job is not None:
                 logger.info('going into standby')
+                composer.stop()
                 sched.remove_all_jobs()
                 composer_run_job = None
 
-            time.sleep(1)
+    heartbeat.start()
+
+    logger.debug('sleeping for 5 seconds')
+    time.sleep(5)
+
+    store.subscribe(ACTIVE_KEY, handle_active)
+    handle_active(ACTIVE_KEY, store.get(ACTIVE_KEY), None)
+
+    # nothing to poll; sleep until interrupted
+    while 1:
+        try:
+            signal.pause()
         except KeyboardInterrupt:
             break
 
     heartbeat.stop()
 
+    weather.stop()
+
     sched.shutdown()
+
+    commands.stop()
+
+    if IP is None:
+        directory.stop()
+
+    pool.close()
+
+    timer_wheel.stop()
+
+    store.close()
@@ -1,17 +1,30 @@
-import inspect
+import select
+import socket
 import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError, wait
+from functools import partial
 from logging import getLogger
+from threading import Event, RLock, Thread
 
 from zmote.connector import TCPTransport, Connector
 from zmote.discoverer import active_discover_zmotes
 
+from away_from_home.expirer import TTLCache
+from away_from_home.fujitsu import encode, render
+from away_from_home.store import Store
+from away_from_home.tracing import span
+
+STORE_KEY_PREFIX = 'zmote.'
+
 
 class Aircon(object):
     def __init__(self, ip, retries):
+        self._transport = TCPTransport(
+            ip=ip,
+        )
+
         self._connector = Connector(
-            transport=TCPTransport(
-                ip=ip,
-            )
+            transport=self._transport
         )
 
         self._retries = retries
@@ -20,112 +33,439 @@ class Aircon(object):
         self._off_message = '1:1,0,37000,1,1,0'
 
         self._logger = getLogger(self.__class__.__name__)
-        self._logger.debug('{0}(); ip={1}, retries={2}'.format(
-            inspect.currentframe().f_code.co_name, repr(ip), retries
-        ))
+        self._logger.debug('__init__(); ip=%r, retries=%s', ip, retries)
 
     def connect(self):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
+        self._logger.debug('connect()')
+
+        with span('aircon.connect'):
+            self._connector.connect()
+
+    def healthy(self):
+        # whether the connection still looks open, without sending anything; a peer that has closed it shows as
+        # readable with nothing to read
+        sock = getattr(self._transport, '_sock', None)
+        if not isinstance(sock, socket.socket):
+            return True
+
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            if len(readable) == 0:
+                return True
+
+            data = sock.recv(1, socket.MSG_PEEK)
+        except (socket.error, OSError, ValueError):
+            return False
 
-        self._connector.connect()
+        return len(data) > 0
+
+    def _message(self, name):
+        return self._on_message if name == 'on' else self._off_message
+
+    def send(self, name):
+        # one transmission of 'on' or 'off', without retrying or sleeping
+        with span('aircon.send'):
+            self._connector.send(self._message(name))
 
     def on(self, sleep=1):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
+        self._logger.debug('on()')
 
         for i in range(0, self._retries):
-            self._connector.send(self._on_message)
-            time.sleep(sleep)
+            self.send('on')
+
+            with span('aircon.sleep'):
+                time.sleep(sleep)
 
     def off(self, sleep=1):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
+        self._logger.debug('off()')
 
         for i in range(0, self._retries):
-            self._connector.send(self._off_message)
-            time.sleep(sleep)
+            self.send('off')
+
+            with span('aircon.sleep'):
+                time.sleep(sleep)
 
     def disconnect(self):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
+        self._logger.debug('disconnect()')
+
+        with span('aircon.disconnect'):
+            self._connector.disconnect()
+
+
+class ZmoteDirectory(object):
+    # zmote uuid -> ip in a TTLCache, so finding a zmote is a lookup rather than a broadcast and a wait; a missing uuid
+    # is loaded single-flight (concurrent commands share one discovery) from the Store if it's there, else discovered
+    #
+    # once started, a background loop re-discovers the known uuids every refresh_ahead of ttl seconds, before their
+    # entries expire, and re-sets the last ip of any that don't answer, so an entry only goes when invalidated (i.e.
+    # connecting to it failed); entries are also kept in the Store as [ip, discovered at], so with a persisted
+    # STORE_KEY_PREFIX they survive a restart
+    def __init__(self, ttl=3600, store=None, attempts=5, clock=time.time, timer_wheel=None, refresh_ahead=0.8):
+        self._ttl = ttl
+        self._store = store if store is not None else Store()
+        self._attempts = attempts
+        self._clock = clock
+        self._refresh_ahead = refresh_ahead
+
+        self._cache = TTLCache(ttl, clock=clock, timer_wheel=timer_wheel)
 
-        self._connector.disconnect()
+        self._uuids = set()
+
+        # one discovery at a time; a zmote only answers one of them
+        self._lock = RLock()
+
+        self._refresh_thread = Thread(
+            target=self._refresh
+        )
+        self._refresh_thread.daemon = True
+
+        self._stopped = False
+        self._wake = Event()
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug(
+            '__init__(); ttl=%s, store=%s, attempts=%s, timer_wheel=%s, refresh_ahead=%s',
+            ttl, store, attempts, timer_wheel, refresh_ahead
+        )
+
+    @staticmethod
+    def _key(uuid):
+        return STORE_KEY_PREFIX + uuid
+
+    def _discover(self, **kwargs):
+        with span('aircon.discover'):
+            zmotes = active_discover_zmotes(**kwargs)
+
+        discovered = self._clock()
+        for uuid, zmote in zmotes.items():
+            self._cache.set(uuid, zmote['IP'])
+            self._store.set(self._key(uuid), [zmote['IP'], discovered])
+
+        self._logger.debug('_discover(); zmotes=%s', sorted(zmotes))
+
+        return zmotes
+
+    def _load(self, uuid):
+        entry = self._store.get(self._key(uuid))
+        if entry is not None:
+            return entry[0]
+
+        with self._lock:
+            for i in range(0, self._attempts):
+                zmote = self._discover(uuid_to_look_for=uuid).get(uuid)
+                if zmote is not None:
+                    return zmote['IP']
+
+                time.sleep(1)
+
+        raise ValueError('failed to discover zmote {0!r}'.format(uuid))
+
+    def get(self, uuid):
+        self._uuids.add(uuid)
+
+        return self._cache.get_or_load(uuid, self._load)
+
+    def invalidate(self, uuid):
+        self._logger.info('invalidate(); uuid=%r', uuid)
+
+        self._cache.invalidate(uuid)
+        self._store.set(self._key(uuid), None)
+
+    def _refresh(self, test_mode=False):
+        while not self._stopped:
+            uuids = [x for x in list(self._uuids) if x in self._cache]
+
+            if len(uuids) > 0:
+                try:
+                    with self._lock:
+                        # stops listening once every known zmote has answered
+                        zmotes = self._discover(unique_zmote_count=len(uuids))
+                except Exception as e:
+                    self._logger.warning('_refresh(); failed to re-discover zmotes; error=%r', e)
+                    zmotes = {}
+
+                # an unanswered probe isn't a reason to forget where a zmote was
+                for uuid in uuids:
+                    ip = self._cache.get(uuid)
+                    if uuid not in zmotes and ip is not None:
+                        self._cache.set(uuid, ip)
+
+            if test_mode:
+                break
+
+            self._wake.wait(self._ttl * self._refresh_ahead)
+            self._wake.clear()
+
+    def start(self):
+        self._refresh_thread.start()
+
+    def stop(self):
+        self._stopped = True
+
+        self._wake.set()
+        self._refresh_thread.join()
 
 
 class AutoDiscoveringAircon(object):
-    def __init__(self, uuid, retries, aircon_class):
+    def __init__(self, uuid, retries, aircon_class, directory=None, pool=None):
         self._uuid = uuid
         self._retries = retries
         self._aircon_class = aircon_class
 
-        self._aircon = None
+        # pass a directory to share it (and its background refresh) between aircons
+        self._directory = directory if directory is not None else ZmoteDirectory()
 
-    def _acquire_aircon(self):
-        for i in range(0, 5):
-            zmote = active_discover_zmotes(uuid_to_look_for=self._uuid).get(self._uuid)
+        # connections are kept open between commands (per ip, so a zmote that moves gets a new one); pass a pool to
+        # share one between aircons
+        self._pool = pool if pool is not None else AirconPool(aircon_class, retries)
 
-            if zmote is None:
-                time.sleep(1)
-                continue
+        self._ip = None
+        self._aircon = None
 
-            self._aircon = self._aircon_class(
-                ip=zmote['IP'],
-                retries=self._retries
-            )
-            self._aircon.connect()
+    def _acquire_aircon(self):
+        ip = self._directory.get(self._uuid)
 
-            return
+        try:
+            aircon = self._pool.acquire(ip)
+        except Exception:
+            # it's probably moved (e.g. a new DHCP lease), so the next acquire finds it afresh
+            self._directory.invalidate(self._uuid)
+            raise
 
-        raise ValueError('failed to discover zmote and acquire aircon')
+        self._ip = ip
+        self._aircon = aircon
 
-    def _release_aircon(self):
-        self._aircon.disconnect()
+    def _release_aircon(self, failed=False):
+        self._pool.release(self._ip, self._aircon, failed=failed)
         self._aircon = None
 
-    def on(self):
+    def _command(self, name, *args):
         self._acquire_aircon()
-        self._aircon.on()
+
+        try:
+            getattr(self._aircon, name)(*args)
+        except Exception:
+            self._release_aircon(failed=True)
+            raise
+
         self._release_aircon()
 
+    def on(self):
+        self._command('on')
+
     def off(self):
-        self._acquire_aircon()
-        self._aircon.off()
-        self._release_aircon()
+        self._command('off')
+
+    def send(self, name):
+        self._command('send', name)
+
+
+class AirconPool(object):
+    # keeps connected Aircon objects per zmote ip between commands, so a command costs a send rather than a TCP
+    # handshake; a pooled connection is checked before reuse and replaced (lazily, on the next acquire) if it's been
+    # idle longer than idle_timeout, looks closed or failed during use; given a TimerWheel idle connections are also
+    # closed as soon as they time out rather than on the next acquire
+    def __init__(self, aircon_class, retries, idle_timeout=60, clock=time.monotonic, timer_wheel=None):
+        self._aircon_class = aircon_class
+        self._retries = retries
+        self._idle_timeout = idle_timeout
+        self._clock = clock
+        self._timer_wheel = timer_wheel
+
+        # ip -> [(aircon, released at)], most recently released last
+        self._idle = {}
+        self._lock = RLock()
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug(
+            '__init__(); aircon_class=%s, retries=%s, idle_timeout=%s, timer_wheel=%s',
+            aircon_class, retries, idle_timeout, timer_wheel
+        )
+
+    def _discard(self, ip, aircon):
+        self._logger.debug('_discard(); ip=%r, aircon=%s', ip, aircon)
+
+        try:
+            aircon.disconnect()
+        except Exception as e:
+            self._logger.debug('_discard(); ignoring error=%r', e)
+
+    def _take_idle(self, ip):
+        with self._lock:
+            entries = self._idle.get(ip, [])
+
+            while len(entries) > 0:
+                aircon, released = entries.pop()
+
+                if self._clock() - released > self._idle_timeout:
+                    self._discard(ip, aircon)
+                    continue
+
+                if not aircon.healthy():
+                    self._logger.info('_take_idle(); ip=%r, pooled connection closed, reconnecting', ip)
+                    self._discard(ip, aircon)
+                    continue
+
+                return aircon
+
+            return None
+
+    def acquire(self, ip):
+        aircon = self._take_idle(ip)
+        if aircon is not None:
+            return aircon
+
+        self._logger.debug('acquire(); ip=%r, connecting', ip)
+
+        aircon = self._aircon_class(
+            ip=ip,
+            retries=self._retries
+        )
+        aircon.connect()
+
+        return aircon
+
+    def _expire(self, ip, aircon, released):
+        with self._lock:
+            entries = self._idle.get(ip, [])
+            if (aircon, released) not in entries:
+                return
+
+            entries.remove((aircon, released))
+
+        self._discard(ip, aircon)
+
+    def release(self, ip, aircon, failed=False):
+        # a connection that failed is dropped rather than pooled
+        if failed:
+            self._discard(ip, aircon)
+            return
+
+        released = self._clock()
+
+        with self._lock:
+            self._idle.setdefault(ip, []).append((aircon, released))
+
+        if self._timer_wheel is not None:
+            self._timer_wheel.schedule(self._idle_timeout, self._expire, ip, aircon, released)
+
+    def close(self):
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+
+        for ip, entries in idle.items():
+            for aircon, _ in entries:
+                self._discard(ip, aircon)
 
 
 class StaticAircon(object):
-    def __init__(self, ip, retries, aircon_class):
+    def __init__(self, ip, retries, aircon_class, pool=None):
         self._ip = ip
         self._retries = retries
         self._aircon_class = aircon_class
 
+        # connections are kept open between commands; pass a pool to share one between aircons
+        self._pool = pool if pool is not None else AirconPool(aircon_class, retries)
+
         self._aircon = None
 
     def _acquire_aircon(self):
-        self._aircon = self._aircon_class(
-            ip=self._ip,
-            retries=self._retries
-        )
-        self._aircon.connect()
+        self._aircon = self._pool.acquire(self._ip)
 
-    def _release_aircon(self):
-        self._aircon.disconnect()
+    def _release_aircon(self, failed=False):
+        self._pool.release(self._ip, self._aircon, failed=failed)
         self._aircon = None
 
-    def on(self):
+    def _command(self, name, *args):
         self._acquire_aircon()
-        self._aircon.on()
+
+        try:
+            getattr(self._aircon, name)(*args)
+        except Exception:
+            self._release_aircon(failed=True)
+            raise
+
         self._release_aircon()
 
+    def on(self):
+        self._command('on')
+
     def off(self):
-        self._acquire_aircon()
-        self._aircon.off()
-        self._release_aircon()
+        self._command('off')
+
+    def send(self, name):
+        self._command('send', name)
+
+
+class AirconGroup(object):
+    # sends commands to many aircons at once through a bounded pool of threads, so switching N of them takes about as
+    # long as the slowest rather than all of them in turn; every command has to finish within deadline seconds, and
+    # the outcome is collected per aircon rather than the first failure being raised
+    #
+    # an aircon that returns a Future (i.e. a CommandQueue) counts as finished when its Future does
+    def __init__(self, aircons, max_workers=8, deadline=30):
+        # name -> aircon
+        self._aircons = dict(aircons)
+        self._deadline = deadline
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug(
+            '__init__(); aircons=%s, max_workers=%s, deadline=%s',
+            sorted(self._aircons), max_workers, deadline
+        )
+
+    @staticmethod
+    def _call(aircon, command, end):
+        result = getattr(aircon, command)()
+
+        if isinstance(result, Future):
+            result.result(timeout=max(end - time.monotonic(), 0))
+
+    def command(self, commands, deadline=None):
+        # commands is name -> 'on' or 'off'; returns name -> None if it worked, otherwise the error (a TimeoutError if
+        # it hadn't finished by the deadline)
+        deadline = deadline if deadline is not None else self._deadline
+        end = time.monotonic() + deadline
+
+        self._logger.debug('command(); commands=%s, deadline=%s', commands, deadline)
+
+        with span('aircon.group', aircons=len(commands)):
+            futures = {
+                self._executor.submit(self._call, self._aircons[name], command, end): name
+                for name, command in commands.items()
+            }
+
+            done, not_done = wait(futures, timeout=deadline)
+
+        results = {}
+
+        for future in done:
+            results[futures[future]] = future.exception()
+
+        for future in not_done:
+            # stops it if it hasn't started; one that has is left to finish on its own
+            future.cancel()
+            results[futures[future]] = TimeoutError('no result within {0}s'.format(deadline))
+
+        failed = sorted(name for name, error in results.items() if error is not None)
+        if len(failed) > 0:
+            self._logger.warning('command(); failed=%s of %s; errors=%s', failed, len(results), {
+                name: results[name] for name in failed
+            })
+
+        return results
+
+    def on(self, deadline=None):
+        return self.command({name: 'on' for name in self._aircons}, deadline)
+
+    def off(self, deadline=None):
+        return self.command({name: 'off' for name in self._aircons}, deadline)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
 
 
 _FUJITSU_ON = '1:1,0,37000,1,1,122,62,15,16,15,16,15,46,15,16,15,46,15,16,15,16,15,16,15,46,15,46,15,16,15,16,15,16,15,46,15,46,15,16,15,16,14,16,15,16,15,16,14,16,15,16,15,16,14,16,15,16,15,16,15,16,15,16,15,46,15,16,15,16,15,16,15,16,15,16,14,16,15,16,15,46,15,16,15,16,15,16,15,16,15,16,15,46,15,46,15,46,15,46,15,46,15,46,15,16,15,16,15,16,14,47,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,46,15,46,15,16,15,16,15,47,14,16,15,16,15,16,15,16,15,46,15,16,15,16,15,46,15,16,15,16,15,16,15,16,15,16,14,16,15,16,15,46,15,46,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,14,16,15,16,15,16,14,16,15,16,15,16,14,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,16,15,46,15,46,15,16,15,46,15,16,15,46,15,16,15,46,15,3692'
@@ -133,26 +473,44 @@ _FUJITSU_OFF = '1:1,0,37000,1,1,122,62,15,16,15,16,15,46,15,16,15,46,15,16,14,16
 
 
 class FujitsuAircon(Aircon):
-    def __init__(self, *args, **kwargs):
-        super(FujitsuAircon, self).__init__(*args, **kwargs)
+    def __init__(self, ip, retries, state=None):
+        super(FujitsuAircon, self).__init__(ip=ip, retries=retries)
 
         self._on_message = _FUJITSU_ON
         self._off_message = _FUJITSU_OFF
 
+        # given a FujitsuState (see fujitsu.py), on sends that (e.g. a setpoint) in place of the recording
+        self._on_frame = None
+        self._off_frame = None
+        if state is not None:
+            self._on_frame = encode(state._replace(power=True))
+            self._off_frame = encode(state._replace(power=False))
+
+    def _message(self, name):
+        if self._on_frame is None:
+            return super(FujitsuAircon, self)._message(name)
+
+        return render(self._on_frame if name == 'on' else self._off_frame)
+
 
 class AutoDiscoveringFujitsuAircon(AutoDiscoveringAircon):
-    def __init__(self, uuid, retries):
+    # a pool passed in makes its own aircons, so should be given the same state
+    def __init__(self, uuid, retries, directory=None, state=None, pool=None):
         super(AutoDiscoveringFujitsuAircon, self).__init__(
             uuid=uuid,
             retries=retries,
-            aircon_class=FujitsuAircon,
+            aircon_class=partial(FujitsuAircon, state=state),
+            directory=directory,
+            pool=pool,
         )
 
 
 class StaticFujitsuAircon(StaticAircon):
-    def __init__(self, ip, retries):
+    # a pool passed in makes its own aircons, so should be given the same state
+    def __init__(self, ip, retries, pool=None, state=None):
         super(StaticFujitsuAircon, self).__init__(
             ip=ip,
             retries=retries,
-            aircon_class=FujitsuAircon,
+            aircon_class=partial(FujitsuAircon, state=state),
+            pool=pool,
         )
@@ -1,10 +1,17 @@
 import datetime
+import socket
+import threading
 import unittest
+from concurrent.futures import Future, TimeoutError
 
-from hamcrest import assert_that, equal_to
+from hamcrest import assert_that, equal_to, calling, raises
 from mock import patch, call, MagicMock
 
-from away_from_home.aircon import Aircon, FujitsuAircon, _FUJITSU_ON, _FUJITSU_OFF, AutoDiscoveringAircon, StaticAircon
+from away_from_home.aircon import Aircon, FujitsuAircon, _FUJITSU_ON, _FUJITSU_OFF, AutoDiscoveringAircon, \
+    StaticAircon, AirconPool, ZmoteDirectory, AirconGroup
+from away_from_home.fujitsu import FujitsuState, decode
+from away_from_home.store import Store
+from away_from_home.testing import FakeClock
 
 _TEST_TIMESTAMP = datetime.datetime(year=1991, month=2, day=6)
 
@@ -68,6 +75,35 @@ class AirconTest(unittest.TestCase):
             ])
         )
 
+    def test_send(self):
+        self._subject.send('on')
+        self._subject.send('off')
+
+        assert_that(
+            self._subject._connector.mock_calls,
+            equal_to([
+                call.send('1:1,0,37000,1,1,1'),
+                call.send('1:1,0,37000,1,1,0'),
+            ])
+        )
+
+    def test_healthy(self):
+        ours, theirs = socket.socketpair()
+        self.addCleanup(ours.close)
+        self._subject._transport._sock = ours
+
+        assert_that(
+            self._subject.healthy(),
+            equal_to(True)
+        )
+
+        theirs.close()
+
+        assert_that(
+            self._subject.healthy(),
+            equal_to(False)
+        )
+
     def test_disconnect(self):
         self._subject.disconnect()
 
@@ -124,22 +160,85 @@ class AutoDiscoveringAirconTest(unittest.TestCase):
             equal_to(self._subject._aircon_class())
         )
 
+    @patch('away_from_home.aircon.active_discover_zmotes')
+    def test_acquire_aircon_cached(self, active_discover_zmotes):
+        active_discover_zmotes.return_value = {_UUID: {'IP': '192.168.1.12'}}
+
+        self._subject._acquire_aircon()
+        self._subject._acquire_aircon()
+
+        assert_that(
+            active_discover_zmotes.mock_calls,
+            equal_to([
+                call(uuid_to_look_for=_UUID)
+            ])
+        )
+
+    @patch('away_from_home.aircon.active_discover_zmotes')
+    def test_acquire_aircon_connect_failed(self, active_discover_zmotes):
+        active_discover_zmotes.side_effect = [{_UUID: {'IP': '192.168.1.12'}}, {_UUID: {'IP': '192.168.1.13'}}]
+        self._subject._aircon_class.return_value.connect.side_effect = [IOError('no route to host'), None]
+
+        assert_that(
+            calling(self._subject._acquire_aircon),
+            raises(IOError)
+        )
+
+        self._subject._acquire_aircon()
+
+        assert_that(
+            self._subject._aircon_class.mock_calls[-2],
+            equal_to(call(ip='192.168.1.13', retries=2))
+        )
+
     def test_release_aircon(self):
         mock_aircon = MagicMock()
+        self._subject._pool = MagicMock()
+        self._subject._ip = '192.168.1.12'
         self._subject._aircon = mock_aircon
 
         self._subject._release_aircon()
 
         assert_that(
-            mock_aircon.mock_calls,
+            (self._subject._pool.mock_calls, mock_aircon.mock_calls, self._subject._aircon),
+            equal_to(([call.release('192.168.1.12', mock_aircon, failed=False)], [], None))
+        )
+
+    @patch('away_from_home.aircon.active_discover_zmotes')
+    def test_connection_kept_between_commands(self, active_discover_zmotes):
+        active_discover_zmotes.return_value = {_UUID: {'IP': '192.168.1.12'}}
+        self._subject._aircon_class.return_value.healthy.return_value = True
+
+        self._subject.send('on')
+        self._subject.send('on')
+
+        assert_that(
+            self._subject._aircon_class.mock_calls,
             equal_to([
-                call.disconnect()
+                call(ip='192.168.1.12', retries=2),
+                call().connect(),
+                call().send('on'),
+                call().healthy(),
+                call().send('on'),
             ])
         )
 
+    def test_send_failed(self):
+        self._subject._acquire_aircon = MagicMock()
+        self._subject._aircon = MagicMock()
+        self._subject._aircon.send.side_effect = IOError('broken pipe')
+        self._subject._release_aircon = MagicMock()
+
         assert_that(
-            self._subject._aircon,
-            equal_to(None)
+            calling(self._subject.send).with_args('on'),
+            raises(IOError)
+        )
+
+        assert_that(
+            self._subject._release_aircon.mock_calls,
+            equal_to([
+                call(failed=True)
+            ])
         )
 
     def test_on(self):
@@ -208,40 +307,74 @@ class StaticAirconTest(unittest.TestCase):
         )
 
     def test_acquire_aircon(self):
-        assert_that(
-            self._subject._acquire_aircon(),
-            equal_to(None)
-        )
+        self._subject._pool = MagicMock()
 
-        assert_that(
-            self._subject._aircon_class.mock_calls,
-            equal_to([
-                call(ip=_IP, retries=2),
-                call().connect(),
-            ])
-        )
+        self._subject._acquire_aircon()
 
         assert_that(
-            self._subject._aircon,
-            equal_to(self._subject._aircon_class())
+            (self._subject._pool.mock_calls, self._subject._aircon),
+            equal_to(([call.acquire(_IP)], self._subject._pool.acquire.return_value))
         )
 
     def test_release_aircon(self):
         mock_aircon = MagicMock()
+        self._subject._pool = MagicMock()
         self._subject._aircon = mock_aircon
 
         self._subject._release_aircon()
 
         assert_that(
-            mock_aircon.mock_calls,
+            (self._subject._pool.mock_calls, mock_aircon.mock_calls, self._subject._aircon),
+            equal_to(([call.release(_IP, mock_aircon, failed=False)], [], None))
+        )
+
+    def test_on_failed(self):
+        self._subject._acquire_aircon = MagicMock()
+        self._subject._aircon = MagicMock()
+        self._subject._aircon.on.side_effect = IOError('broken pipe')
+        self._subject._release_aircon = MagicMock()
+
+        assert_that(
+            calling(self._subject.on),
+            raises(IOError)
+        )
+
+        assert_that(
+            self._subject._release_aircon.mock_calls,
             equal_to([
-                call.disconnect()
+                call(failed=True)
             ])
         )
 
+    def test_send(self):
+        self._subject._aircon_class.return_value.healthy.return_value = True
+
+        self._subject.send('on')
+
         assert_that(
-            self._subject._aircon,
-            equal_to(None)
+            self._subject._aircon_class.mock_calls,
+            equal_to([
+                call(ip=_IP, retries=2),
+                call().connect(),
+                call().send('on'),
+            ])
+        )
+
+    def test_connection_kept_between_commands(self):
+        self._subject._aircon_class.return_value.healthy.return_value = True
+
+        self._subject.on()
+        self._subject.off()
+
+        assert_that(
+            self._subject._aircon_class.mock_calls,
+            equal_to([
+                call(ip=_IP, retries=2),
+                call().connect(),
+                call().on(),
+                call().healthy(),
+                call().off(),
+            ])
         )
 
     def test_on(self):
@@ -301,6 +434,307 @@ class StaticAirconTest(unittest.TestCase):
         )
 
 
+class AirconPoolTest(unittest.TestCase):
+    def setUp(self):
+        self._clock = FakeClock()
+        self._aircon_class = MagicMock(side_effect=lambda **kwargs: MagicMock(**{'healthy.return_value': True}))
+        self._subject = AirconPool(
+            aircon_class=self._aircon_class,
+            retries=2,
+            idle_timeout=60,
+            clock=self._clock,
+        )
+
+    def test_reuses(self):
+        aircon = self._subject.acquire(_IP)
+        self._subject.release(_IP, aircon)
+
+        assert_that(
+            (self._subject.acquire(_IP), len(self._aircon_class.mock_calls)),
+            equal_to((aircon, 1))
+        )
+
+    def test_separate_per_ip(self):
+        aircon = self._subject.acquire(_IP)
+        self._subject.release(_IP, aircon)
+
+        assert_that(
+            self._subject.acquire('192.168.137.91') is aircon,
+            equal_to(False)
+        )
+
+    def test_idle_timeout(self):
+        aircon = self._subject.acquire(_IP)
+        self._subject.release(_IP, aircon)
+        self._clock.now += 61
+
+        assert_that(
+            self._subject.acquire(_IP) is aircon,
+            equal_to(False)
+        )
+
+        assert_that(
+            aircon.disconnect.mock_calls,
+            equal_to([call()])
+        )
+
+    def test_unhealthy_replaced(self):
+        aircon = self._subject.acquire(_IP)
+        self._subject.release(_IP, aircon)
+        aircon.healthy.return_value = False
+
+        assert_that(
+            (self._subject.acquire(_IP) is aircon, aircon.disconnect.mock_calls),
+            equal_to((False, [call()]))
+        )
+
+    def test_failed_not_pooled(self):
+        aircon = self._subject.acquire(_IP)
+        self._subject.release(_IP, aircon, failed=True)
+
+        assert_that(
+            (self._subject.acquire(_IP) is aircon, aircon.disconnect.mock_calls),
+            equal_to((False, [call()]))
+        )
+
+    def test_expired_by_timer_wheel(self):
+        self._subject._timer_wheel = MagicMock()
+        aircon = self._subject.acquire(_IP)
+        self._subject.release(_IP, aircon)
+
+        _, (delay, callback, ip, expired, released), _ = self._subject._timer_wheel.schedule.mock_calls[0]
+        callback(ip, expired, released)
+
+        assert_that(
+            (delay, aircon.disconnect.mock_calls, self._subject._idle),
+            equal_to((60, [call()], {_IP: []}))
+        )
+
+    def test_close(self):
+        aircon = self._subject.acquire(_IP)
+        self._subject.release(_IP, aircon)
+
+        self._subject.close()
+
+        assert_that(
+            (aircon.disconnect.mock_calls, self._subject._idle),
+            equal_to(([call()], {}))
+        )
+
+
+@patch('away_from_home.aircon.time.sleep')
+@patch('away_from_home.aircon.active_discover_zmotes')
+class ZmoteDirectoryTest(unittest.TestCase):
+    def setUp(self):
+        self._clock = FakeClock()
+        self._store = Store()
+        self._subject = ZmoteDirectory(
+            ttl=3600,
+            store=self._store,
+            clock=self._clock,
+        )
+
+    def test_get(self, active_discover_zmotes, sleep):
+        active_discover_zmotes.side_effect = [{}, {_UUID: {'IP': _IP}}]
+
+        assert_that(
+            (self._subject.get(_UUID), self._subject.get(_UUID), len(active_discover_zmotes.mock_calls)),
+            equal_to((_IP, _IP, 2))
+        )
+
+        assert_that(
+            self._store.get('zmote.' + _UUID),
+            equal_to([_IP, 1000.0])
+        )
+
+    def test_get_not_found(self, active_discover_zmotes, sleep):
+        active_discover_zmotes.return_value = {}
+
+        assert_that(
+            calling(self._subject.get).with_args(_UUID),
+            raises(ValueError)
+        )
+
+        assert_that(
+            len(active_discover_zmotes.mock_calls),
+            equal_to(5)
+        )
+
+    def test_get_from_store(self, active_discover_zmotes, sleep):
+        self._store.set('zmote.' + _UUID, [_IP, 900.0])
+
+        assert_that(
+            (self._subject.get(_UUID), active_discover_zmotes.mock_calls),
+            equal_to((_IP, []))
+        )
+
+    def test_invalidate(self, active_discover_zmotes, sleep):
+        self._store.set('zmote.' + _UUID, [_IP, 900.0])
+        active_discover_zmotes.return_value = {_UUID: {'IP': '192.168.137.91'}}
+
+        self._subject.invalidate(_UUID)
+
+        assert_that(
+            self._subject.get(_UUID),
+            equal_to('192.168.137.91')
+        )
+
+    def test_refresh(self, active_discover_zmotes, sleep):
+        self._subject._refresh(test_mode=True)
+
+        assert_that(
+            active_discover_zmotes.mock_calls,
+            equal_to([])
+        )
+
+        self._store.set('zmote.' + _UUID, [_IP, 1000.0])
+        self._subject.get(_UUID)
+        self._clock.now += 2880
+        active_discover_zmotes.return_value = {_UUID: {'IP': '192.168.137.91'}}
+
+        self._subject._refresh(test_mode=True)
+
+        assert_that(
+            (active_discover_zmotes.mock_calls, self._store.get('zmote.' + _UUID), self._subject.get(_UUID)),
+            equal_to(([call(unique_zmote_count=1)], ['192.168.137.91', 3880.0], '192.168.137.91'))
+        )
+
+    def test_refresh_keeps_unanswered(self, active_discover_zmotes, sleep):
+        self._store.set('zmote.' + _UUID, [_IP, 1000.0])
+        self._subject.get(_UUID)
+        self._clock.now += 2880
+        active_discover_zmotes.return_value = {}
+
+        self._subject._refresh(test_mode=True)
+        self._clock.now += 2880
+
+        assert_that(
+            (self._subject.get(_UUID), len(active_discover_zmotes.mock_calls)),
+            equal_to((_IP, 1))
+        )
+
+    def test_expires_without_refresh(self, active_discover_zmotes, sleep):
+        active_discover_zmotes.return_value = {_UUID: {'IP': _IP}}
+        self._subject.get(_UUID)
+        self._store.set('zmote.' + _UUID, None)
+        self._clock.now += 3600
+
+        self._subject.get(_UUID)
+
+        assert_that(
+            len(active_discover_zmotes.mock_calls),
+            equal_to(2)
+        )
+
+    def test_get_single_flight(self, active_discover_zmotes, sleep):
+        started = threading.Event()
+        release = threading.Event()
+
+        def discover(**kwargs):
+            started.set()
+            release.wait(5)
+            return {_UUID: {'IP': _IP}}
+
+        active_discover_zmotes.side_effect = discover
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self._subject.get(_UUID))) for _ in range(0, 3)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert_that(
+            (results, len(active_discover_zmotes.mock_calls)),
+            equal_to(([_IP] * 3, 1))
+        )
+
+
+class AirconGroupTest(unittest.TestCase):
+    def setUp(self):
+        self._aircons = {'a': MagicMock(), 'b': MagicMock(), 'c': MagicMock()}
+        self._subject = AirconGroup(
+            aircons=self._aircons,
+            max_workers=3,
+            deadline=5,
+        )
+        self.addCleanup(self._subject.close)
+
+    def test_on(self):
+        assert_that(
+            self._subject.on(),
+            equal_to({'a': None, 'b': None, 'c': None})
+        )
+
+        assert_that(
+            [self._aircons[x].mock_calls for x in 'abc'],
+            equal_to([[call.on()]] * 3)
+        )
+
+    def test_command(self):
+        self._subject.command({'a': 'on', 'c': 'off'})
+
+        assert_that(
+            [self._aircons[x].mock_calls for x in 'abc'],
+            equal_to([[call.on()], [], [call.off()]])
+        )
+
+    def test_concurrent(self):
+        # each waits for the others, so this only finishes if all three are sent at once
+        barrier = threading.Barrier(3, timeout=2)
+        for aircon in self._aircons.values():
+            aircon.off.side_effect = lambda: barrier.wait() and None
+
+        assert_that(
+            self._subject.off(),
+            equal_to({'a': None, 'b': None, 'c': None})
+        )
+
+    def test_failures_collected(self):
+        error = IOError('zmote unreachable')
+        self._aircons['b'].on.side_effect = error
+
+        assert_that(
+            self._subject.on(),
+            equal_to({'a': None, 'b': error, 'c': None})
+        )
+
+    def test_deadline(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self._aircons['c'].on.side_effect = lambda: release.wait(5) and None
+
+        results = self._subject.on(deadline=0.1)
+
+        assert_that(
+            (results['a'], results['b'], type(results['c'])),
+            equal_to((None, None, TimeoutError))
+        )
+
+    def test_waits_for_futures(self):
+        future = Future()
+        self._aircons['a'].on.return_value = future
+
+        results = self._subject.on(deadline=0.1)
+
+        assert_that(
+            type(results['a']),
+            equal_to(TimeoutError)
+        )
+
+        future = Future()
+        future.set_exception(IOError('connection refused'))
+        self._aircons['a'].on.return_value = future
+
+        assert_that(
+            type(self._subject.on()['a']),
+            equal_to(IOError)
+        )
+
+
 class FujitsuAirconTest(unittest.TestCase):
     @patch('away_from_home.aircon.TCPTransport')
     @patch('away_from_home.aircon.Connector')
@@ -345,3 +779,22 @@ class FujitsuAirconTest(unittest.TestCase):
                 call.send(_FUJITSU_OFF),
             ])
         )
+
+    @patch('away_from_home.aircon.TCPTransport')
+    @patch('away_from_home.aircon.Connector')
+    def test_state(self, connector, transport):
+        subject = FujitsuAircon(
+            ip=_IP,
+            retries=1,
+            state=FujitsuState(power=True, mode='cool', setpoint=24, fan='auto', swing='off'),
+        )
+
+        subject.on(sleep=0)
+        subject.off(sleep=0)
+
+        (_, (on,), _), (_, (off,), _) = subject._connector.send.mock_calls
+
+        assert_that(
+            (decode(on).hex(), decode(off)),
+            equal_to(('1463001010fc08308101000000004e', decode(_FUJITSU_OFF)))
+        )
@@ -0,0 +1,66 @@
+import numpy as np
+
+# comfort models over whole series at once; every function accepts scalars or array-likes (broadcast together) and
+# returns a float64 ndarray, so a season of hourly samples is a handful of vectorised operations rather than a loop
+
+
+def _as_arrays(*values):
+    return [np.asarray(x, dtype=np.float64) for x in values]
+
+
+def vapour_pressure(temperature, humidity):
+    temperature, humidity = _as_arrays(temperature, humidity)
+
+    # in hPa
+    return humidity / 100 * 6.105 * np.exp((17.27 * temperature) / (237.7 + temperature))
+
+
+def apparent_temperature(temperature, humidity, wind_speed):
+    # Australian Bureau of Meteorology apparent temperature (Steadman, without the radiation term)
+    temperature, humidity, wind_speed = _as_arrays(temperature, humidity, wind_speed)
+
+    return temperature + (0.33 * vapour_pressure(temperature, humidity)) - (0.70 * wind_speed) - 4.00
+
+
+def get_apparent_temperature(temperature, humidity, wind_speed):
+    return round(float(apparent_temperature(temperature, humidity, wind_speed)), 2)
+
+
+def heat_index(temperature, humidity):
+    # US National Weather Service heat index (Rothfusz regression with its low / high humidity adjustments); the
+    # regression is defined in fahrenheit so we convert in and out
+    temperature, humidity = _as_arrays(temperature, humidity)
+
+    t = temperature * 9 / 5 + 32
+    rh = humidity
+
+    simple = 0.5 * (t + 61.0 + ((t - 68.0) * 1.2) + (rh * 0.094))
+
+    regression = (
+        -42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh - 0.00683783 * t * t
+        - 0.05481717 * rh * rh + 0.00122874 * t * t * rh + 0.00085282 * t * rh * rh - 0.00000199 * t * t * rh * rh
+    )
+
+    dry = (rh < 13) & (t > 80) & (t < 112)
+    regression = np.where(
+        dry,
+        regression - ((13 - rh) / 4) * np.sqrt(np.clip(17 - np.abs(t - 95), 0, None) / 17),
+        regression
+    )
+
+    humid = (rh > 85) & (t > 80) & (t < 87)
+    regression = np.where(humid, regression + ((rh - 85) / 10) * ((87 - t) / 5), regression)
+
+    # the regression only applies once the simple estimate (averaged with the temperature) reaches 80F
+    hi = np.where((simple + t) / 2 >= 80, regression, simple)
+
+    return (hi - 32) * 5 / 9
+
+
+def humidex(temperature, humidity):
+    # Environment Canada humidex, using vapour pressure from temperature and relative humidity
+    temperature, humidity = _as_arrays(temperature, humidity)
+
+    e = humidity / 100 * 6.112 * np.power(10, 7.5 * temperature / (237.7 + temperature))
+
+    return temperature + 5.0 / 9.0 * (e - 10.0)
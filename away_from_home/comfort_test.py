@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+from hamcrest import assert_that, equal_to, close_to
+
+from away_from_home.comfort import vapour_pressure, apparent_temperature, heat_index, humidex
+
+
+class ComfortTest(unittest.TestCase):
+    def test_vapour_pressure(self):
+        assert_that(
+            float(vapour_pressure(25.0, 100.0)),
+            close_to(31.58, 0.01)
+        )
+
+    def test_apparent_temperature_scalar(self):
+        assert_that(
+            float(apparent_temperature(32.0, 25.6, 0.0)),
+            close_to(32.0, 0.01)
+        )
+
+    def test_apparent_temperature_series(self):
+        temperature = np.array([32.0, 32.0, 20.0])
+        humidity = np.array([25.6, 25.0, 80.0])
+        wind_speed = np.array([0.0, 5.0, 2.0])
+
+        result = apparent_temperature(temperature, humidity, wind_speed)
+
+        assert_that(
+            result.shape,
+            equal_to((3,))
+        )
+
+        for i in range(0, 3):
+            assert_that(
+                result[i],
+                close_to(float(apparent_temperature(temperature[i], humidity[i], wind_speed[i])), 1e-9)
+            )
+
+    def test_apparent_temperature_broadcasts(self):
+        assert_that(
+            apparent_temperature([30.0, 31.0], 50.0, 0.0).shape,
+            equal_to((2,))
+        )
+
+    def test_heat_index_below_regression(self):
+        # 20C / 50% is well below where the regression kicks in, so the simple estimate applies
+        assert_that(
+            float(heat_index(20.0, 50.0)),
+            close_to(19.4, 0.1)
+        )
+
+    def test_heat_index(self):
+        # NWS table: 96F at 65% humidity is 121F
+        assert_that(
+            float(heat_index((96.0 - 32) * 5 / 9, 65.0)),
+            close_to((121.0 - 32) * 5 / 9, 0.5)
+        )
+
+    def test_heat_index_dry_adjustment(self):
+        assert_that(
+            float(heat_index(40.0, 10.0)) < float(heat_index(40.0, 13.0)),
+            equal_to(True)
+        )
+
+    def test_humidex(self):
+        # Environment Canada: 30C at 50% humidity is a humidex of about 36
+        assert_that(
+            float(humidex(30.0, 50.0)),
+            close_to(36.2, 0.2)
+        )
@@ -0,0 +1,159 @@
+import queue
+from concurrent.futures import Future
+from logging import getLogger
+from threading import Thread, RLock
+
+from away_from_home.tracing import span
+
+
+class _Command(object):
+    __slots__ = ('name', 'future', 'attempts', 'sent', 'error', 'timer', 'resolved')
+
+    def __init__(self, name):
+        self.name = name
+        self.future = Future()
+        self.attempts = 0
+        self.sent = 0
+        self.error = None
+        self.timer = None
+        self.resolved = False
+
+
+class CommandQueue(object):
+    # a per-device queue of IR commands with its own worker thread; on() / off() return a Future straight away and the
+    # worker makes the first of retries transmissions, with each of the rest scheduled on the TimerWheel interval
+    # seconds after the last rather than slept for, so neither the caller nor the worker waits between sends
+    #
+    # a Future's result is how many times its command was sent; it only fails (with the last error) if every attempt
+    # did; a newer command supersedes an older one's outstanding retransmissions (no sense finishing "on" after "off"
+    # has been asked for), which resolves the older one's Future with what it sent so far
+    def __init__(self, aircon, timer_wheel, retries, interval=1, tracer=None):
+        self._aircon = aircon
+        self._timer_wheel = timer_wheel
+        self._retries = retries
+        self._interval = interval
+
+        # sends happen on the worker, outside the trace of whatever asked for them, so each is traced on its own (with
+        # the aircon's connect / send / discovery spans in it) if given a Tracer
+        self._tracer = tracer
+
+        self._queue = queue.Queue()
+        self._current = None
+        self._lock = RLock()
+
+        self._worker_thread = Thread(
+            target=self._work
+        )
+        self._worker_thread.daemon = True
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug(
+            '__init__(); aircon=%s, timer_wheel=%s, retries=%s, interval=%s, tracer=%s',
+            aircon, timer_wheel, retries, interval, tracer
+        )
+
+    def _trace(self, name, **attributes):
+        return self._tracer.trace(name, **attributes) if self._tracer is not None else span(name, **attributes)
+
+    def _resolve(self, command):
+        # both the submitting thread (superseding) and the worker (finishing) get here, so only the first claims it
+        with self._lock:
+            if command.resolved:
+                return
+
+            command.resolved = True
+            sent, error = command.sent, command.error
+
+        # outside the lock, as done callbacks may call back into us
+        if sent == 0 and error is not None:
+            command.future.set_exception(error)
+        else:
+            command.future.set_result(sent)
+
+    def _submit(self, name):
+        self._logger.debug('_submit(); name=%r', name)
+
+        command = _Command(name)
+
+        with self._lock:
+            previous = self._current
+            self._current = command
+
+            if previous is not None:
+                self._timer_wheel.cancel(previous.timer)
+
+        # outside the lock, as done callbacks may call back into us
+        if previous is not None:
+            self._resolve(previous)
+
+        self._queue.put(command)
+
+        return command.future
+
+    def _send(self, command):
+        with self._lock:
+            if command is not self._current:
+                return
+
+        command.attempts += 1
+
+        try:
+            with self._trace('commands.send', command=command.name, attempt=command.attempts):
+                self._aircon.send(command.name)
+
+            command.sent += 1
+        except Exception as e:
+            self._logger.warning('_send(); attempt %s of %r failed; error=%r', command.attempts, command.name, e)
+            command.error = e
+
+        with self._lock:
+            finished = command is not self._current or command.attempts >= self._retries
+
+            if not finished:
+                command.timer = self._timer_wheel.schedule(self._interval, self._queue.put, command)
+            elif command is self._current:
+                self._current = None
+
+        if finished:
+            self._resolve(command)
+
+    def _work(self, test_mode=False):
+        while True:
+            try:
+                command = self._queue.get(block=not test_mode)
+            except queue.Empty:
+                return
+
+            if command is None:
+                return
+
+            # so one bad command can't stop the queue
+            try:
+                self._send(command)
+            except Exception as e:
+                self._logger.error('_work(); failed to send %r; error=%r', command.name, e)
+                command.error = e
+                self._resolve(command)
+
+    def on(self):
+        return self._submit('on')
+
+    def off(self):
+        return self._submit('off')
+
+    def start(self):
+        self._worker_thread.start()
+
+    def stop(self):
+        with self._lock:
+            current = self._current
+            self._current = None
+
+            if current is not None:
+                self._timer_wheel.cancel(current.timer)
+
+        if current is not None:
+            self._resolve(current)
+
+        self._queue.put(None)
+        self._worker_thread.join()
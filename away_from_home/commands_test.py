@@ -0,0 +1,187 @@
+import unittest
+
+from hamcrest import assert_that, equal_to, calling, raises
+from mock import MagicMock, call
+
+from away_from_home.commands import CommandQueue
+from away_from_home.expirer import TimerWheel
+from away_from_home.testing import FakeClock
+from away_from_home.tracing import Tracer, span
+
+
+class CommandQueueTest(unittest.TestCase):
+    def setUp(self):
+        self._clock = FakeClock()
+        self._timer_wheel = TimerWheel(
+            tick=0.1,
+            slots=16,
+            clock=self._clock,
+        )
+
+        self._aircon = MagicMock()
+
+        self._subject = CommandQueue(
+            aircon=self._aircon,
+            timer_wheel=self._timer_wheel,
+            retries=3,
+            interval=1,
+        )
+
+    def _advance(self, seconds):
+        self._clock.now += seconds
+        self._timer_wheel._run(test_mode=True)
+        self._subject._work(test_mode=True)
+
+    def test_returns_before_sending(self):
+        future = self._subject.on()
+
+        assert_that(
+            (future.done(), self._aircon.mock_calls),
+            equal_to((False, []))
+        )
+
+    def test_retransmits_on_timer(self):
+        future = self._subject.on()
+
+        self._subject._work(test_mode=True)
+
+        assert_that(
+            (self._aircon.mock_calls, len(self._timer_wheel)),
+            equal_to(([call.send('on')], 1))
+        )
+
+        self._advance(0.5)
+
+        assert_that(
+            len(self._aircon.mock_calls),
+            equal_to(1)
+        )
+
+        self._advance(0.6)
+        self._advance(1.1)
+
+        assert_that(
+            (self._aircon.mock_calls, future.result(0), len(self._timer_wheel)),
+            equal_to(([call.send('on')] * 3, 3, 0))
+        )
+
+    def test_superseded(self):
+        on = self._subject.on()
+        self._subject._work(test_mode=True)
+
+        off = self._subject.off()
+
+        assert_that(
+            on.result(0),
+            equal_to(1)
+        )
+
+        self._subject._work(test_mode=True)
+        self._advance(1.1)
+        self._advance(1.1)
+
+        assert_that(
+            (self._aircon.mock_calls, off.result(0)),
+            equal_to(([call.send('on')] + [call.send('off')] * 3, 3))
+        )
+
+    def test_superseded_before_sending(self):
+        on = self._subject.on()
+        off = self._subject.off()
+
+        self._subject._work(test_mode=True)
+
+        assert_that(
+            (on.result(0), self._aircon.mock_calls),
+            equal_to((0, [call.send('off')]))
+        )
+
+    def test_some_attempts_fail(self):
+        self._aircon.send.side_effect = [IOError('connection reset'), None, None]
+
+        future = self._subject.off()
+        self._subject._work(test_mode=True)
+        self._advance(1.1)
+        self._advance(1.1)
+
+        assert_that(
+            future.result(0),
+            equal_to(2)
+        )
+
+    def test_all_attempts_fail(self):
+        self._aircon.send.side_effect = IOError('connection refused')
+
+        future = self._subject.off()
+        self._subject._work(test_mode=True)
+        self._advance(1.1)
+        self._advance(1.1)
+
+        assert_that(
+            calling(future.result).with_args(0),
+            raises(IOError)
+        )
+
+    def test_resolved_once(self):
+        future = self._subject.on()
+        command = self._subject._current
+
+        self._subject._resolve(command)
+        command.sent = 1
+        self._subject._resolve(command)
+
+        assert_that(
+            future.result(0),
+            equal_to(0)
+        )
+
+    def test_survives_failed_send(self):
+        self._subject._timer_wheel = MagicMock(**{'schedule.side_effect': RuntimeError('wheel stopped')})
+
+        on = self._subject.on()
+        self._subject._work(test_mode=True)
+
+        self._subject._timer_wheel = self._timer_wheel
+
+        off = self._subject.off()
+        self._subject._work(test_mode=True)
+
+        assert_that(
+            (on.result(0), off.done(), self._aircon.mock_calls),
+            equal_to((1, False, [call.send('on'), call.send('off')]))
+        )
+
+    def test_traces_sends(self):
+        def send(name):
+            with span('aircon.send'):
+                pass
+
+        self._aircon.send.side_effect = send
+        self._subject._tracer = Tracer()
+
+        self._subject.on()
+        self._subject._work(test_mode=True)
+        self._advance(1.1)
+
+        traces = self._subject._tracer.traces()
+
+        assert_that(
+            [(x['name'], x['command'], x['attempt'], [y['name'] for y in x['spans']]) for x in traces],
+            equal_to([
+                ('commands.send', 'on', 1, ['aircon.send']),
+                ('commands.send', 'on', 2, ['aircon.send']),
+            ])
+        )
+
+    def test_start_stop(self):
+        self._subject.start()
+
+        future = self._subject.on()
+        future.add_done_callback(lambda x: None)
+
+        self._subject.stop()
+
+        assert_that(
+            (future.done(), self._subject._worker_thread.is_alive()),
+            equal_to((True, False))
+        )
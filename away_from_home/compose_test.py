@@ -1,15 +1,32 @@
 import datetime
 import logging
 import unittest
+from concurrent.futures import Future
 
 from hamcrest import assert_that, equal_to
 from mock import MagicMock, call
 
 from away_from_home.composer import Composer
+from away_from_home.policy import compile_policy
+from away_from_home.store import Store
+from away_from_home.tracing import Tracer, span
+from away_from_home.weather import WeatherSnapshot
 
 _TEST_TIMESTAMP = datetime.datetime(year=1991, month=2, day=6)
 
 
+def _snapshot(temperature):
+    return WeatherSnapshot(
+        timestamp=_TEST_TIMESTAMP,
+        temperature=temperature,
+        humidity=25.0,
+        wind_speed=5.0,
+        apparent_temperature=temperature,
+        sunrise=_TEST_TIMESTAMP,
+        sunset=_TEST_TIMESTAMP,
+    )
+
+
 class ComposerTest(unittest.TestCase):
     def setUp(self):
         handler = logging.StreamHandler()
@@ -32,18 +49,26 @@ class ComposerTest(unittest.TestCase):
         self._subject._aircon.mock_calls = []
 
     def test_check_above_on_threshold_true(self):
-        self._subject._weather.temperature = 30
-
         assert_that(
-            self._subject._check_above_on_threshold(),
+            self._subject._check_above_on_threshold(_snapshot(30)),
             equal_to(True)
         )
 
     def test_check_above_on_threshold_false(self):
-        self._subject._weather.temperature = 26
+        assert_that(
+            self._subject._check_above_on_threshold(_snapshot(26)),
+            equal_to(False)
+        )
 
+    def test_check_below_off_threshold_true(self):
         assert_that(
-            self._subject._check_above_on_threshold(),
+            self._subject._check_below_off_threshold(_snapshot(26)),
+            equal_to(True)
+        )
+
+    def test_check_below_off_threshold_false(self):
+        assert_that(
+            self._subject._check_below_off_threshold(_snapshot(28)),
             equal_to(False)
         )
 
@@ -94,6 +119,20 @@ class ComposerTest(unittest.TestCase):
 
         self._subject.run()
 
+        assert_that(
+            self._subject._weather.mock_calls,
+            equal_to([
+                call.snapshot()
+            ])
+        )
+
+        assert_that(
+            self._subject._check_above_on_threshold.mock_calls,
+            equal_to([
+                call(self._subject._weather.snapshot())
+            ])
+        )
+
         assert_that(
             self._subject._turn_aircon_on.mock_calls,
             equal_to([
@@ -144,3 +183,251 @@ class ComposerTest(unittest.TestCase):
             self._subject._turn_aircon_off.mock_calls,
             equal_to([])
         )
+
+    def test_run_returns_send(self):
+        future = Future()
+        self._subject._weather.snapshot.return_value = _snapshot(30)
+        self._subject._aircon.on.return_value = future
+
+        assert_that(
+            self._subject.run() is future,
+            equal_to(True)
+        )
+
+    def test_run_returns_done(self):
+        self._subject._weather.snapshot.return_value = _snapshot(28)
+
+        assert_that(
+            self._subject.run().done(),
+            equal_to(True)
+        )
+
+    def test_failed_send_forgotten(self):
+        future = Future()
+        self._subject._weather.snapshot.return_value = _snapshot(30)
+        self._subject._aircon.on.return_value = future
+
+        self._subject.run()
+        future.set_exception(IOError('connection refused'))
+
+        assert_that(
+            self._subject._last_action,
+            equal_to(None)
+        )
+
+    def test_get_temperature(self):
+        assert_that(
+            self._subject._get_temperature(_snapshot(30)),
+            equal_to(30)
+        )
+
+    def test_get_temperature_smoothed(self):
+        self._subject._smoothed = True
+        self._subject._weather.history.__len__.return_value = 3
+        self._subject._weather.history.mean = 28.5
+
+        assert_that(
+            self._subject._get_temperature(_snapshot(30)),
+            equal_to(28.5)
+        )
+
+        assert_that(
+            self._subject._check_above_on_threshold(_snapshot(30)),
+            equal_to(False)
+        )
+
+    def test_get_temperature_smoothed_no_history(self):
+        self._subject._smoothed = True
+        self._subject._weather.history = None
+
+        assert_that(
+            self._subject._get_temperature(_snapshot(30)),
+            equal_to(30)
+        )
+
+    def test_check_above_on_threshold_pre_cool(self):
+        self._subject._pre_cool_minutes = 60
+        self._subject._weather.forecast_crossing.return_value = 45.0
+
+        assert_that(
+            self._subject._check_above_on_threshold(_snapshot(26)),
+            equal_to(True)
+        )
+
+        assert_that(
+            self._subject._weather.mock_calls,
+            equal_to([
+                call.forecast_crossing(29, 60)
+            ])
+        )
+
+    def test_check_above_on_threshold_pre_cool_no_crossing(self):
+        self._subject._pre_cool_minutes = 60
+        self._subject._weather.forecast_crossing.return_value = None
+
+        assert_that(
+            self._subject._check_above_on_threshold(_snapshot(26)),
+            equal_to(False)
+        )
+
+
+class ComposerStoreTest(unittest.TestCase):
+    def setUp(self):
+        self._store = Store()
+        self._store.set('composer.last_action', 'on')
+
+        self._subject = Composer(
+            weather=MagicMock(),
+            aircon=MagicMock(),
+            on_threshold=29,
+            off_threshold=27,
+            store=self._store,
+        )
+
+    def test_follows_store(self):
+        self._subject._weather.snapshot.return_value = _snapshot(30)
+
+        self._subject.run()
+
+        assert_that(
+            self._subject._aircon.on.mock_calls,
+            equal_to([])
+        )
+
+        self._store.set('composer.last_action', 'off')
+        self._subject.run()
+
+        assert_that(
+            self._subject._aircon.on.mock_calls,
+            equal_to([
+                call()
+            ])
+        )
+
+    def test_publishes(self):
+        self._subject._weather.snapshot.return_value = _snapshot(26)
+
+        self._subject.run()
+
+        assert_that(
+            self._store.get('composer.last_action'),
+            equal_to('off')
+        )
+
+
+class ComposerEventDrivenTest(unittest.TestCase):
+    def setUp(self):
+        self._subject = Composer(
+            weather=MagicMock(),
+            aircon=MagicMock(),
+            on_threshold=29,
+            off_threshold=27,
+            event_driven=True,
+        )
+
+    def test_start_subscribes(self):
+        self._subject.start()
+        self._subject.start()
+
+        assert_that(
+            self._subject._weather.subscribe.mock_calls,
+            equal_to([
+                call(self._subject._handle_snapshot)
+            ])
+        )
+
+    def test_stop_unsubscribes(self):
+        self._subject.start()
+        self._subject.stop()
+
+        assert_that(
+            (self._subject._weather.subscribe.return_value.mock_calls, self._subject._unsubscribe),
+            equal_to(([call()], None))
+        )
+
+    def test_not_event_driven(self):
+        self._subject._event_driven = False
+
+        self._subject.start()
+
+        assert_that(
+            self._subject._weather.subscribe.mock_calls,
+            equal_to([])
+        )
+
+    def test_handle_snapshot(self):
+        self._subject._handle_snapshot(_snapshot(30))
+
+        assert_that(
+            (self._subject._aircon.on.mock_calls, self._subject._weather.snapshot.mock_calls),
+            equal_to(([call()], []))
+        )
+
+
+class ComposerPolicyTest(unittest.TestCase):
+    def setUp(self):
+        self._subject = Composer(
+            weather=MagicMock(),
+            aircon=MagicMock(),
+            on_threshold=29,
+            off_threshold=27,
+            pre_cool_minutes=60,
+            policy=compile_policy([
+                {'action': 'on', 'when': {'forecast_temperature': {'>=': 29}}},
+                {'action': 'off', 'when': {'last_action': None}},
+            ]),
+        )
+
+    def test_run(self):
+        self._subject._weather.snapshot.return_value = _snapshot(20)
+        self._subject._weather.temperature_at.return_value = 28.0
+
+        self._subject.run()
+
+        self._subject._weather.temperature_at.return_value = 30.0
+
+        self._subject.run()
+
+        assert_that(
+            (self._subject._aircon.off.mock_calls, self._subject._aircon.on.mock_calls),
+            equal_to(([call()], [call()]))
+        )
+
+        assert_that(
+            self._subject._weather.temperature_at.mock_calls,
+            equal_to([call(60), call(60)])
+        )
+
+
+class ComposerTracingTest(unittest.TestCase):
+    def setUp(self):
+        self._subject = Composer(
+            weather=MagicMock(),
+            aircon=MagicMock(),
+            on_threshold=29,
+            off_threshold=27,
+            tracer=Tracer(),
+        )
+
+    def test_run_traced(self):
+        def on():
+            with span('aircon.send'):
+                pass
+
+        self._subject._weather.snapshot.return_value = _snapshot(30)
+        self._subject._aircon.on.side_effect = on
+
+        self._subject.run()
+        self._subject.run()
+
+        assert_that(
+            [(x['name'], [(y['name'], y['depth']) for y in x['spans']]) for x in self._subject._tracer.traces()],
+            equal_to([
+                ('composer.run', [
+                    ('weather.snapshot', 0), ('composer.decide', 0), ('aircon.on', 0), ('aircon.send', 1)
+                ]),
+                ('composer.run', [
+                    ('weather.snapshot', 0), ('composer.decide', 0)
+                ]),
+            ])
+        )
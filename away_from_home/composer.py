@@ -1,65 +1,223 @@
-import inspect
+import datetime
+from concurrent.futures import Future
 from logging import getLogger
+from threading import RLock
+
+from away_from_home.tracing import span
+
+STORE_KEY_PREFIX = 'composer.'
+LAST_ACTION_KEY = STORE_KEY_PREFIX + 'last_action'
+
+
+def _done(result=None):
+    future = Future()
+    future.set_result(result)
+
+    return future
 
 
 class Composer(object):
-    def __init__(self, weather, aircon, on_threshold, off_threshold):
+    def __init__(self, weather, aircon, on_threshold, off_threshold, smoothed=False, pre_cool_minutes=None,
+                 store=None, event_driven=False, policy=None, clock=datetime.datetime.now, tracer=None):
         self._weather = weather
         self._aircon = aircon
         self._on_threshold = on_threshold
         self._off_threshold = off_threshold
 
+        # threshold on the rolling mean of the weather's history (if it keeps one) rather than the latest sample
+        self._smoothed = smoothed
+
+        # turn on early if the weather's forecast reaches on_threshold within this many minutes
+        self._pre_cool_minutes = pre_cool_minutes
+
+        # a compiled Policy to decide with in place of the thresholds, and what it takes the time of day from
+        self._policy = policy
+        self._clock = clock
+
         self._last_action = None
 
+        # optionally publish the last action to a Store and follow it there (i.e. replicated from the active node), so
+        # a standby taking over doesn't re-send a command the aircon already has
+        self._store = store
+
+        if self._store is not None:
+            self._last_action = self._store.get(LAST_ACTION_KEY)
+            self._store.subscribe(LAST_ACTION_KEY, self._handle_stored)
+
+        # when event driven, start() has us evaluate each new observation as the weather gets it, leaving run() (on a
+        # schedule) as a safety net; evaluations are serialised, whichever thread they come from
+        self._event_driven = event_driven
+        self._unsubscribe = None
+        self._lock = RLock()
+
+        # an optional Tracer to record each run (and each event driven evaluation) as a trace of timed spans
+        self._tracer = tracer
+
         self._logger = getLogger(self.__class__.__name__)
-        self._logger.debug('{0}(); weather={1}, aircon={2}, on_threshold={3}, off_threshold={4}'.format(
-            inspect.currentframe().f_code.co_name, self._weather, self._aircon, self._on_threshold, self._off_threshold
-        ))
+        self._logger.debug(
+            '__init__(); weather=%s, aircon=%s, on_threshold=%s, off_threshold=%s, smoothed=%s, pre_cool_minutes=%s, '
+            'store=%s, event_driven=%s, policy=%s, tracer=%s',
+            self._weather, self._aircon, self._on_threshold, self._off_threshold, self._smoothed,
+            self._pre_cool_minutes, self._store, self._event_driven, self._policy, self._tracer
+        )
 
-    def _check_above_on_threshold(self):
-        temperature = self._weather.temperature
+    def _trace(self, name):
+        # without a tracer, still a span of any trace already running on this thread
+        return self._tracer.trace(name) if self._tracer is not None else span(name)
+
+    def _handle_stored(self, key, value, old_value):
+        self._last_action = value
+
+    def _set_last_action(self, action):
+        self._last_action = action
+
+        if self._store is not None:
+            self._store.set(LAST_ACTION_KEY, action)
+
+    def _get_temperature(self, snapshot):
+        if self._smoothed:
+            history = self._weather.history
+            if history is not None and len(history) > 0:
+                return history.mean
+
+        return snapshot.temperature
+
+    def _check_above_on_threshold(self, snapshot):
+        temperature = self._get_temperature(snapshot)
         above_on_threshold = temperature >= self._on_threshold
 
-        self._logger.debug('{0}(); temperature={1}, above_on_threshold={2}'.format(
-            inspect.currentframe().f_code.co_name, temperature, above_on_threshold
-        ))
+        if not above_on_threshold and self._pre_cool_minutes is not None:
+            crossing = self._weather.forecast_crossing(self._on_threshold, self._pre_cool_minutes)
+            if crossing is not None:
+                self._logger.debug('_check_above_on_threshold(); forecast crossing in %.1f minutes', crossing)
+                above_on_threshold = True
+
+        self._logger.debug(
+            '_check_above_on_threshold(); temperature=%s, above_on_threshold=%s',
+            temperature, above_on_threshold
+        )
 
         return above_on_threshold
 
-    def _check_below_off_threshold(self):
-        temperature = self._weather.temperature
+    def _check_below_off_threshold(self, snapshot):
+        temperature = self._get_temperature(snapshot)
         below_off_threshold = temperature <= self._off_threshold
 
-        self._logger.debug('{0}(); temperature={1}, below_off_threshold={2}'.format(
-            inspect.currentframe().f_code.co_name, temperature, below_off_threshold
-        ))
+        self._logger.debug(
+            '_check_below_off_threshold(); temperature=%s, below_off_threshold=%s',
+            temperature, below_off_threshold
+        )
 
         return below_off_threshold
 
+    def _handle_sent(self, action, future):
+        if future.exception() is None:
+            return
+
+        # forget it so the next evaluation tries again
+        self._logger.warning('_handle_sent(); failed to turn aircon %s; error=%r', action, future.exception())
+
+        with self._lock:
+            if self._last_action == action:
+                self._set_last_action(None)
+
+    def _sent(self, result, action):
+        # an aircon behind a CommandQueue returns a Future of the send; a plain one has already sent by the time it
+        # returns
+        if not isinstance(result, Future):
+            return _done()
+
+        result.add_done_callback(lambda x: self._handle_sent(action, x))
+
+        return result
+
     def _turn_aircon_on(self):
-        self._logger.debug('{0}()'.format(inspect.currentframe().f_code.co_name))
+        self._logger.debug('_turn_aircon_on()')
 
         if self._last_action is None or self._last_action != 'on':
-            self._aircon.on()
-            self._last_action = 'on'
+            with span('aircon.on'):
+                result = self._aircon.on()
+            self._set_last_action('on')
+
+            return self._sent(result, 'on')
+
+        return _done()
 
     def _turn_aircon_off(self):
-        self._logger.debug('{0}()'.format(inspect.currentframe().f_code.co_name))
+        self._logger.debug('_turn_aircon_off()')
 
         if self._last_action is None or self._last_action != 'off':
-            self._aircon.off()
-            self._last_action = 'off'
+            with span('aircon.off'):
+                result = self._aircon.off()
+            self._set_last_action('off')
+
+            return self._sent(result, 'off')
+
+        return _done()
+
+    def _decide_by_policy(self, snapshot):
+        forecast_temperature = None
+        if self._pre_cool_minutes is not None and 'forecast_temperature' in self._policy.fields:
+            forecast_temperature = self._weather.temperature_at(self._pre_cool_minutes)
+
+        if self._smoothed:
+            snapshot = snapshot._replace(temperature=self._get_temperature(snapshot))
+
+        action = self._policy.decide(snapshot, self._clock(), self._last_action, forecast_temperature)
+
+        self._logger.debug('_decide_by_policy(); action=%s', action)
+
+        return action
+
+    def _decide(self, snapshot):
+        if self._policy is not None:
+            return self._decide_by_policy(snapshot)
+
+        if self._check_above_on_threshold(snapshot):
+            self._logger.debug('_decide(); temperature above on threshold')
+            return 'on'
+
+        if self._check_below_off_threshold(snapshot):
+            self._logger.debug('_decide(); temperature below off threshold')
+            return 'off'
+
+        return None
+
+    def _evaluate(self, snapshot):
+        with self._lock:
+            with span('composer.decide'):
+                action = self._decide(snapshot)
+
+            if action == 'on' and self._last_action != 'on':
+                self._logger.debug('_evaluate(); turning aircon on')
+                return self._turn_aircon_on()
+            elif action == 'off' and self._last_action != 'off':
+                self._logger.debug('_evaluate(); turning aircon off')
+                return self._turn_aircon_off()
+
+            return _done()
+
+    def _handle_snapshot(self, snapshot):
+        self._logger.debug('_handle_snapshot(); snapshot=%s', snapshot)
+
+        with self._trace('composer.handle_snapshot'):
+            self._evaluate(snapshot)
 
     def run(self):
-        self._logger.debug('{0}()'.format(inspect.currentframe().f_code.co_name))
-
-        if self._check_above_on_threshold():
-            self._logger.debug('{0}(); temperature above on threshold'.format(inspect.currentframe().f_code.co_name))
-            if self._last_action != 'on':
-                self._logger.debug('{0}(); turning aircon on'.format(inspect.currentframe().f_code.co_name))
-                self._turn_aircon_on()
-        elif self._check_below_off_threshold():
-            self._logger.debug('{0}(); temperature below off threshold'.format(inspect.currentframe().f_code.co_name))
-            if self._last_action != 'off':
-                self._logger.debug('{0}(); turning aircon off'.format(inspect.currentframe().f_code.co_name))
-                self._turn_aircon_off()
+        # returns a Future of whatever was sent (see CommandQueue), which may be waited on or ignored
+        self._logger.debug('run()')
+
+        with self._trace('composer.run'):
+            with span('weather.snapshot'):
+                snapshot = self._weather.snapshot()
+
+            return self._evaluate(snapshot)
+
+    def start(self):
+        if self._event_driven and self._unsubscribe is None:
+            self._unsubscribe = self._weather.subscribe(self._handle_snapshot)
+
+    def stop(self):
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
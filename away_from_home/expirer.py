@@ -1,37 +1,295 @@
-import datetime
+import math
+import time
+from collections import OrderedDict
+from logging import getLogger
+from threading import RLock, Event, Condition, Thread
 
+# everything here runs off a monotonic clock, so wall clock steps (e.g. NTP correcting a Raspberry Pi that booted
+# without an RTC) can't make a value go stale early or never
 
-class ExpiringBool(object):
-    def __init__(self, period):
-        self._value = None
 
-        self._period = period
-        self._timedelta = datetime.timedelta(seconds=self._period)
-        self._last_set = None
+class ExpiringValue(object):
+    __slots__ = ('_period', '_clock', '_value', '_expires')
 
-    def _is_stale(self, timestamp):
-        if self._last_set is None:
-            raise ValueError('cannot get before set')
+    def __init__(self, period, clock=time.monotonic):
+        self._period = period
+        self._clock = clock
 
-        return timestamp - self._last_set > self._timedelta
+        self._value = None
+        self._expires = None
 
     @property
     def stale(self):
-        return self._is_stale(datetime.datetime.now())
+        return self._expires is None or self._clock() >= self._expires
 
     @property
     def value(self):
-        return self._value if not self._is_stale(datetime.datetime.now()) else not self._value
+        if self._expires is None:
+            raise ValueError('cannot get before set')
+
+        return self._value
 
-    def _set_value(self, value, timestamp):
-        if not isinstance(value, bool):
-            raise TypeError('expected {0} got {1}'.format(
-                type(True), type(value)
-            ))
+    def get(self, default=None):
+        return self._value if not self.stale else default
 
+    # age is how old the value already is (e.g. one loaded from disk), in seconds
+    def set(self, value, age=0):
         self._value = value
-        self._last_set = timestamp
+        self._expires = self._clock() + self._period - max(age, 0)
+
+
+class _Entry(object):
+    __slots__ = ('value', 'expires')
+
+    def __init__(self, value, expires):
+        self.value = value
+        self.expires = expires
+
+
+class _Loading(object):
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache(object):
+    # a size-bounded (least recently used first out) cache of values that expire ttl seconds after being set;
+    # get_or_load() is single-flight, so concurrent readers of a missing or expired key share one call to the loader;
+    # expired entries are dropped when next read or, given a TimerWheel, as soon as they expire
+    def __init__(self, ttl, max_size=None, clock=time.monotonic, timer_wheel=None):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._clock = clock
+        self._timer_wheel = timer_wheel
+
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = RLock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key):
+        return self._get_entry(key) is not None
+
+    def _get_entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            if self._clock() >= entry.expires:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+
+            return entry
+
+    def get(self, key, default=None):
+        entry = self._get_entry(key)
+
+        return entry.value if entry is not None else default
+
+    def _evict(self, key, entry):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self._ttl
+
+        with self._lock:
+            entry = _Entry(value, self._clock() + ttl)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+
+            while self._max_size is not None and len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+        if self._timer_wheel is not None:
+            self._timer_wheel.schedule(ttl, self._evict, key, entry)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_load(self, key, loader, ttl=None):
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is not None:
+                return entry.value
+
+            loading = self._loading.get(key)
+            leader = loading is None
+            if leader:
+                loading = _Loading()
+                self._loading[key] = loading
+
+        if not leader:
+            loading.done.wait()
+
+            if loading.error is not None:
+                raise loading.error
+
+            return loading.value
+
+        try:
+            loading.value = loader(key)
+            self.set(key, loading.value, ttl)
+        except Exception as e:
+            loading.error = e
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+            loading.done.set()
+
+        return loading.value
+
+
+class _Timer(object):
+    __slots__ = ('tick', 'callback', 'args', 'cancelled')
+
+    def __init__(self, tick, callback, args):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class TimerWheel(object):
+    # a hashed timer wheel: a timer due at tick t lives in slot t % slots, so scheduling and cancelling are O(1); one
+    # thread runs every callback, sleeping until the next occupied slot (or indefinitely when there's nothing to do)
+    # rather than polling; callbacks run on that thread, so they should be quick and must not block
+    def __init__(self, tick=0.1, slots=512, clock=time.monotonic):
+        self._tick = tick
+        self._clock = clock
+
+        self._slots = [[] for _ in range(0, slots)]
+        self._start = clock()
+        self._current = 0
+        self._count = 0
+
+        self._condition = Condition()
+        self._stopped = False
+
+        self._thread = Thread(
+            target=self._run
+        )
+        self._thread.daemon = True
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug('__init__(); tick=%s, slots=%s', tick, slots)
+
+    def __len__(self):
+        with self._condition:
+            return self._count
+
+    def _now_tick(self):
+        return int((self._clock() - self._start) / self._tick)
+
+    def schedule(self, delay, callback, *args):
+        with self._condition:
+            tick = max(self._current + 1, int(math.ceil((self._clock() - self._start + delay) / self._tick)))
+            timer = _Timer(tick, callback, args)
+
+            self._slots[tick % len(self._slots)].append(timer)
+            self._count += 1
+
+            self._condition.notify()
+
+        return timer
+
+    def cancel(self, timer):
+        # the timer stays in its slot until the wheel next passes it, but won't fire
+        if timer is not None:
+            timer.cancelled = True
+
+    def _collect(self, now_tick):
+        due = []
+
+        if now_tick <= self._current:
+            return due
+
+        # after a long stall every slot may hold due timers, but there's no point visiting one twice
+        ticks = range(self._current + 1, now_tick + 1)
+        if len(ticks) > len(self._slots):
+            ticks = range(now_tick - len(self._slots) + 1, now_tick + 1)
+
+        for tick in ticks:
+            index = tick % len(self._slots)
+            slot = self._slots[index]
+            if len(slot) == 0:
+                continue
+
+            remaining = []
+            for timer in slot:
+                if timer.cancelled:
+                    self._count -= 1
+                elif timer.tick <= now_tick:
+                    self._count -= 1
+                    due.append(timer)
+                else:
+                    remaining.append(timer)
+
+            self._slots[index] = remaining
+
+        self._current = now_tick
+
+        return due
+
+    def _next_tick(self):
+        if self._count == 0:
+            return None
+
+        for offset in range(1, len(self._slots) + 1):
+            if len(self._slots[(self._current + offset) % len(self._slots)]) > 0:
+                return self._current + offset
+
+        return None
+
+    def _run(self, test_mode=False):
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+
+                due = self._collect(self._now_tick())
+
+                if len(due) == 0:
+                    if test_mode:
+                        return
+
+                    next_tick = self._next_tick()
+                    timeout = None
+                    if next_tick is not None:
+                        timeout = max(0.0, self._start + next_tick * self._tick - self._clock())
+
+                    self._condition.wait(timeout)
+                    continue
+
+            for timer in due:
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    self._logger.warning('_run(); timer callback=%s failed; error=%r', timer.callback, e)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
 
-    @value.setter
-    def value(self, value):
-        self._set_value(value, datetime.datetime.now())
+        self._thread.join()
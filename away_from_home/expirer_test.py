@@ -1,78 +1,333 @@
-import datetime
+import threading
 import unittest
 
-from hamcrest import assert_that, equal_to, calling, raises, not_
+from hamcrest import assert_that, equal_to, calling, raises
+from mock import MagicMock, call
 
-from away_from_home.expirer import ExpiringBool
+from away_from_home.expirer import ExpiringValue, TTLCache, TimerWheel
+from away_from_home.testing import FakeClock
 
-_TEST_TIMESTAMP = datetime.datetime(year=1991, month=2, day=6)
 
-
-class ExpiringBoolTest(unittest.TestCase):
+class ExpiringValueTest(unittest.TestCase):
     def setUp(self):
-        self._subject = ExpiringBool(
-            period=5
+        self._clock = FakeClock()
+        self._subject = ExpiringValue(
+            period=5,
+            clock=self._clock,
         )
 
-    def test_is_stale_first(self):
+    def test_stale_before_set(self):
         assert_that(
-            calling(self._subject._is_stale).with_args(_TEST_TIMESTAMP),
+            self._subject.stale,
+            equal_to(True)
+        )
+
+    def test_value_before_set(self):
+        assert_that(
+            calling(getattr).with_args(self._subject, 'value'),
             raises(ValueError)
         )
 
-    def test_is_stale_set_false(self):
-        self._subject._last_set = _TEST_TIMESTAMP - datetime.timedelta(seconds=4)
+    def test_set(self):
+        self._subject.set(True)
+        self._clock.now += 4
 
         assert_that(
-            self._subject._is_stale(_TEST_TIMESTAMP),
-            equal_to(False)
+            (self._subject.stale, self._subject.value, self._subject.get()),
+            equal_to((False, True, True))
         )
 
-    def test_is_stale_set_true(self):
-        self._subject._last_set = _TEST_TIMESTAMP - datetime.timedelta(seconds=8)
+    def test_stale_after_period(self):
+        self._subject.set(True)
+        self._clock.now += 5
 
+        # a stale value is still readable, but get() won't return it
         assert_that(
-            self._subject._is_stale(_TEST_TIMESTAMP),
-            equal_to(True)
+            (self._subject.stale, self._subject.value, self._subject.get('default')),
+            equal_to((True, True, 'default'))
         )
 
-    def test_value_getter(self):
-        self._subject._value = True
-        self._subject._last_set = datetime.datetime.now()
+    def test_set_with_age(self):
+        self._subject.set(True, age=3)
+        self._clock.now += 2
 
         assert_that(
-            self._subject.value,
+            self._subject.stale,
             equal_to(True)
         )
 
-    def test_set_value_wrong_type(self):
+    def test_slots(self):
         assert_that(
-            calling(self._subject._set_value).with_args(None, _TEST_TIMESTAMP),
-            raises(TypeError)
+            calling(setattr).with_args(self._subject, 'other', 1),
+            raises(AttributeError)
         )
 
-    def test_set_value(self):
-        self._subject._set_value(True, _TEST_TIMESTAMP)
 
+class TTLCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._clock = FakeClock()
+        self._subject = TTLCache(
+            ttl=10,
+            max_size=2,
+            clock=self._clock,
+        )
+
+    def test_get_missing(self):
         assert_that(
-            self._subject._value,
-            equal_to(True)
+            self._subject.get('a', 'default'),
+            equal_to('default')
         )
 
+    def test_set_get(self):
+        self._subject.set('a', 1)
+
         assert_that(
-            self._subject._last_set,
-            equal_to(_TEST_TIMESTAMP)
+            (self._subject.get('a'), 'a' in self._subject, len(self._subject)),
+            equal_to((1, True, 1))
         )
 
-    def test_value_setter(self):
-        self._subject.value = True
+    def test_expires(self):
+        self._subject.set('a', 1)
+        self._subject.set('b', 2, ttl=20)
+        self._clock.now += 10
 
         assert_that(
-            self._subject._value,
-            equal_to(True)
+            (self._subject.get('a'), self._subject.get('b')),
+            equal_to((None, 2))
+        )
+
+    def test_lru_eviction(self):
+        self._subject.set('a', 1)
+        self._subject.set('b', 2)
+        self._subject.get('a')
+        self._subject.set('c', 3)
+
+        assert_that(
+            (self._subject.get('a'), self._subject.get('b'), self._subject.get('c')),
+            equal_to((1, None, 3))
+        )
+
+    def test_invalidate(self):
+        self._subject.set('a', 1)
+        self._subject.invalidate('a')
+
+        assert_that(
+            self._subject.get('a'),
+            equal_to(None)
+        )
+
+    def test_get_or_load(self):
+        loader = MagicMock(return_value=1)
+
+        assert_that(
+            (self._subject.get_or_load('a', loader), self._subject.get_or_load('a', loader)),
+            equal_to((1, 1))
+        )
+
+        assert_that(
+            loader.mock_calls,
+            equal_to([
+                call('a')
+            ])
+        )
+
+    def test_get_or_load_error_not_cached(self):
+        loader = MagicMock(side_effect=[ValueError('nope'), 1])
+
+        assert_that(
+            calling(self._subject.get_or_load).with_args('a', loader),
+            raises(ValueError)
+        )
+
+        assert_that(
+            self._subject.get_or_load('a', loader),
+            equal_to(1)
+        )
+
+    def test_get_or_load_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def loader(key):
+            calls.append(key)
+            started.set()
+            release.wait(5)
+            return 1
+
+        results = []
+
+        def reader():
+            results.append(self._subject.get_or_load('a', loader))
+
+        threads = [threading.Thread(target=reader) for _ in range(0, 5)]
+        threads[0].start()
+        started.wait(5)
+
+        for thread in threads[1:]:
+            thread.start()
+
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        assert_that(
+            (calls, results),
+            equal_to((['a'], [1, 1, 1, 1, 1]))
+        )
+
+    def test_evicted_by_timer_wheel(self):
+        timer_wheel = MagicMock()
+        self._subject = TTLCache(ttl=5, clock=self._clock, timer_wheel=timer_wheel)
+
+        self._subject.set('a', 1)
+        _, (delay, callback, key, entry), _ = timer_wheel.schedule.mock_calls[0]
+
+        assert_that(
+            (delay, key),
+            equal_to((5, 'a'))
         )
 
+        callback(key, entry)
+
         assert_that(
-            self._subject._last_set,
-            not_(equal_to(None))
+            len(self._subject),
+            equal_to(0)
         )
+
+    def test_timer_wheel_eviction_ignores_replaced_entry(self):
+        timer_wheel = MagicMock()
+        self._subject = TTLCache(ttl=5, clock=self._clock, timer_wheel=timer_wheel)
+
+        self._subject.set('a', 1)
+        _, (_, callback, key, entry), _ = timer_wheel.schedule.mock_calls[0]
+        self._subject.set('a', 2)
+
+        callback(key, entry)
+
+        assert_that(
+            self._subject.get('a'),
+            equal_to(2)
+        )
+
+
+class TimerWheelTest(unittest.TestCase):
+    def setUp(self):
+        self._clock = FakeClock()
+        self._subject = TimerWheel(
+            tick=1,
+            slots=8,
+            clock=self._clock,
+        )
+        self._callback = MagicMock()
+
+    def test_fires_when_due(self):
+        self._subject.schedule(3, self._callback, 'a')
+
+        self._clock.now += 2
+        self._subject._run(test_mode=True)
+
+        assert_that(
+            self._callback.mock_calls,
+            equal_to([])
+        )
+
+        self._clock.now += 1
+        self._subject._run(test_mode=True)
+
+        assert_that(
+            (self._callback.mock_calls, len(self._subject)),
+            equal_to(([call('a')], 0))
+        )
+
+    def test_fires_beyond_one_revolution(self):
+        self._subject.schedule(11, self._callback, 'a')
+
+        self._clock.now += 3
+        self._subject._run(test_mode=True)
+        self._clock.now += 5
+        self._subject._run(test_mode=True)
+
+        assert_that(
+            self._callback.mock_calls,
+            equal_to([])
+        )
+
+        self._clock.now += 3
+        self._subject._run(test_mode=True)
+
+        assert_that(
+            self._callback.mock_calls,
+            equal_to([call('a')])
+        )
+
+    def test_fires_after_stall(self):
+        self._subject.schedule(2, self._callback, 'a')
+        self._subject.schedule(13, self._callback, 'b')
+
+        self._clock.now += 30
+        self._subject._run(test_mode=True)
+
+        assert_that(
+            self._callback.mock_calls,
+            equal_to([call('a'), call('b')])
+        )
+
+    def test_cancel(self):
+        timer = self._subject.schedule(2, self._callback, 'a')
+        self._subject.cancel(timer)
+
+        self._clock.now += 2
+        self._subject._run(test_mode=True)
+
+        assert_that(
+            (self._callback.mock_calls, len(self._subject)),
+            equal_to(([], 0))
+        )
+
+    def test_next_tick(self):
+        assert_that(
+            self._subject._next_tick(),
+            equal_to(None)
+        )
+
+        self._subject.schedule(5, self._callback)
+
+        assert_that(
+            self._subject._next_tick(),
+            equal_to(5)
+        )
+
+    def test_callback_error_does_not_stop_others(self):
+        calls = []
+
+        def callback(name):
+            calls.append(name)
+            if name == 'a':
+                raise Exception('boom')
+
+        self._subject.schedule(1, callback, 'a')
+        self._subject.schedule(1, callback, 'b')
+
+        self._clock.now += 1
+        self._subject._run(test_mode=True)
+
+        assert_that(
+            calls,
+            equal_to(['a', 'b'])
+        )
+
+    def test_start_stop(self):
+        self._subject = TimerWheel(tick=0.01)
+        done = threading.Event()
+
+        self._subject.start()
+        self._subject.schedule(0.02, done.set)
+
+        assert_that(
+            done.wait(1),
+            equal_to(True)
+        )
+
+        self._subject.stop()
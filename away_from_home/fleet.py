@@ -0,0 +1,215 @@
+import datetime
+from logging import getLogger
+from threading import RLock
+
+from pyowm import OWM
+
+from away_from_home.provider import CircuitBreaker, build_snapshot, call_with_timeout
+from away_from_home.weather import WeatherSource
+
+# OWM's group endpoint accepts at most 20 city ids per request
+_GROUP_SIZE = 20
+
+# a site whose city can't be resolved (or a group refresh that failed) is retried after a cache period, then twice that
+# and so on, up to this
+_MAX_BACKOFF = datetime.timedelta(hours=1)
+
+
+def round_coords(lat, lon, precision):
+    return round(lat, precision), round(lon, precision)
+
+
+class FleetWeather(WeatherSource):
+    def __init__(self, fleet, lat, lon):
+        self._fleet = fleet
+        self._lat = lat
+        self._lon = lon
+
+        self._last = None
+
+    def snapshot(self):
+        snapshot = self._fleet.snapshot(self._lat, self._lon)
+
+        # the fleet only refreshes when asked, so subscribers hear of a new observation when a snapshot() turns one up
+        if snapshot != self._last:
+            self._last = snapshot
+            self._notify(snapshot)
+
+        return snapshot
+
+
+class WeatherFleet(object):
+    # each site's coordinates are rounded (2 decimal places is ~1 km) and the rounded location is resolved once to its
+    # nearest OWM city; sites sharing a city share an observation, and every stale city is refreshed together through
+    # the group endpoint, so N sites cost ceil(cities / 20) requests per cache period rather than N
+    #
+    # every OWM call is made as a ProviderChain makes them, abandoned after timeout seconds and behind a circuit
+    # breaker, so a hung or failing OWM can't hold up snapshot() for every site (which all wait on the one lock)
+    def __init__(self, owm_key, cache_period, precision=2, limiter=None, timeout=None, failure_threshold=3,
+                 reset_timeout=300):
+        self._owm = OWM(owm_key)
+        self._limiter = limiter
+        self._cache_period = datetime.timedelta(seconds=cache_period)
+        self._precision = precision
+        self._timeout = timeout
+
+        self._breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self._city_id_by_coords = {}
+        self._snapshot_by_city_id = {}
+
+        # coords -> (consecutive failures, when to try again) for sites that couldn't be resolved
+        self._resolve_failures = {}
+
+        # the same for refreshing stale cities
+        self._group_failures = 0
+        self._group_retry = None
+
+        self._lock = RLock()
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug(
+            '__init__(); owm_key=%r, cache_period=%s, precision=%s, limiter=%s, timeout=%s, failure_threshold=%s, '
+            'reset_timeout=%s', owm_key, cache_period, precision, limiter, timeout, failure_threshold, reset_timeout
+        )
+
+    @property
+    def coords(self):
+        with self._lock:
+            return sorted(self._city_id_by_coords.keys())
+
+    def _check_stale(self, city_id, timestamp, cache_period):
+        snapshot = self._snapshot_by_city_id.get(city_id)
+
+        return snapshot is None or timestamp - snapshot.timestamp > cache_period
+
+    def _call(self, method, *args, **kwargs):
+        if not self._breaker.allow():
+            raise ValueError('not calling OWM; circuit open')
+
+        try:
+            result = call_with_timeout(self._timeout, method, *args, **kwargs)
+        except Exception:
+            self._breaker.record_failure()
+            raise
+
+        self._breaker.record_success()
+
+        return result
+
+    def _backoff(self, failures, timestamp):
+        return timestamp + min(self._cache_period * 2 ** (failures - 1), _MAX_BACKOFF)
+
+    def _lookup(self, coords):
+        # nothing cached for this site yet, so it's worth waiting (at most timeout seconds) for a token
+        if self._limiter is not None and not self._limiter.acquire(timeout=self._timeout):
+            raise ValueError('OWM request budget exhausted')
+
+        observations = self._call(self._owm.weather_around_coords, lat=coords[0], lon=coords[1], limit=1)
+        if not observations:
+            raise ValueError('no OWM city found near {0}'.format(coords))
+
+        return observations
+
+    def _resolve(self, coords, timestamp):
+        self._logger.debug('_resolve(); coords=%s', coords)
+
+        failures, retry = self._resolve_failures.get(coords, (0, None))
+        if retry is not None and timestamp < retry:
+            raise ValueError('not resolving {0} again until {1} after {2} failures'.format(coords, retry, failures))
+
+        try:
+            observations = self._lookup(coords)
+        except Exception:
+            failures += 1
+            retry = self._backoff(failures, timestamp)
+            self._resolve_failures[coords] = (failures, retry)
+            raise
+
+        self._resolve_failures.pop(coords, None)
+
+        city_id = observations[0].get_location().get_ID()
+
+        self._city_id_by_coords[coords] = city_id
+
+        # the lookup returns an observation as well, so there's no need to fetch this city again right away
+        self._snapshot_by_city_id[city_id] = build_snapshot(observations[0].get_weather())
+
+        self._logger.info('_resolve(); coords=%s, city_id=%s', coords, city_id)
+
+    def _update(self, coords):
+        # only the asking site is resolved, so one that can't be doesn't stop the others being served
+        self._logger.debug('_update(); coords=%s', coords)
+
+        timestamp = datetime.datetime.now()
+
+        if self._city_id_by_coords[coords] is None:
+            self._resolve(coords, timestamp)
+
+        cache_period = self._cache_period
+        if self._limiter is not None:
+            cache_period = datetime.timedelta(seconds=self._limiter.stretch(cache_period.total_seconds()))
+
+        # the cached (if stale) observations are served until a refresh works
+        if self._group_retry is not None and timestamp < self._group_retry:
+            return
+
+        stale_city_ids = sorted({
+            city_id for city_id in self._city_id_by_coords.values()
+            if city_id is not None and self._check_stale(city_id, timestamp, cache_period)
+        })
+
+        for i in range(0, len(stale_city_ids), _GROUP_SIZE):
+            city_ids = stale_city_ids[i:i + _GROUP_SIZE]
+
+            # every one of them has something cached to serve, so don't queue for a token
+            if self._limiter is not None and not self._limiter.acquire(blocking=False):
+                self._logger.debug('_update(); no budget to refresh city_ids=%s', city_ids)
+                return
+
+            self._logger.debug('_update(); city_ids=%s', city_ids)
+
+            try:
+                observations = self._call(self._owm.weather_at_ids, city_ids)
+            except Exception as e:
+                self._group_failures += 1
+                self._group_retry = self._backoff(self._group_failures, timestamp)
+
+                self._logger.warning(
+                    '_update(); failed to refresh city_ids=%s, retrying at %s; error=%r', city_ids, self._group_retry, e
+                )
+
+                return
+
+            self._group_failures = 0
+            self._group_retry = None
+
+            for observation in observations:
+                self._snapshot_by_city_id[observation.get_location().get_ID()] = build_snapshot(
+                    observation.get_weather(), timestamp
+                )
+
+    def add(self, lat, lon):
+        coords = round_coords(lat, lon, self._precision)
+
+        with self._lock:
+            self._city_id_by_coords.setdefault(coords, None)
+
+        return FleetWeather(self, lat, lon)
+
+    def snapshot(self, lat, lon):
+        coords = round_coords(lat, lon, self._precision)
+
+        with self._lock:
+            self._city_id_by_coords.setdefault(coords, None)
+
+            self._update(coords)
+
+            snapshot = self._snapshot_by_city_id.get(self._city_id_by_coords[coords])
+
+        if snapshot is None:
+            raise ValueError('no observation available for {0}'.format(coords))
+
+        self._logger.debug('snapshot(); coords=%s, snapshot=%s', coords, snapshot)
+
+        return snapshot
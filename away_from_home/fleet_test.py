@@ -0,0 +1,281 @@
+import datetime
+import threading
+import unittest
+
+from hamcrest import assert_that, equal_to, calling, raises
+from mock import patch, MagicMock, call
+
+from away_from_home.fleet import WeatherFleet, FleetWeather, round_coords
+
+_OWM_KEY = 'd59f6762bf26d648a301f363cd84405f'
+_CACHE_PERIOD = 300
+
+
+def _observation(city_id, temperature):
+    observation = MagicMock()
+    observation.get_location.return_value.get_ID.return_value = city_id
+
+    weather = observation.get_weather.return_value
+    weather.get_temperature.return_value = {'temp': temperature}
+    weather.get_humidity.return_value = 25
+    weather.get_wind.return_value = {'speed': 5, 'deg': 330}
+    weather.get_sunrise_time.return_value = 1509743779
+    weather.get_sunset_time.return_value = 1509792245
+
+    return observation
+
+
+class FunctionsTest(unittest.TestCase):
+    def test_round_coords(self):
+        assert_that(
+            round_coords(-31.946041, 115.920222, 2),
+            equal_to((-31.95, 115.92))
+        )
+
+
+class WeatherFleetTest(unittest.TestCase):
+    @patch('away_from_home.fleet.OWM')
+    def setUp(self, owm):
+        self._subject = WeatherFleet(
+            owm_key=_OWM_KEY,
+            cache_period=_CACHE_PERIOD,
+        )
+
+        assert_that(
+            owm.mock_calls,
+            equal_to([
+                call(_OWM_KEY)
+            ])
+        )
+
+        self._owm = self._subject._owm
+        self._owm.weather_around_coords.side_effect = lambda lat, lon, limit: [
+            _observation(1 if lon < 116 else 2, 30)
+        ]
+
+    def test_add(self):
+        location = self._subject.add(-31.946041, 115.920222)
+
+        assert_that(
+            isinstance(location, FleetWeather),
+            equal_to(True)
+        )
+
+        assert_that(
+            self._subject.coords,
+            equal_to([(-31.95, 115.92)])
+        )
+
+    def test_nearby_locations_share_cache(self):
+        self._subject.add(-31.946041, 115.920222)
+        self._subject.add(-31.947, 115.921)
+
+        assert_that(
+            self._subject.snapshot(-31.946041, 115.920222),
+            equal_to(self._subject.snapshot(-31.947, 115.921))
+        )
+
+        assert_that(
+            self._owm.weather_around_coords.mock_calls,
+            equal_to([
+                call(lat=-31.95, lon=115.92, limit=1),
+            ])
+        )
+
+        assert_that(
+            self._owm.weather_at_ids.mock_calls,
+            equal_to([])
+        )
+
+    def test_stale_locations_fetched_in_one_request(self):
+        first = self._subject.add(-31.95, 115.92)
+        second = self._subject.add(-31.95, 116.5)
+        first.snapshot()
+        second.snapshot()
+
+        for city_id, snapshot in self._subject._snapshot_by_city_id.items():
+            self._subject._snapshot_by_city_id[city_id] = snapshot._replace(
+                timestamp=snapshot.timestamp - datetime.timedelta(seconds=_CACHE_PERIOD + 1)
+            )
+
+        self._owm.weather_at_ids.return_value = [_observation(1, 20), _observation(2, 21)]
+
+        assert_that(
+            first.temperature,
+            equal_to(20.0)
+        )
+
+        assert_that(
+            self._owm.weather_at_ids.mock_calls,
+            equal_to([
+                call([1, 2])
+            ])
+        )
+
+        assert_that(
+            self._subject.snapshot(-31.95, 116.5).temperature,
+            equal_to(21.0)
+        )
+
+    def test_resolve_nothing_found(self):
+        self._owm.weather_around_coords.side_effect = None
+        self._owm.weather_around_coords.return_value = []
+
+        assert_that(
+            calling(self._subject.snapshot).with_args(-31.95, 115.92),
+            raises(ValueError)
+        )
+
+    def test_unresolvable_site_does_not_affect_others(self):
+        good = self._subject.add(-31.95, 115.92)
+        good.snapshot()
+
+        self._owm.weather_around_coords.side_effect = None
+        self._owm.weather_around_coords.return_value = []
+        bad = self._subject.add(60.0, 0.0)
+
+        assert_that(
+            (good.temperature, len(self._owm.weather_around_coords.mock_calls)),
+            equal_to((30.0, 1))
+        )
+
+        assert_that(
+            calling(bad.snapshot),
+            raises(ValueError)
+        )
+
+    def test_unresolvable_site_backs_off(self):
+        self._owm.weather_around_coords.side_effect = None
+        self._owm.weather_around_coords.return_value = []
+
+        for _ in range(0, 3):
+            assert_that(
+                calling(self._subject.snapshot).with_args(60.0, 0.0),
+                raises(ValueError)
+            )
+
+        assert_that(
+            (len(self._owm.weather_around_coords.mock_calls), self._subject._resolve_failures[(60.0, 0.0)][0]),
+            equal_to((1, 1))
+        )
+
+    def test_group_failure_serves_cached(self):
+        location = self._subject.add(-31.95, 115.92)
+        location.snapshot()
+
+        for city_id, snapshot in self._subject._snapshot_by_city_id.items():
+            self._subject._snapshot_by_city_id[city_id] = snapshot._replace(
+                timestamp=snapshot.timestamp - datetime.timedelta(seconds=_CACHE_PERIOD + 1)
+            )
+
+        self._owm.weather_at_ids.side_effect = ValueError('owm is down')
+
+        assert_that(
+            (location.temperature, len(self._owm.weather_at_ids.mock_calls)),
+            equal_to((30.0, 1))
+        )
+
+    def _make_stale(self):
+        for city_id, snapshot in self._subject._snapshot_by_city_id.items():
+            self._subject._snapshot_by_city_id[city_id] = snapshot._replace(
+                timestamp=snapshot.timestamp - datetime.timedelta(seconds=_CACHE_PERIOD + 1)
+            )
+
+    def test_group_failure_backs_off(self):
+        location = self._subject.add(-31.95, 115.92)
+        location.snapshot()
+        self._make_stale()
+
+        self._owm.weather_at_ids.side_effect = ValueError('owm is down')
+
+        for _ in range(0, 3):
+            location.snapshot()
+
+        assert_that(
+            (len(self._owm.weather_at_ids.mock_calls), self._subject._group_failures),
+            equal_to((1, 1))
+        )
+
+        self._subject._group_retry = datetime.datetime.now()
+        self._owm.weather_at_ids.side_effect = None
+        self._owm.weather_at_ids.return_value = [_observation(1, 20)]
+
+        assert_that(
+            (location.temperature, self._subject._group_failures, self._subject._group_retry),
+            equal_to((20.0, 0, None))
+        )
+
+    def test_group_refresh_does_not_queue_for_budget(self):
+        location = self._subject.add(-31.95, 115.92)
+        location.snapshot()
+        self._make_stale()
+
+        self._subject._limiter = MagicMock(**{'stretch.side_effect': lambda x: x, 'acquire.return_value': False})
+
+        assert_that(
+            (location.temperature, self._owm.weather_at_ids.mock_calls),
+            equal_to((30.0, []))
+        )
+
+        assert_that(
+            self._subject._limiter.acquire.mock_calls,
+            equal_to([
+                call(blocking=False)
+            ])
+        )
+
+    def test_hung_group_call_times_out(self):
+        location = self._subject.add(-31.95, 115.92)
+        location.snapshot()
+        self._make_stale()
+
+        hung = threading.Event()
+        self._owm.weather_at_ids.side_effect = lambda city_ids: hung.wait(5)
+        self._subject._timeout = 0.05
+
+        try:
+            temperature = location.temperature
+        finally:
+            hung.set()
+
+        assert_that(
+            (temperature, self._subject._group_failures),
+            equal_to((30.0, 1))
+        )
+
+    def test_circuit_opens(self):
+        location = self._subject.add(-31.95, 115.92)
+        location.snapshot()
+        self._make_stale()
+
+        self._owm.weather_at_ids.side_effect = ValueError('owm is down')
+
+        for _ in range(0, 5):
+            self._subject._group_retry = None
+            location.snapshot()
+
+        assert_that(
+            (len(self._owm.weather_at_ids.mock_calls), self._subject._breaker.state),
+            equal_to((3, 'open'))
+        )
+
+    def test_subscribe(self):
+        location = self._subject.add(-31.95, 115.92)
+
+        snapshots = []
+        unsubscribe = location.subscribe(snapshots.append)
+
+        snapshot = location.snapshot()
+        location.snapshot()
+
+        unsubscribe()
+
+        for city_id, cached in self._subject._snapshot_by_city_id.items():
+            self._subject._snapshot_by_city_id[city_id] = cached._replace(temperature=31.0)
+
+        location.snapshot()
+
+        assert_that(
+            snapshots,
+            equal_to([snapshot])
+        )
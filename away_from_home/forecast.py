@@ -0,0 +1,74 @@
+import datetime
+
+import numpy as np
+
+from away_from_home.snapshot import to_unix
+
+
+class ForecastSeries(object):
+    # a forecast held as two parallel float64 arrays (unix reference times, temperatures) sorted by time; between
+    # points temperatures are linearly interpolated, and an observation can be passed as an anchor so "now" moves
+    # smoothly from the last reading toward the next forecast point
+    __slots__ = ('fetched', 'times', 'temperatures')
+
+    def __init__(self, fetched, times, temperatures):
+        order = np.argsort(times)
+
+        self.fetched = fetched
+        self.times = np.asarray(times, dtype=np.float64)[order]
+        self.temperatures = np.asarray(temperatures, dtype=np.float64)[order]
+
+    def __len__(self):
+        return len(self.times)
+
+    def __repr__(self):
+        return '{0}(fetched={1}, points={2})'.format(self.__class__.__name__, self.fetched, len(self))
+
+    # [fetched as unix time, times, temperatures], for the Store
+    def to_row(self):
+        return [to_unix(self.fetched), self.times.tolist(), self.temperatures.tolist()]
+
+    @classmethod
+    def from_row(cls, row):
+        fetched, times, temperatures = row
+
+        return cls(datetime.datetime.fromtimestamp(fetched), times, temperatures)
+
+    def interpolate(self, timestamps, anchor_time=None, anchor_temperature=None):
+        times = self.times
+        temperatures = self.temperatures
+
+        if anchor_time is not None:
+            later = times > anchor_time
+            times = np.concatenate(([anchor_time], times[later]))
+            temperatures = np.concatenate(([anchor_temperature], temperatures[later]))
+
+        if len(times) == 0:
+            return None
+
+        # np.interp holds the end values flat beyond either end of the series
+        return np.interp(timestamps, times, temperatures)
+
+    def first_crossing(self, threshold, start, end, anchor_time=None, anchor_temperature=None):
+        # the earliest time in [start, end] at which the interpolated temperature reaches threshold, else None
+        times = self.times
+        inside = (times > start) & (times < end)
+        candidates = np.concatenate(([start], times[inside], [end]))
+
+        temperatures = self.interpolate(candidates, anchor_time, anchor_temperature)
+        if temperatures is None:
+            return None
+
+        above = np.nonzero(temperatures >= threshold)[0]
+        if len(above) == 0:
+            return None
+
+        i = above[0]
+        if i == 0:
+            return float(start)
+
+        # linear between the last point below and the first at or above
+        t0, t1 = candidates[i - 1], candidates[i]
+        y0, y1 = temperatures[i - 1], temperatures[i]
+
+        return float(t0 + (threshold - y0) / (y1 - y0) * (t1 - t0))
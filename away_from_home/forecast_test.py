@@ -0,0 +1,74 @@
+import unittest
+
+from hamcrest import assert_that, equal_to, close_to
+
+from away_from_home.forecast import ForecastSeries
+
+_TEST_TIME = 666230400.0
+_HOUR = 3600.0
+
+
+class ForecastSeriesTest(unittest.TestCase):
+    def setUp(self):
+        self._subject = ForecastSeries(
+            fetched=None,
+            times=[_TEST_TIME + 6 * _HOUR, _TEST_TIME, _TEST_TIME + 3 * _HOUR],
+            temperatures=[24.0, 30.0, 27.0],
+        )
+
+    def test_sorted(self):
+        assert_that(
+            self._subject.temperatures.tolist(),
+            equal_to([30.0, 27.0, 24.0])
+        )
+
+    def test_interpolate(self):
+        assert_that(
+            float(self._subject.interpolate(_TEST_TIME + 1.5 * _HOUR)),
+            close_to(28.5, 1e-9)
+        )
+
+    def test_interpolate_many(self):
+        assert_that(
+            self._subject.interpolate([_TEST_TIME, _TEST_TIME + 4 * _HOUR]).tolist(),
+            equal_to([30.0, 26.0])
+        )
+
+    def test_interpolate_from_anchor(self):
+        # an observation at +1h replaces everything before it
+        assert_that(
+            float(self._subject.interpolate(_TEST_TIME + 2 * _HOUR, _TEST_TIME + _HOUR, 33.0)),
+            close_to(30.0, 1e-9)
+        )
+
+    def test_interpolate_empty(self):
+        subject = ForecastSeries(fetched=None, times=[], temperatures=[])
+
+        assert_that(
+            subject.interpolate(_TEST_TIME),
+            equal_to(None)
+        )
+
+    def test_first_crossing(self):
+        subject = ForecastSeries(
+            fetched=None,
+            times=[_TEST_TIME, _TEST_TIME + 3 * _HOUR],
+            temperatures=[26.0, 32.0],
+        )
+
+        assert_that(
+            subject.first_crossing(29.0, _TEST_TIME, _TEST_TIME + 6 * _HOUR),
+            close_to(_TEST_TIME + 1.5 * _HOUR, 1e-6)
+        )
+
+    def test_first_crossing_already_above(self):
+        assert_that(
+            self._subject.first_crossing(29.0, _TEST_TIME, _TEST_TIME + _HOUR),
+            equal_to(_TEST_TIME)
+        )
+
+    def test_first_crossing_none(self):
+        assert_that(
+            self._subject.first_crossing(35.0, _TEST_TIME, _TEST_TIME + 6 * _HOUR),
+            equal_to(None)
+        )
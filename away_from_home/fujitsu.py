@@ -0,0 +1,97 @@
+from collections import namedtuple
+from functools import lru_cache
+
+# builds zmote IR strings for Fujitsu heat pumps from a state rather than replaying a recording; a frame is a few
+# bytes sent least significant bit first, e.g. cool at 18 with the fan on low is
+#
+#     14 63 00 10 10 fc 08 30 21 01 03 00 00 00 ab
+#
+# (fixed header, then setpoint << 4 | power, mode, swing << 4 | fan, unused, checksum) and off is the short frame
+#
+#     14 63 00 10 10 02
+#
+# frames are what's cached (a few bytes each, so hundreds of variants cost next to nothing) and are only rendered to
+# the much longer text when sent
+
+FujitsuState = namedtuple('FujitsuState', ['power', 'mode', 'setpoint', 'fan', 'swing'])
+
+MODES = {'auto': 0, 'cool': 1, 'dry': 2, 'fan': 3, 'heat': 4}
+FANS = {'auto': 0, 'high': 1, 'medium': 2, 'low': 3, 'quiet': 4}
+SWINGS = {'off': 0, 'vertical': 1, 'horizontal': 2, 'both': 3}
+
+MIN_SETPOINT = 16
+MAX_SETPOINT = 30
+
+_HEADER = bytes([0x14, 0x63, 0x00, 0x10, 0x10])
+_LONG = bytes([0xfc, 0x08, 0x30])
+_OFF = 0x02
+
+# zmote's prefix (carrier at 37 kHz) and timings, in carrier cycles
+_PREFIX = '1:1,0,37000,1,1'
+_LEADER = (122, 62)
+_MARK = 15
+_ZERO = 16
+_ONE = 46
+_TRAILER = (15, 3692)
+
+# each byte's eight bits as text, so rendering a frame is a join of at most 15 strings
+_BYTE_TEXT = [
+    ''.join(',{0},{1}'.format(_MARK, _ONE if (value >> bit) & 1 else _ZERO) for bit in range(0, 8))
+    for value in range(0, 256)
+]
+
+
+def _checksum(frame):
+    # makes the bytes after the header's 0x08 sum to zero
+    return -sum(frame[7:]) & 0xff
+
+
+@lru_cache(maxsize=512)
+def encode(state):
+    # raises ValueError for anything the protocol can't express
+    if not state.power:
+        return _HEADER + bytes([_OFF])
+
+    if state.mode not in MODES:
+        raise ValueError('mode must be one of {0}, got {1!r}'.format(sorted(MODES), state.mode))
+
+    if state.fan not in FANS:
+        raise ValueError('fan must be one of {0}, got {1!r}'.format(sorted(FANS), state.fan))
+
+    if state.swing not in SWINGS:
+        raise ValueError('swing must be one of {0}, got {1!r}'.format(sorted(SWINGS), state.swing))
+
+    if not isinstance(state.setpoint, int) or not MIN_SETPOINT <= state.setpoint <= MAX_SETPOINT:
+        raise ValueError('setpoint must be a whole number from {0} to {1}, got {2!r}'.format(
+            MIN_SETPOINT, MAX_SETPOINT, state.setpoint
+        ))
+
+    frame = bytearray(_HEADER + _LONG)
+    frame.append((state.setpoint - MIN_SETPOINT) << 4 | 1)
+    frame.append(MODES[state.mode])
+    frame.append(SWINGS[state.swing] << 4 | FANS[state.fan])
+    frame.extend([0x00, 0x00, 0x00])
+    frame.append(_checksum(frame))
+
+    return bytes(frame)
+
+
+def render(frame):
+    return '{0},{1},{2}{3},{4},{5}'.format(
+        _PREFIX, _LEADER[0], _LEADER[1], ''.join(_BYTE_TEXT[x] for x in frame), _TRAILER[0], _TRAILER[1]
+    )
+
+
+def decode(text):
+    # a rendered (or recorded, so slightly off) string back to its frame
+    timings = [int(x) for x in text.split(',')[len(_PREFIX.split(',')):]]
+    spaces = timings[len(_LEADER) + 1:-len(_TRAILER):2]
+
+    if len(spaces) % 8 != 0:
+        raise ValueError('expected whole bytes, got {0} bits'.format(len(spaces)))
+
+    frame = bytearray()
+    for i in range(0, len(spaces), 8):
+        frame.append(sum(1 << bit for bit, space in enumerate(spaces[i:i + 8]) if space > (_ZERO + _ONE) / 2))
+
+    return bytes(frame)
@@ -0,0 +1,58 @@
+import unittest
+
+from hamcrest import assert_that, equal_to, calling, raises
+
+from away_from_home.aircon import _FUJITSU_ON, _FUJITSU_OFF
+from away_from_home.fujitsu import FujitsuState, encode, render, decode
+
+_STATE = FujitsuState(power=True, mode='cool', setpoint=18, fan='low', swing='off')
+
+
+class FujitsuTest(unittest.TestCase):
+    def test_encode_matches_recording(self):
+        assert_that(
+            (encode(_STATE), encode(_STATE._replace(power=False))),
+            equal_to((decode(_FUJITSU_ON), decode(_FUJITSU_OFF)))
+        )
+
+    def test_encode(self):
+        assert_that(
+            encode(FujitsuState(power=True, mode='heat', setpoint=24, fan='auto', swing='vertical')).hex(),
+            equal_to('1463001010fc08308104100000003b')
+        )
+
+    def test_encode_checksum(self):
+        for setpoint in range(16, 31):
+            frame = encode(_STATE._replace(setpoint=setpoint))
+
+            assert_that(
+                sum(frame[7:]) & 0xff,
+                equal_to(0)
+            )
+
+    def test_encode_invalid(self):
+        for state in [
+            _STATE._replace(mode='warm'),
+            _STATE._replace(fan='turbo'),
+            _STATE._replace(swing='sideways'),
+            _STATE._replace(setpoint=31),
+            _STATE._replace(setpoint=24.5),
+        ]:
+            assert_that(
+                calling(encode).with_args(state),
+                raises(ValueError)
+            )
+
+    def test_encode_cached(self):
+        assert_that(
+            encode(_STATE._replace(setpoint=25)) is encode(_STATE._replace(setpoint=25)),
+            equal_to(True)
+        )
+
+    def test_render(self):
+        text = render(encode(_STATE))
+
+        assert_that(
+            (text.split(',')[:7], text.split(',')[-2:], len(text.split(',')), decode(text)),
+            equal_to((['1:1', '0', '37000', '1', '1', '122', '62'], ['15', '3692'], 249, encode(_STATE)))
+        )
@@ -1,6 +1,5 @@
 import copy
 import datetime
-import inspect
 import json
 import socket
 import struct
@@ -10,22 +9,37 @@ from logging import getLogger
 from threading import Thread, RLock
 from uuid import uuid4
 
+from away_from_home.expirer import TimerWheel
+
 _GROUP = '239.137.62.91'
 _PORT = 6291
 _STALE_AGE = datetime.timedelta(seconds=5)
 
+_MAX_DATAGRAM = 65507
+
+ACTIVE_KEY = 'heartbeat.active'
+
 Peer = namedtuple('Peer', ['uuid', 'priority', 'last_seen'])
 
 socket.setdefaulttimeout(1)
 
 
 class Heartbeat(object):
-    def __init__(self, priority):
+    def __init__(self, priority, timer_wheel=None, store=None):
         self._priority = priority
 
+        # if given, active / standby is published to the store under ACTIVE_KEY so it can be watched rather than polled
+        self._store = store
+
         self._uuid = str(uuid4())
         self._peers = {}
 
+        # peers are expired by a timer (re)armed each time they're heard from, rather than by polling; the wheel is
+        # normally shared with the rest of the process, otherwise we run our own
+        self._own_timer_wheel = timer_wheel is None
+        self._timer_wheel = timer_wheel if timer_wheel is not None else TimerWheel()
+        self._expiry_timers = {}
+
         self._recv_thread = Thread(
             target=self._recv
         )
@@ -34,10 +48,6 @@ class Heartbeat(object):
             target=self._send
         )
 
-        self._expire_thread = Thread(
-            target=self._expire
-        )
-
         self._stopped = False
         self._lock = RLock()
         self._recv_sock = None
@@ -45,10 +55,15 @@ class Heartbeat(object):
         self._active = True
         self._extra_info = {}
 
+        # name -> (produce, consume) for data carried on the heartbeats (e.g. Store replication)
+        self._payloads = {}
+
         self._logger = getLogger(self.__class__.__name__)
-        self._logger.debug('{0}(); priority={1}, uuid={2}, active={3}'.format(
-            inspect.currentframe().f_code.co_name, self._priority, repr(self._uuid), self._active
-        ))
+        self._logger.debug('__init__(); priority=%s, uuid=%r, active=%s', self._priority, self._uuid, self._active)
+
+    @property
+    def uuid(self):
+        return self._uuid
 
     @property
     def peers(self):
@@ -62,31 +77,40 @@ class Heartbeat(object):
     def _setup_sockets(self):
         self._recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
         self._recv_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        mreq = struct.pack("4sl", socket.inet_aton(_GROUP).encode(), socket.INADDR_ANY)
+        mreq = struct.pack("4sl", socket.inet_aton(_GROUP), socket.INADDR_ANY)
         self._recv_sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
         self._recv_sock.bind((_GROUP, _PORT))
         self._send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
 
+    def add_payload(self, name, produce, consume):
+        # produce() is called as each heartbeat is sent and returns something JSON serialisable (or None for nothing
+        # this time); consume(uuid, payload) is called with whatever a peer sent under the same name
+        self._payloads[name] = (produce, consume)
+
+    def _publish(self):
+        if self._store is not None:
+            self._store.set(ACTIVE_KEY, self._active)
+
     def _handle_active(self):
         if len(self.peers) == 0 or self._priority < min([x.priority for x in self.peers]):
             if not self._active:
                 self._active = True
 
-                self._logger.info('{0}(); active={1}'.format(
-                    inspect.currentframe().f_code.co_name, self._active
-                ))
+                self._logger.info('_handle_active(); active=%s', self._active)
+
+                self._publish()
         else:
             if self._active:
                 self._active = False
 
-                self._logger.info('{0}(); active={1}'.format(
-                    inspect.currentframe().f_code.co_name, self._active
-                ))
+                self._logger.info('_handle_active(); active=%s', self._active)
+
+                self._publish()
 
     def _recv(self, test_mode=False):
         while not self._stopped:
             try:
-                data_as_json = self._recv_sock.recv(1024).decode()
+                data_as_json = self._recv_sock.recv(_MAX_DATAGRAM).decode()
             except socket.timeout:
                 if test_mode:
                     return
@@ -109,16 +133,29 @@ class Heartbeat(object):
                 )
 
                 if remote_uuid not in self._peers:
-                    self._logger.info('{0}(); added peer={1}'.format(
-                        inspect.currentframe().f_code.co_name, peer
-                    ))
+                    self._logger.info('_recv(); added peer=%s', peer)
 
                 self._peers.update({
                     remote_uuid: peer
                 })
 
+                self._timer_wheel.cancel(self._expiry_timers.get(remote_uuid))
+                self._expiry_timers[remote_uuid] = self._timer_wheel.schedule(
+                    _STALE_AGE.total_seconds(), self._expire, remote_uuid, peer
+                )
+
             self._handle_active()
 
+            for name, (_, consume) in self._payloads.items():
+                payload = data_as_dict.get(name)
+                if payload is None:
+                    continue
+
+                try:
+                    consume(remote_uuid, payload)
+                except Exception as e:
+                    self._logger.warning('_recv(); failed to consume payload=%r; error=%r', name, e)
+
             if test_mode:
                 return
 
@@ -129,8 +166,18 @@ class Heartbeat(object):
                 'priority': self._priority,
             }
 
+            for name, (produce, _) in self._payloads.items():
+                try:
+                    payload = produce()
+                except Exception as e:
+                    self._logger.warning('_send(); failed to produce payload=%r; error=%r', name, e)
+                    continue
+
+                if payload is not None:
+                    data_as_dict[name] = payload
+
             self._send_sock.sendto(
-                json.dumps(data_as_dict),
+                json.dumps(data_as_dict).encode(),
                 (_GROUP, _PORT)
             )
 
@@ -139,36 +186,34 @@ class Heartbeat(object):
             if test_mode:
                 break
 
-    def _expire(self, test_mode=False):
-        while not self._stopped:
-            with self._lock:
-                last_seen_by_uuid = {uuid: peer.last_seen for uuid, peer in self._peers.items()}
-
-                for uuid, last_seen in last_seen_by_uuid.items():
-                    peer = self._peers.get(uuid)
-                    if last_seen < datetime.datetime.now() - _STALE_AGE:
-                        self._peers.pop(uuid)
-                        self._logger.info('{0}(); removed peer={1}'.format(
-                            inspect.currentframe().f_code.co_name, peer
-                        ))
-
-            self._handle_active()
+    def _expire(self, uuid, peer):
+        with self._lock:
+            # only if we haven't heard from it again since this timer was armed
+            if self._peers.get(uuid) is not peer:
+                return
 
-            time.sleep(1)
+            self._peers.pop(uuid)
+            self._expiry_timers.pop(uuid, None)
+            self._logger.info('_expire(); removed peer=%s', peer)
 
-            if test_mode:
-                break
+        self._handle_active()
 
     def start(self):
         self._setup_sockets()
 
+        self._publish()
+
+        if self._own_timer_wheel:
+            self._timer_wheel.start()
+
         self._recv_thread.start()
         self._send_thread.start()
-        self._expire_thread.start()
 
     def stop(self):
         self._stopped = True
 
         self._recv_thread.join()
         self._send_thread.join()
-        self._expire_thread.join()
+
+        if self._own_timer_wheel:
+            self._timer_wheel.stop()
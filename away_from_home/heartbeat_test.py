@@ -1,5 +1,6 @@
 import copy
 import datetime
+import socket
 import unittest
 
 from hamcrest import assert_that, equal_to
@@ -31,14 +32,13 @@ class HeartBeatTest(unittest.TestCase):
     @patch('away_from_home.heartbeat.Thread')
     def setUp(self, thread, uuid4):
         uuid4.return_value = 'own_uuid'
-        self._subject = Heartbeat(priority=2)
+        self._subject = Heartbeat(priority=2, timer_wheel=MagicMock())
 
         assert_that(
             thread.mock_calls,
             equal_to([
                 call(target=self._subject._recv),
                 call(target=self._subject._send),
-                call(target=self._subject._expire),
             ])
         )
 
@@ -47,7 +47,7 @@ class HeartBeatTest(unittest.TestCase):
 
     @patch('away_from_home.heartbeat.socket')
     def test_setup_socket(self, socket):
-        socket.inet_aton.return_value = 'something'
+        socket.inet_aton.return_value = b'something'
 
         self._subject._setup_sockets()
 
@@ -88,6 +88,35 @@ class HeartBeatTest(unittest.TestCase):
             equal_to(True)
         )
 
+    def test_handle_active_publishes_change(self):
+        self._subject._store = MagicMock()
+        self._subject._peers = _PEERS
+
+        self._subject._handle_active()
+        self._subject._handle_active()
+
+        assert_that(
+            self._subject._store.mock_calls,
+            equal_to([
+                call.set('heartbeat.active', False)
+            ])
+        )
+
+    def test_start_publishes_initial_state(self):
+        self._subject._store = MagicMock()
+        self._subject._setup_sockets = MagicMock()
+        self._subject._recv_thread = MagicMock()
+        self._subject._send_thread = MagicMock()
+
+        self._subject.start()
+
+        assert_that(
+            self._subject._store.mock_calls,
+            equal_to([
+                call.set('heartbeat.active', True)
+            ])
+        )
+
     @patch('away_from_home.heartbeat.datetime')
     def test_recv(self, dt):
         dt.datetime.now.return_value = _TEST_TIMESTAMP
@@ -110,6 +139,33 @@ class HeartBeatTest(unittest.TestCase):
             ])
         )
 
+        assert_that(
+            self._subject._timer_wheel.mock_calls,
+            equal_to([
+                call.cancel(None),
+                call.schedule(5.0, self._subject._expire, 'some_uuid', _PEER),
+            ])
+        )
+
+    @patch('away_from_home.heartbeat.datetime')
+    def test_recv_rearms_expiry(self, dt):
+        dt.datetime.now.return_value = _TEST_TIMESTAMP
+        self._subject._recv_sock.recv.return_value = _RECV_JSON
+        self._subject._handle_active = MagicMock()
+        self._subject._expiry_timers = {'some_uuid': 'old_timer'}
+
+        self._subject._recv(test_mode=True)
+
+        assert_that(
+            self._subject._timer_wheel.mock_calls[0],
+            equal_to(call.cancel('old_timer'))
+        )
+
+        assert_that(
+            self._subject._expiry_timers,
+            equal_to({'some_uuid': self._subject._timer_wheel.schedule.return_value})
+        )
+
     @patch('away_from_home.heartbeat.time')
     def test_send(self, time):
         self._subject._extra_info = {
@@ -122,7 +178,7 @@ class HeartBeatTest(unittest.TestCase):
             self._subject._send_sock.mock_calls,
             equal_to([
                 call.sendto(
-                    '{"uuid": "own_uuid", "priority": 2}',
+                    b'{"uuid": "own_uuid", "priority": 2}',
                     ('239.137.62.91', 6291)
                 )
             ])
@@ -136,26 +192,107 @@ class HeartBeatTest(unittest.TestCase):
         )
 
     @patch('away_from_home.heartbeat.time')
-    def test_expire(self, time):
-        time.return_value = _TEST_TIMESTAMP - datetime.timedelta(seconds=10)
+    def test_send_with_payloads(self, time):
+        self._subject.add_payload('store', lambda: {'a': {'x': 1}}, MagicMock())
+        self._subject.add_payload('nothing', lambda: None, MagicMock())
+
+        self._subject._send(test_mode=True)
+
+        assert_that(
+            self._subject._send_sock.mock_calls,
+            equal_to([
+                call.sendto(
+                    b'{"uuid": "own_uuid", "priority": 2, "store": {"a": {"x": 1}}}',
+                    ('239.137.62.91', 6291)
+                )
+            ])
+        )
+
+    @patch('away_from_home.heartbeat.time')
+    def test_send_through_socket(self, time):
+        recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        recv_sock.bind(('127.0.0.1', 0))
+        send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+
+        try:
+            self._subject._send_sock = send_sock
+            self._subject.add_payload('store', lambda: {'a': {'x': 1}}, MagicMock())
+
+            with patch('away_from_home.heartbeat._GROUP', '127.0.0.1'), \
+                    patch('away_from_home.heartbeat._PORT', recv_sock.getsockname()[1]):
+                self._subject._send(test_mode=True)
+
+            store_consume = MagicMock()
+            peer = Heartbeat(priority=1, timer_wheel=MagicMock())
+            peer._recv_sock = recv_sock
+            peer.add_payload('store', MagicMock(), store_consume)
+
+            peer._recv(test_mode=True)
+        finally:
+            recv_sock.close()
+            send_sock.close()
+
+        assert_that(
+            ([(x.uuid, x.priority) for x in peer.peers], store_consume.mock_calls),
+            equal_to(([('own_uuid', 2)], [call('own_uuid', {'a': {'x': 1}})]))
+        )
+
+    @patch('away_from_home.heartbeat.datetime')
+    def test_recv_with_payloads(self, dt):
+        dt.datetime.now.return_value = _TEST_TIMESTAMP
+        self._subject._recv_sock.recv.return_value = b'{"uuid": "some_uuid", "priority": 1, "store": {"a": {}}}'
         self._subject._handle_active = MagicMock()
+        store_consume = MagicMock()
+        other_consume = MagicMock()
+        self._subject.add_payload('store', MagicMock(), store_consume)
+        self._subject.add_payload('other', MagicMock(), other_consume)
+
+        self._subject._recv(test_mode=True)
+
+        assert_that(
+            (store_consume.mock_calls, other_consume.mock_calls),
+            equal_to(([call('some_uuid', {'a': {}})], []))
+        )
 
+    def test_expire(self):
+        self._subject._handle_active = MagicMock()
         self._subject._peers = copy.deepcopy(_PEERS)
+        self._subject._expiry_timers = {'other_uuid': 'timer'}
 
-        self._subject._expire(test_mode=True)
+        self._subject._expire('other_uuid', self._subject._peers['other_uuid'])
 
         assert_that(
-            time.mock_calls,
+            (self._subject._peers, self._subject._expiry_timers),
+            equal_to(({'some_uuid': _PEER}, {}))
+        )
+
+        assert_that(
+            self._subject._handle_active.mock_calls,
             equal_to([
-                call.sleep(1)
+                call()
             ])
         )
 
+    def test_expire_heard_from_since(self):
+        self._subject._handle_active = MagicMock()
+        self._subject._peers = copy.deepcopy(_PEERS)
+
+        self._subject._expire('other_uuid', _PEERS['other_uuid'])
+
+        assert_that(
+            self._subject._peers,
+            equal_to(_PEERS)
+        )
+
+        assert_that(
+            self._subject._handle_active.mock_calls,
+            equal_to([])
+        )
+
     def test_start(self):
         self._subject._setup_sockets = MagicMock()
         self._subject._recv_thread = MagicMock()
         self._subject._send_thread = MagicMock()
-        self._subject._expire_thread = MagicMock()
 
         self._subject.start()
 
@@ -181,16 +318,13 @@ class HeartBeatTest(unittest.TestCase):
         )
 
         assert_that(
-            self._subject._expire_thread.mock_calls,
-            equal_to([
-                call.start()
-            ])
+            self._subject._timer_wheel.mock_calls,
+            equal_to([])
         )
 
     def test_stop(self):
         self._subject._recv_thread = MagicMock()
         self._subject._send_thread = MagicMock()
-        self._subject._expire_thread = MagicMock()
 
         self._subject.stop()
 
@@ -212,10 +346,3 @@ class HeartBeatTest(unittest.TestCase):
                 call.join()
             ])
         )
-
-        assert_that(
-            self._subject._expire_thread.mock_calls,
-            equal_to([
-                call.join()
-            ])
-        )
@@ -0,0 +1,136 @@
+from collections import deque
+from threading import RLock
+
+import numpy as np
+
+_TIMESTAMP = 0
+_TEMPERATURE = 1
+_HUMIDITY = 2
+_WIND_SPEED = 3
+
+
+class WeatherHistory(object):
+    # a fixed-capacity ring buffer of (timestamp, temperature, humidity, wind_speed) samples held in one preallocated
+    # array, so memory is bounded by capacity regardless of uptime; temperature mean, min / max and trend (the least
+    # squares slope) are maintained incrementally, min / max through monotonic deques of sample sequence numbers
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1, got {0}'.format(capacity))
+
+        self._capacity = capacity
+
+        self._samples = np.zeros((capacity, 4), dtype=np.float64)
+        self._count = 0
+        self._appended = 0
+
+        self._min_sequences = deque(maxlen=capacity)
+        self._max_sequences = deque(maxlen=capacity)
+
+        # running sums for the mean and trend; x is seconds since _base, re-based whenever the buffer wraps to keep
+        # the sums small and stop floating point error accumulating
+        self._base = None
+        self._sum_x = 0.0
+        self._sum_xx = 0.0
+        self._sum_y = 0.0
+        self._sum_xy = 0.0
+
+        self._lock = RLock()
+
+    def __len__(self):
+        return self._count
+
+    def _temperature(self, sequence):
+        return self._samples[sequence % self._capacity, _TEMPERATURE]
+
+    def _rebase(self):
+        samples = self.samples()
+
+        self._base = samples[0, _TIMESTAMP]
+        x = samples[:, _TIMESTAMP] - self._base
+        y = samples[:, _TEMPERATURE]
+
+        self._sum_x = float(x.sum())
+        self._sum_xx = float((x * x).sum())
+        self._sum_y = float(y.sum())
+        self._sum_xy = float((x * y).sum())
+
+    def append(self, timestamp, temperature, humidity, wind_speed):
+        with self._lock:
+            sequence = self._appended
+            index = sequence % self._capacity
+
+            if self._count == self._capacity:
+                old_x = self._samples[index, _TIMESTAMP] - self._base
+                old_y = self._samples[index, _TEMPERATURE]
+
+                self._sum_x -= old_x
+                self._sum_xx -= old_x * old_x
+                self._sum_y -= old_y
+                self._sum_xy -= old_x * old_y
+            else:
+                self._count += 1
+
+            if self._base is None:
+                self._base = timestamp
+
+            self._samples[index] = (timestamp, temperature, humidity, wind_speed)
+            self._appended += 1
+
+            x = timestamp - self._base
+            self._sum_x += x
+            self._sum_xx += x * x
+            self._sum_y += temperature
+            self._sum_xy += x * temperature
+
+            oldest = self._appended - self._count
+
+            for sequences, beaten in [
+                (self._min_sequences, lambda other: self._temperature(other) >= temperature),
+                (self._max_sequences, lambda other: self._temperature(other) <= temperature),
+            ]:
+                while len(sequences) > 0 and sequences[0] < oldest:
+                    sequences.popleft()
+
+                while len(sequences) > 0 and beaten(sequences[-1]):
+                    sequences.pop()
+
+                sequences.append(sequence)
+
+            if index == self._capacity - 1:
+                self._rebase()
+
+    @property
+    def mean(self):
+        with self._lock:
+            return self._sum_y / self._count if self._count > 0 else None
+
+    @property
+    def minimum(self):
+        with self._lock:
+            return float(self._temperature(self._min_sequences[0])) if self._count > 0 else None
+
+    @property
+    def maximum(self):
+        with self._lock:
+            return float(self._temperature(self._max_sequences[0])) if self._count > 0 else None
+
+    @property
+    def trend(self):
+        # degrees per hour; None until there are two samples at different times
+        with self._lock:
+            n = self._count
+            denominator = n * self._sum_xx - self._sum_x * self._sum_x
+            if n < 2 or denominator <= 0:
+                return None
+
+            return (n * self._sum_xy - self._sum_x * self._sum_y) / denominator * 3600
+
+    def samples(self):
+        # oldest first, as a copy
+        with self._lock:
+            if self._count < self._capacity:
+                return self._samples[:self._count].copy()
+
+            index = self._appended % self._capacity
+
+            return np.concatenate((self._samples[index:], self._samples[:index]))
@@ -0,0 +1,79 @@
+import unittest
+
+import numpy as np
+from hamcrest import assert_that, equal_to, close_to, calling, raises
+
+from away_from_home.history import WeatherHistory
+
+_TEST_TIME = 666230400.0
+
+
+class WeatherHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self._subject = WeatherHistory(capacity=4)
+        self._appended = []
+
+    def _append(self, *temperatures):
+        for temperature in temperatures:
+            self._subject.append(_TEST_TIME + len(self._appended) * 300, temperature, 25.0, 5.0)
+            self._appended.append(temperature)
+
+    def test_invalid_capacity(self):
+        assert_that(
+            calling(WeatherHistory).with_args(0),
+            raises(ValueError)
+        )
+
+    def test_empty(self):
+        assert_that(
+            (len(self._subject), self._subject.mean, self._subject.minimum, self._subject.maximum, self._subject.trend),
+            equal_to((0, None, None, None, None))
+        )
+
+    def test_partially_filled(self):
+        self._append(30.0, 28.0, 29.0)
+
+        assert_that(
+            (len(self._subject), self._subject.mean, self._subject.minimum, self._subject.maximum),
+            equal_to((3, 29.0, 28.0, 30.0))
+        )
+
+    def test_wraps_and_evicts(self):
+        self._append(35.0, 20.0, 28.0, 29.0, 30.0, 31.0)
+
+        assert_that(
+            (len(self._subject), self._subject.mean, self._subject.minimum, self._subject.maximum),
+            equal_to((4, 29.5, 28.0, 31.0))
+        )
+
+        assert_that(
+            self._subject.samples()[:, 1].tolist(),
+            equal_to([28.0, 29.0, 30.0, 31.0])
+        )
+
+    def test_trend(self):
+        self._append(20.0, 21.0, 22.0, 23.0, 24.0, 25.0)
+
+        # one degree every five minutes
+        assert_that(
+            self._subject.trend,
+            close_to(12.0, 1e-6)
+        )
+
+    def test_matches_brute_force(self):
+        random = np.random.RandomState(1991)
+        subject = WeatherHistory(capacity=24)
+        temperatures = random.uniform(15, 40, 1000)
+
+        for i, temperature in enumerate(temperatures):
+            subject.append(_TEST_TIME + i * 300, temperature, 25.0, 5.0)
+
+            window = temperatures[max(0, i - 23):i + 1]
+            times = (np.arange(max(0, i - 23), i + 1) * 300).astype(np.float64)
+
+            assert_that(subject.mean, close_to(window.mean(), 1e-6))
+            assert_that(subject.minimum, equal_to(window.min()))
+            assert_that(subject.maximum, equal_to(window.max()))
+
+            if len(window) > 1:
+                assert_that(subject.trend, close_to(np.polyfit(times, window, 1)[0] * 3600, 1e-6))
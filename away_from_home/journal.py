@@ -0,0 +1,126 @@
+import json
+import os
+from logging import getLogger
+from threading import RLock
+
+
+class Journal(object):
+    # durable key / value state as an append-only log of [sequence, key, value] JSON lines beside a compacted snapshot
+    # of everything up to some sequence; every compact_every appends the snapshot is rewritten (atomically, by rename)
+    # and the log truncated, so recovery reads one small file and replays at most compact_every lines
+    #
+    # appends are flushed to the OS, which survives the process being restarted; with sync they're also fsync'd, which
+    # survives power loss at the cost of a write to the SD card per change
+    def __init__(self, path, compact_every=1000, sync=False):
+        self._log_path = path + '.log'
+        self._snapshot_path = path + '.snapshot'
+        self._compact_every = compact_every
+        self._sync = sync
+
+        self._data = {}
+        self._sequence = 0
+        self._appended = 0
+        self._file = None
+
+        self._lock = RLock()
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug('__init__(); path=%r, compact_every=%s, sync=%s', path, compact_every, sync)
+
+    def _write(self, f, line):
+        f.write(line + '\n')
+        f.flush()
+
+        if self._sync:
+            os.fsync(f.fileno())
+
+    def _read_snapshot(self):
+        try:
+            with open(self._snapshot_path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            self._logger.warning('_read_snapshot(); ignoring unreadable snapshot; error=%r', e)
+            return
+
+        self._sequence = snapshot['sequence']
+        self._data = snapshot['data']
+
+    def _replay(self):
+        try:
+            f = open(self._log_path)
+        except FileNotFoundError:
+            return 0, False
+
+        replayed = 0
+        torn = False
+
+        with f:
+            for line in f:
+                try:
+                    sequence, key, value = json.loads(line)
+                except ValueError:
+                    # most likely the last line, torn by a crash part way through writing it
+                    self._logger.warning('_replay(); skipping unreadable line=%r', line)
+                    torn = True
+                    continue
+
+                # already in the snapshot (we stopped between writing it and truncating the log)
+                if sequence <= self._sequence:
+                    continue
+
+                self._data[key] = value
+                self._sequence = sequence
+                replayed += 1
+
+        return replayed, torn
+
+    def load(self):
+        # recovers and returns the state, then opens the log for appending; call once, before append()
+        with self._lock:
+            self._read_snapshot()
+            replayed, torn = self._replay()
+
+            self._file = open(self._log_path, 'a')
+            self._appended = replayed
+
+            # otherwise the next append would be glued onto the torn line
+            if torn:
+                self.compact()
+
+            self._logger.info('load(); keys=%s, sequence=%s, replayed=%s', len(self._data), self._sequence, replayed)
+
+            return dict(self._data)
+
+    def append(self, key, value):
+        with self._lock:
+            self._sequence += 1
+            self._data[key] = value
+
+            self._write(self._file, json.dumps([self._sequence, key, value]))
+            self._appended += 1
+
+            if self._appended >= self._compact_every:
+                self.compact()
+
+    def compact(self):
+        with self._lock:
+            temporary_path = self._snapshot_path + '.tmp'
+
+            with open(temporary_path, 'w') as f:
+                self._write(f, json.dumps({'sequence': self._sequence, 'data': self._data}))
+
+            os.replace(temporary_path, self._snapshot_path)
+
+            self._file.close()
+            self._file = open(self._log_path, 'w')
+            self._appended = 0
+
+            self._logger.debug('compact(); keys=%s, sequence=%s', len(self._data), self._sequence)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from hamcrest import assert_that, equal_to
+
+from away_from_home.journal import Journal
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._path = os.path.join(self._tempdir, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+    def _journal(self, compact_every=1000):
+        journal = Journal(self._path, compact_every=compact_every)
+        self.addCleanup(journal.close)
+
+        return journal
+
+    def _lines(self):
+        with open(self._path + '.log') as f:
+            return f.readlines()
+
+    def test_load_empty(self):
+        assert_that(
+            self._journal().load(),
+            equal_to({})
+        )
+
+    def test_replays_log(self):
+        journal = self._journal()
+        journal.load()
+        journal.append('a', 1)
+        journal.append('b', [1.0, 2.0])
+        journal.append('a', 'on')
+        journal.close()
+
+        assert_that(
+            self._journal().load(),
+            equal_to({'a': 'on', 'b': [1.0, 2.0]})
+        )
+
+    def test_compacts(self):
+        journal = self._journal(compact_every=3)
+        journal.load()
+        for i in range(0, 4):
+            journal.append('a', i)
+        journal.close()
+
+        assert_that(
+            self._lines(),
+            equal_to(['[4, "a", 3]\n'])
+        )
+
+        assert_that(
+            self._journal().load(),
+            equal_to({'a': 3})
+        )
+
+    def test_skips_entries_already_in_snapshot(self):
+        journal = self._journal()
+        journal.load()
+        journal.append('a', 1)
+        journal.append('a', 2)
+
+        # as if we'd stopped after writing the snapshot but before truncating the log
+        with open(self._path + '.log') as f:
+            lines = f.read()
+        journal.compact()
+        journal.close()
+        with open(self._path + '.log', 'w') as f:
+            f.write(lines)
+
+        journal = self._journal()
+
+        assert_that(
+            (journal.load(), journal._sequence),
+            equal_to(({'a': 2}, 2))
+        )
+
+    def test_skips_torn_line(self):
+        journal = self._journal()
+        journal.load()
+        journal.append('a', 1)
+        journal.close()
+
+        with open(self._path + '.log', 'a') as f:
+            f.write('[2, "a", ')
+
+        journal = self._journal()
+
+        assert_that(
+            journal.load(),
+            equal_to({'a': 1})
+        )
+
+        journal.append('b', 2)
+        journal.close()
+
+        assert_that(
+            self._journal().load(),
+            equal_to({'a': 1, 'b': 2})
+        )
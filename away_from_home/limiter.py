@@ -0,0 +1,107 @@
+import sqlite3
+import time
+from contextlib import closing
+from logging import getLogger
+from threading import RLock
+
+# below this fraction of the bucket remaining, callers asking for a stretched period get a proportionally longer one
+_LOW_HEADROOM = 0.5
+_MAX_STRETCH = 4.0
+
+_CREATE_TABLE = 'CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)'
+_SELECT = 'SELECT tokens, updated FROM buckets WHERE name = ?'
+_UPSERT = 'INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)'
+
+
+class RateLimiter(object):
+    # a token bucket refilled at rate tokens per second up to burst; with a path the bucket lives in a SQLite file and
+    # every update happens inside an immediate (write-locked) transaction, so all local processes share one budget
+    def __init__(self, rate, burst, path=None, name='owm'):
+        self._rate = float(rate)
+        self._burst = float(burst)
+        self._path = path
+        self._name = name
+
+        self._lock = RLock()
+        self._tokens = self._burst
+        self._updated = None
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug('__init__(); rate=%s, burst=%s, path=%r, name=%r', rate, burst, path, name)
+
+        if self._path is not None:
+            with closing(sqlite3.connect(self._path)) as conn:
+                conn.execute(_CREATE_TABLE)
+
+    def _refill(self, tokens, updated, timestamp):
+        if updated is None:
+            return self._burst
+
+        # max() guards against the clock stepping backwards
+        return min(self._burst, tokens + max(0.0, timestamp - updated) * self._rate)
+
+    def _take(self, count, timestamp):
+        with self._lock:
+            if self._path is None:
+                tokens = self._refill(self._tokens, self._updated, timestamp)
+                taken = tokens >= count
+                self._tokens = tokens - count if taken else tokens
+                self._updated = timestamp
+
+                return taken, self._tokens
+
+            with closing(sqlite3.connect(self._path, isolation_level=None, timeout=10)) as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    row = conn.execute(_SELECT, (self._name,)).fetchone()
+                    tokens = self._refill(row[0], row[1], timestamp) if row is not None else self._burst
+                    taken = tokens >= count
+                    tokens = tokens - count if taken else tokens
+                    conn.execute(_UPSERT, (self._name, tokens, timestamp))
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+
+                return taken, tokens
+
+    @property
+    def headroom(self):
+        _, tokens = self._take(0, time.time())
+
+        return tokens / self._burst
+
+    def acquire(self, blocking=True, timeout=None):
+        deadline = time.time() + timeout if timeout is not None else None
+
+        while True:
+            timestamp = time.time()
+            taken, tokens = self._take(1, timestamp)
+            if taken:
+                self._logger.debug('acquire(); tokens=%s', tokens)
+                return True
+
+            if not blocking:
+                self._logger.debug('acquire(); budget exhausted')
+                return False
+
+            wait = (1 - tokens) / self._rate
+            if deadline is not None:
+                if timestamp >= deadline:
+                    self._logger.debug('acquire(); timed out')
+                    return False
+
+                wait = min(wait, deadline - timestamp)
+
+            time.sleep(wait)
+
+    def stretch(self, period):
+        headroom = self.headroom
+        if headroom >= _LOW_HEADROOM:
+            return period
+
+        stretched = period * min(_MAX_STRETCH, _LOW_HEADROOM / max(headroom, _LOW_HEADROOM / _MAX_STRETCH))
+
+        self._logger.info('stretch(); headroom=%.2f, period=%s, stretched=%s', headroom, period, stretched)
+
+        return stretched
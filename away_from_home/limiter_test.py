@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from hamcrest import assert_that, equal_to, close_to
+from mock import patch, call
+
+from away_from_home.limiter import RateLimiter
+
+_TEST_TIME = 666230400.0
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self._subject = RateLimiter(rate=1, burst=4)
+
+    def test_take(self):
+        assert_that(
+            [self._subject._take(1, _TEST_TIME)[0] for _ in range(0, 5)],
+            equal_to([True, True, True, True, False])
+        )
+
+    def test_take_refills(self):
+        for _ in range(0, 4):
+            self._subject._take(1, _TEST_TIME)
+
+        assert_that(
+            self._subject._take(1, _TEST_TIME + 1.5),
+            equal_to((True, 0.5))
+        )
+
+    def test_take_refill_capped_at_burst(self):
+        self._subject._take(1, _TEST_TIME)
+
+        assert_that(
+            self._subject._take(0, _TEST_TIME + 100),
+            equal_to((True, 4.0))
+        )
+
+    def test_take_clock_goes_backwards(self):
+        self._subject._take(4, _TEST_TIME)
+
+        assert_that(
+            self._subject._take(1, _TEST_TIME - 100),
+            equal_to((False, 0.0))
+        )
+
+    @patch('away_from_home.limiter.time')
+    def test_acquire_non_blocking(self, time):
+        time.time.return_value = _TEST_TIME
+        self._subject._take(4, _TEST_TIME)
+
+        assert_that(
+            self._subject.acquire(blocking=False),
+            equal_to(False)
+        )
+
+        assert_that(
+            time.sleep.mock_calls,
+            equal_to([])
+        )
+
+    @patch('away_from_home.limiter.time')
+    def test_acquire_waits_for_token(self, time):
+        time.time.side_effect = [_TEST_TIME, _TEST_TIME + 1]
+        self._subject._take(4, _TEST_TIME)
+
+        assert_that(
+            self._subject.acquire(),
+            equal_to(True)
+        )
+
+        assert_that(
+            time.sleep.mock_calls,
+            equal_to([
+                call(1.0)
+            ])
+        )
+
+    @patch('away_from_home.limiter.time')
+    def test_acquire_timeout(self, time):
+        time.time.side_effect = [_TEST_TIME, _TEST_TIME, _TEST_TIME + 0.5]
+        self._subject._take(4, _TEST_TIME)
+
+        assert_that(
+            self._subject.acquire(timeout=0.5),
+            equal_to(False)
+        )
+
+        assert_that(
+            time.sleep.mock_calls,
+            equal_to([
+                call(0.5)
+            ])
+        )
+
+    def test_stretch_plenty_of_headroom(self):
+        assert_that(
+            self._subject.stretch(300),
+            equal_to(300)
+        )
+
+    @patch('away_from_home.limiter.time')
+    def test_stretch_low_headroom(self, time):
+        time.time.return_value = _TEST_TIME
+        self._subject._take(3, _TEST_TIME)
+
+        assert_that(
+            self._subject.headroom,
+            close_to(0.25, 0.0001)
+        )
+
+        assert_that(
+            self._subject.stretch(300),
+            close_to(600, 0.0001)
+        )
+
+    @patch('away_from_home.limiter.time')
+    def test_stretch_capped(self, time):
+        time.time.return_value = _TEST_TIME
+        self._subject._take(4, _TEST_TIME)
+
+        assert_that(
+            self._subject.stretch(300),
+            close_to(1200, 0.0001)
+        )
+
+
+class SharedRateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._path = os.path.join(self._tempdir, 'budget.db')
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+    def test_budget_shared_between_instances(self):
+        first = RateLimiter(rate=1, burst=2, path=self._path)
+        second = RateLimiter(rate=1, burst=2, path=self._path)
+
+        assert_that(
+            [first._take(1, _TEST_TIME)[0], second._take(1, _TEST_TIME)[0], first._take(1, _TEST_TIME)[0]],
+            equal_to([True, True, False])
+        )
+
+        assert_that(
+            second._take(1, _TEST_TIME + 1),
+            equal_to((True, 0.0))
+        )
@@ -0,0 +1,63 @@
+import logging
+import os
+import signal
+from logging import getLogger
+
+# messages are passed to the logger as a format string plus arguments (rather than pre-formatted with str.format) so
+# that nothing is built unless a handler is actually going to emit the record; Logger.isEnabledFor is cached per
+# logger, so a disabled debug() call costs one method call and a dict lookup
+
+_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_TRACE_LEVEL = logging.DEBUG
+_DEFAULT_LEVEL = logging.INFO
+
+
+def setup(names, level=_DEFAULT_LEVEL, handler=None):
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(_FORMAT))
+
+    for name in names:
+        logger = getLogger(name)
+        logger.setLevel(level)
+        logger.addHandler(handler)
+
+    return handler
+
+
+def set_tracing(names, enabled):
+    for name in names:
+        getLogger(name).setLevel(_TRACE_LEVEL if enabled else _DEFAULT_LEVEL)
+
+
+def read_traced_names(path):
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, 'r') as f:
+        return {x.strip() for x in f.readlines() if x.strip() != '' and not x.strip().startswith('#')}
+
+
+def apply_tracing(path, names):
+    traced_names = read_traced_names(path)
+
+    for name in names:
+        set_tracing([name], name in traced_names)
+
+    return traced_names
+
+
+# turns per-class debug tracing on and off at runtime; write the names of the classes (loggers) to trace into path, one
+# per line, and send the process signum (SIGUSR1 by default) to apply it- an empty or missing file turns tracing off
+def install_tracing_switch(path, names, signum=signal.SIGUSR1):
+    logger = getLogger('away_from_home')
+
+    def handler(signum, frame):
+        traced_names = apply_tracing(path, names)
+
+        logger.info('tracing enabled for %s', sorted(traced_names))
+
+    signal.signal(signum, handler)
+
+    return apply_tracing(path, names)
@@ -0,0 +1,110 @@
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+
+from hamcrest import assert_that, equal_to
+from mock import patch, MagicMock, call
+
+from away_from_home.log import setup, set_tracing, read_traced_names, apply_tracing, install_tracing_switch
+
+_NAMES = ['LogTestWeather', 'LogTestComposer']
+
+
+class LogTest(unittest.TestCase):
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._path = os.path.join(self._tempdir, 'trace')
+
+        for name in _NAMES:
+            logging.getLogger(name).setLevel(logging.INFO)
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+    def test_setup(self):
+        handler = MagicMock()
+
+        assert_that(
+            setup(_NAMES, handler=handler),
+            equal_to(handler)
+        )
+
+        for name in _NAMES:
+            assert_that(
+                logging.getLogger(name).level,
+                equal_to(logging.INFO)
+            )
+
+            assert_that(
+                handler in logging.getLogger(name).handlers,
+                equal_to(True)
+            )
+
+            logging.getLogger(name).removeHandler(handler)
+
+    def test_set_tracing(self):
+        set_tracing(_NAMES[:1], True)
+
+        assert_that(
+            logging.getLogger(_NAMES[0]).isEnabledFor(logging.DEBUG),
+            equal_to(True)
+        )
+
+        set_tracing(_NAMES[:1], False)
+
+        assert_that(
+            logging.getLogger(_NAMES[0]).isEnabledFor(logging.DEBUG),
+            equal_to(False)
+        )
+
+    def test_read_traced_names_missing(self):
+        assert_that(
+            read_traced_names(self._path),
+            equal_to(set())
+        )
+
+    def test_read_traced_names(self):
+        with open(self._path, 'w') as f:
+            f.write('# some comment\nLogTestWeather\n\n')
+
+        assert_that(
+            read_traced_names(self._path),
+            equal_to({'LogTestWeather'})
+        )
+
+    def test_apply_tracing(self):
+        with open(self._path, 'w') as f:
+            f.write('LogTestComposer\n')
+
+        apply_tracing(self._path, _NAMES)
+
+        assert_that(
+            [logging.getLogger(name).isEnabledFor(logging.DEBUG) for name in _NAMES],
+            equal_to([False, True])
+        )
+
+    @patch('away_from_home.log.signal')
+    def test_install_tracing_switch(self, signal_module):
+        signal_module.SIGUSR1 = signal.SIGUSR1
+
+        install_tracing_switch(self._path, _NAMES, signum=signal.SIGUSR1)
+
+        assert_that(
+            signal_module.mock_calls,
+            equal_to([
+                call.signal(signal.SIGUSR1, signal_module.signal.call_args[0][1])
+            ])
+        )
+
+        with open(self._path, 'w') as f:
+            f.write('LogTestWeather\n')
+
+        signal_module.signal.call_args[0][1](signal.SIGUSR1, None)
+
+        assert_that(
+            [logging.getLogger(name).isEnabledFor(logging.DEBUG) for name in _NAMES],
+            equal_to([True, False])
+        )
@@ -0,0 +1,195 @@
+import datetime
+import operator
+
+# a control policy is a list of rules, tried in order; the first whose conditions all hold gives the action, and if
+# none do the aircon is left as it is, e.g.
+#
+#     [
+#         {'action': 'on', 'when': {'temperature': {'>=': 29}}},
+#         {'action': 'on', 'when': {'apparent_temperature': {'>=': 31}, 'time': {'between': ['10:00', '20:00']}}},
+#         {'action': 'off', 'when': {'temperature': {'<=': 27}}},
+#         {'action': 'off', 'when': {'daylight': False, 'last_action': 'on'}},
+#     ]
+#
+# a condition is either a bare value (meaning ==) or a dict of operator to operand, all of which must hold; the policy
+# is checked and compiled to closures once, so evaluating it is a handful of attribute reads and comparisons
+
+ACTIONS = ('on', 'off')
+
+_COMPARISONS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+def _minutes_of_day(value):
+    return value.hour * 60 + value.minute
+
+
+def _parse_time(value):
+    # 'HH:MM' to minutes past midnight
+    try:
+        hours, minutes = [int(x) for x in value.split(':')]
+    except (AttributeError, ValueError):
+        raise ValueError('expected a time as HH:MM, got {0!r}'.format(value))
+
+    return hours * 60 + minutes
+
+
+def _minutes_between(start, end):
+    return (end - start).total_seconds() / 60
+
+
+# field -> (getter(snapshot, now, last_action, forecast_temperature), operand parser); closures below take the same
+# four arguments, abbreviated
+_FIELDS = {
+    'temperature': (lambda s, n, a, f: s.temperature, float),
+    'apparent_temperature': (lambda s, n, a, f: s.apparent_temperature, float),
+    'humidity': (lambda s, n, a, f: s.humidity, float),
+    'wind_speed': (lambda s, n, a, f: s.wind_speed, float),
+    'forecast_temperature': (lambda s, n, a, f: f, float),
+    'time': (lambda s, n, a, f: _minutes_of_day(n), _parse_time),
+    'daylight': (lambda s, n, a, f: s.sunrise <= n < s.sunset, bool),
+    'minutes_since_sunrise': (lambda s, n, a, f: _minutes_between(s.sunrise, n), float),
+    'minutes_to_sunset': (lambda s, n, a, f: _minutes_between(n, s.sunset), float),
+    'last_action': (lambda s, n, a, f: a, lambda x: x),
+}
+
+
+def _compile_between(field, get, operand, parse):
+    if not isinstance(operand, (list, tuple)) or len(operand) != 2:
+        raise ValueError('{0}: between expects [low, high], got {1!r}'.format(field, operand))
+
+    low, high = parse(operand[0]), parse(operand[1])
+
+    # a time range may wrap past midnight (e.g. ['22:00', '06:00'])
+    wraps = field == 'time' and low > high
+
+    def check(s, n, a, f):
+        x = get(s, n, a, f)
+        if x is None:
+            return False
+
+        return not (high < x < low) if wraps else low <= x <= high
+
+    return check
+
+
+def _compile_all(checks):
+    return lambda s, n, a, f: all(check(s, n, a, f) for check in checks)
+
+
+def _compile_in(get, values):
+    return lambda s, n, a, f: get(s, n, a, f) in values
+
+
+def _compile_comparison(get, compare, value):
+    if compare in (operator.eq, operator.ne):
+        return lambda s, n, a, f: compare(get(s, n, a, f), value)
+
+    def check(s, n, a, f):
+        x = get(s, n, a, f)
+
+        # a missing value (e.g. no forecast) never satisfies an ordering
+        return x is not None and compare(x, value)
+
+    return check
+
+
+def _compile_condition(field, condition):
+    if field not in _FIELDS:
+        raise ValueError('unknown field {0!r}; expected one of {1}'.format(field, sorted(_FIELDS)))
+
+    get, parse = _FIELDS[field]
+
+    if not isinstance(condition, dict):
+        condition = {'==': condition}
+
+    checks = []
+    for op, operand in condition.items():
+        if op == 'between':
+            checks.append(_compile_between(field, get, operand, parse))
+        elif op == 'in':
+            checks.append(_compile_in(get, frozenset(parse(x) for x in operand)))
+        elif op in _COMPARISONS:
+            checks.append(_compile_comparison(get, _COMPARISONS[op], parse(operand) if operand is not None else None))
+        else:
+            raise ValueError('{0}: unknown operator {1!r}'.format(field, op))
+
+    if len(checks) == 1:
+        return checks[0]
+
+    return _compile_all(checks)
+
+
+def _compile_rule(index, rule):
+    action = rule.get('action')
+    if action not in ACTIONS:
+        raise ValueError('rule {0}: action must be one of {1}, got {2!r}'.format(index, ACTIONS, action))
+
+    unknown = set(rule) - {'action', 'when'}
+    if len(unknown) > 0:
+        raise ValueError('rule {0}: unknown keys {1}'.format(index, sorted(unknown)))
+
+    try:
+        conditions = [_compile_condition(k, v) for k, v in sorted(rule.get('when', {}).items())]
+    except ValueError as e:
+        raise ValueError('rule {0}: {1}'.format(index, e))
+
+    return action, conditions
+
+
+class Policy(object):
+    __slots__ = ('_rules', 'fields')
+
+    def __init__(self, rules, fields):
+        self._rules = rules
+
+        # every field any rule refers to, so callers can skip working out what isn't needed
+        self.fields = fields
+
+    def __repr__(self):
+        return '{0}(rules={1}, fields={2})'.format(self.__class__.__name__, len(self._rules), sorted(self.fields))
+
+    def decide(self, snapshot, now=None, last_action=None, forecast_temperature=None):
+        # 'on', 'off' or None (leave it as it is)
+        now = now if now is not None else datetime.datetime.now()
+
+        for action, conditions in self._rules:
+            for condition in conditions:
+                if not condition(snapshot, now, last_action, forecast_temperature):
+                    break
+            else:
+                return action
+
+        return None
+
+
+def compile_policy(rules):
+    # raises ValueError on anything it doesn't understand, so a bad policy fails when config loads rather than later
+    if not isinstance(rules, (list, tuple)):
+        raise ValueError('a policy is a list of rules, got {0!r}'.format(rules))
+
+    compiled = []
+    fields = set()
+
+    for index, rule in enumerate(rules):
+        if not isinstance(rule, dict):
+            raise ValueError('rule {0}: expected a dict, got {1!r}'.format(index, rule))
+
+        compiled.append(_compile_rule(index, rule))
+        fields.update(rule.get('when', {}).keys())
+
+    return Policy(compiled, frozenset(fields))
+
+
+def threshold_policy(on_threshold, off_threshold):
+    # Composer's built-in behaviour, as a policy
+    return compile_policy([
+        {'action': 'on', 'when': {'temperature': {'>=': on_threshold}}},
+        {'action': 'off', 'when': {'temperature': {'<=': off_threshold}}},
+    ])
@@ -0,0 +1,106 @@
+import datetime
+import unittest
+
+from hamcrest import assert_that, equal_to, calling, raises
+
+from away_from_home.policy import compile_policy, threshold_policy
+from away_from_home.snapshot import WeatherSnapshot
+
+_NOON = datetime.datetime(year=1991, month=2, day=6, hour=12)
+
+
+def _snapshot(temperature, apparent_temperature=None):
+    return WeatherSnapshot(
+        timestamp=_NOON,
+        temperature=temperature,
+        humidity=25.0,
+        wind_speed=5.0,
+        apparent_temperature=apparent_temperature if apparent_temperature is not None else temperature,
+        sunrise=_NOON.replace(hour=6),
+        sunset=_NOON.replace(hour=19, minute=30),
+    )
+
+
+class PolicyTest(unittest.TestCase):
+    def test_threshold_policy(self):
+        subject = threshold_policy(29, 27)
+
+        assert_that(
+            [subject.decide(_snapshot(x), _NOON) for x in [30, 29, 28, 27, 26]],
+            equal_to(['on', 'on', None, 'off', 'off'])
+        )
+
+    def test_first_match_wins(self):
+        subject = compile_policy([
+            {'action': 'off', 'when': {'last_action': 'on', 'daylight': False}},
+            {'action': 'on', 'when': {'apparent_temperature': {'>': 30}}},
+        ])
+
+        assert_that(
+            [
+                subject.decide(_snapshot(25, 31), _NOON, 'on'),
+                subject.decide(_snapshot(25, 31), _NOON.replace(hour=20), 'on'),
+                subject.decide(_snapshot(25, 31), _NOON.replace(hour=20), 'off'),
+            ],
+            equal_to(['on', 'off', 'on'])
+        )
+
+    def test_time_between(self):
+        subject = compile_policy([
+            {'action': 'on', 'when': {'time': {'between': ['10:00', '18:00']}}},
+            {'action': 'off', 'when': {'time': {'between': ['22:00', '06:00']}}},
+        ])
+
+        assert_that(
+            [subject.decide(_snapshot(20), _NOON.replace(hour=x)) for x in [9, 10, 18, 20, 23, 3, 6]],
+            equal_to([None, 'on', 'on', None, 'off', 'off', 'off'])
+        )
+
+    def test_sun(self):
+        subject = compile_policy([
+            {'action': 'on', 'when': {'minutes_to_sunset': {'<=': 60, '>': 0}}},
+            {'action': 'off', 'when': {'minutes_since_sunrise': {'<': 30}}},
+        ])
+
+        assert_that(
+            [subject.decide(_snapshot(20), x) for x in [
+                _NOON.replace(hour=19), _NOON.replace(hour=6, minute=10), _NOON, _NOON.replace(hour=20)
+            ]],
+            equal_to(['on', 'off', None, None])
+        )
+
+    def test_forecast_temperature_missing(self):
+        subject = compile_policy([
+            {'action': 'on', 'when': {'forecast_temperature': {'>=': 29}}},
+        ])
+
+        assert_that(
+            (subject.decide(_snapshot(20), _NOON), subject.decide(_snapshot(20), _NOON, None, 30.0), subject.fields),
+            equal_to((None, 'on', frozenset(['forecast_temperature'])))
+        )
+
+    def test_in(self):
+        subject = compile_policy([
+            {'action': 'off', 'when': {'last_action': {'in': [None, 'on']}}},
+        ])
+
+        assert_that(
+            [subject.decide(_snapshot(20), _NOON, x) for x in [None, 'on', 'off']],
+            equal_to(['off', 'off', None])
+        )
+
+    def test_invalid(self):
+        for rules in [
+            {'action': 'on'},
+            [{'action': 'sideways'}],
+            [{'action': 'on', 'when': {'pressure': {'>': 1}}}],
+            [{'action': 'on', 'when': {'temperature': {'~': 1}}}],
+            [{'action': 'on', 'when': {'temperature': {'>': 'hot'}}}],
+            [{'action': 'on', 'when': {'time': {'between': ['noon', '13:00']}}}],
+            [{'action': 'on', 'when': {'time': {'between': '12:00'}}}],
+            [{'action': 'on', 'unless': {}}],
+        ]:
+            assert_that(
+                calling(compile_policy).with_args(rules),
+                raises(ValueError)
+            )
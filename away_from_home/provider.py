@@ -0,0 +1,217 @@
+import datetime
+import time
+from concurrent.futures import Future, TimeoutError
+from logging import getLogger
+from threading import RLock, Thread
+
+from away_from_home.comfort import get_apparent_temperature
+from away_from_home.forecast import ForecastSeries
+from away_from_home.snapshot import WeatherSnapshot
+from away_from_home.tracing import span
+
+_CLOSED = 'closed'
+_OPEN = 'open'
+_HALF_OPEN = 'half_open'
+
+
+def build_snapshot(weather, timestamp=None):
+    temperature = float(weather.get_temperature(unit='celsius').get('temp'))
+    humidity = float(weather.get_humidity())
+    wind_speed = float(weather.get_wind().get('speed'))
+
+    return WeatherSnapshot(
+        timestamp=timestamp if timestamp is not None else datetime.datetime.now(),
+        temperature=temperature,
+        humidity=humidity,
+        wind_speed=wind_speed,
+        apparent_temperature=get_apparent_temperature(
+            temperature, humidity, wind_speed,
+        ),
+        sunrise=datetime.datetime.fromtimestamp(weather.get_sunrise_time(timeformat='unix')),
+        sunset=datetime.datetime.fromtimestamp(weather.get_sunset_time(timeformat='unix')),
+    )
+
+
+def _run(future, method, args, kwargs):
+    try:
+        future.set_result(method(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+
+
+def call_with_timeout(timeout, method, *args, **kwargs):
+    # with a timeout, method runs on a (daemon) thread of its own and a TimeoutError is raised if it doesn't return in
+    # time; a call that hangs only ties up that thread
+    if timeout is None:
+        return method(*args, **kwargs)
+
+    future = Future()
+
+    thread = Thread(
+        target=_run,
+        args=(future, method, args, kwargs),
+    )
+    thread.daemon = True
+    thread.start()
+
+    return future.result(timeout=timeout)
+
+
+class WeatherProvider(object):
+    # whether fetch_forecast() is implemented
+    forecasts = False
+
+    def fetch(self, lat, lon):
+        raise NotImplementedError()
+
+    def fetch_forecast(self, lat, lon):
+        raise NotImplementedError()
+
+
+class OWMProvider(WeatherProvider):
+    forecasts = True
+
+    def __init__(self, owm, name='owm'):
+        self._owm = owm
+        self._name = name
+
+    def __repr__(self):
+        return '{0}(name={1})'.format(self.__class__.__name__, repr(self._name))
+
+    def fetch(self, lat, lon):
+        return build_snapshot(
+            self._owm.weather_at_coords(
+                lat=lat,
+                lon=lon,
+            ).get_weather()
+        )
+
+    def fetch_forecast(self, lat, lon):
+        weathers = self._owm.three_hours_forecast_at_coords(
+            lat=lat,
+            lon=lon,
+        ).get_forecast().get_weathers()
+
+        return ForecastSeries(
+            fetched=datetime.datetime.now(),
+            times=[x.get_reference_time(timeformat='unix') for x in weathers],
+            temperatures=[float(x.get_temperature(unit='celsius').get('temp')) for x in weathers],
+        )
+
+
+class CircuitBreaker(object):
+    # opens after failure_threshold consecutive failures, refusing calls for reset_timeout seconds; after that a single
+    # trial call is let through (half open) and either closes it again or re-opens it for another reset_timeout
+    def __init__(self, failure_threshold, reset_timeout):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+
+        self._state = _CLOSED
+        self._failures = 0
+        self._opened = None
+
+        self._lock = RLock()
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self, timestamp=None):
+        timestamp = timestamp if timestamp is not None else time.monotonic()
+
+        with self._lock:
+            if self._state == _CLOSED:
+                return True
+
+            if self._state == _OPEN and timestamp - self._opened >= self._reset_timeout:
+                self._state = _HALF_OPEN
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = _CLOSED
+            self._failures = 0
+            self._opened = None
+
+    def record_failure(self, timestamp=None):
+        timestamp = timestamp if timestamp is not None else time.monotonic()
+
+        with self._lock:
+            self._failures += 1
+
+            if self._state == _HALF_OPEN or self._failures >= self._failure_threshold:
+                self._state = _OPEN
+                self._opened = timestamp
+
+
+class ProviderChain(WeatherProvider):
+    # tries each provider in order (for a forecast, each that has one), skipping any whose circuit breaker is open;
+    # with a timeout each call runs on a thread of its own and is abandoned (and counted as a failure) if it doesn't
+    # return in time; a call that hangs only ties up its own (daemon) thread, so it can't hold up the fallback or the
+    # next tick
+    def __init__(self, providers, timeout=None, failure_threshold=3, reset_timeout=300):
+        self._providers = providers
+        self._timeout = timeout
+
+        self._breakers = [CircuitBreaker(failure_threshold, reset_timeout) for _ in providers]
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug(
+            '__init__(); providers=%s, timeout=%s, failure_threshold=%s, reset_timeout=%s',
+            providers, timeout, failure_threshold, reset_timeout
+        )
+
+    def __repr__(self):
+        return '{0}(providers={1})'.format(self.__class__.__name__, self._providers)
+
+    @property
+    def breakers(self):
+        return list(self._breakers)
+
+    @property
+    def forecasts(self):
+        return any(x.forecasts for x in self._providers)
+
+    def _call(self, provider, name, lat, lon):
+        with span('provider.' + name, provider=repr(provider)):
+            return call_with_timeout(self._timeout, getattr(provider, name), lat, lon)
+
+    def _first(self, name, lat, lon):
+        errors = []
+
+        for provider, breaker in zip(self._providers, self._breakers):
+            if name == 'fetch_forecast' and not provider.forecasts:
+                continue
+
+            if not breaker.allow():
+                self._logger.debug('%s(); skipping provider=%s; circuit open', name, provider)
+                errors.append('{0}: circuit open'.format(provider))
+                continue
+
+            try:
+                result = self._call(provider, name, lat, lon)
+            except TimeoutError:
+                breaker.record_failure()
+                self._logger.warning('%s(); provider=%s timed out after %ss', name, provider, self._timeout)
+                errors.append('{0}: timed out'.format(provider))
+                continue
+            except Exception as e:
+                breaker.record_failure()
+                self._logger.warning('%s(); provider=%s failed; error=%r', name, provider, e)
+                errors.append('{0}: {1!r}'.format(provider, e))
+                continue
+
+            breaker.record_success()
+
+            return result
+
+        raise ValueError('all weather providers failed; {0}'.format('; '.join(errors) or 'none able to'))
+
+    def fetch(self, lat, lon):
+        return self._first('fetch', lat, lon)
+
+    def fetch_forecast(self, lat, lon):
+        # shares the breakers with fetch(); a provider that's down is down for both
+        return self._first('fetch_forecast', lat, lon)
@@ -0,0 +1,194 @@
+import threading
+import unittest
+
+from hamcrest import assert_that, equal_to, calling, raises
+from mock import MagicMock, call
+
+from away_from_home.provider import CircuitBreaker, OWMProvider, ProviderChain
+
+_LAT = -31.923145
+_LON = 115.894571
+
+
+class OWMProviderTest(unittest.TestCase):
+    def test_fetch(self):
+        owm = MagicMock()
+        weather = owm.weather_at_coords.return_value.get_weather.return_value
+        weather.get_temperature.return_value = {'temp': 32}
+        weather.get_humidity.return_value = 25
+        weather.get_wind.return_value = {'speed': 5, 'deg': 330}
+        weather.get_sunrise_time.return_value = 1509743779
+        weather.get_sunset_time.return_value = 1509792245
+
+        snapshot = OWMProvider(owm).fetch(_LAT, _LON)
+
+        assert_that(
+            (snapshot.temperature, snapshot.humidity, snapshot.wind_speed, snapshot.apparent_temperature),
+            equal_to((32.0, 25.0, 5.0, 28.41))
+        )
+
+        assert_that(
+            owm.mock_calls[0],
+            equal_to(call.weather_at_coords(lat=_LAT, lon=_LON))
+        )
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self._subject = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    def test_opens_after_threshold(self):
+        self._subject.record_failure(timestamp=0)
+
+        assert_that(
+            self._subject.allow(timestamp=0),
+            equal_to(True)
+        )
+
+        self._subject.record_failure(timestamp=0)
+
+        assert_that(
+            (self._subject.state, self._subject.allow(timestamp=9)),
+            equal_to(('open', False))
+        )
+
+    def test_half_open_then_closes(self):
+        self._subject.record_failure(timestamp=0)
+        self._subject.record_failure(timestamp=0)
+
+        assert_that(
+            (self._subject.allow(timestamp=10), self._subject.state),
+            equal_to((True, 'half_open'))
+        )
+
+        # only one trial call at a time
+        assert_that(
+            self._subject.allow(timestamp=10),
+            equal_to(False)
+        )
+
+        self._subject.record_success()
+
+        assert_that(
+            (self._subject.state, self._subject.allow(timestamp=10)),
+            equal_to(('closed', True))
+        )
+
+    def test_half_open_failure_reopens(self):
+        self._subject.record_failure(timestamp=0)
+        self._subject.record_failure(timestamp=0)
+        self._subject.allow(timestamp=10)
+
+        self._subject.record_failure(timestamp=10)
+
+        assert_that(
+            (self._subject.state, self._subject.allow(timestamp=19), self._subject.allow(timestamp=20)),
+            equal_to(('open', False, True))
+        )
+
+
+class ProviderChainTest(unittest.TestCase):
+    def setUp(self):
+        self._primary = MagicMock()
+        self._secondary = MagicMock()
+
+        self._subject = ProviderChain(
+            providers=[self._primary, self._secondary],
+            failure_threshold=1,
+            reset_timeout=300,
+        )
+
+    def test_fetch_primary(self):
+        assert_that(
+            self._subject.fetch(_LAT, _LON),
+            equal_to(self._primary.fetch.return_value)
+        )
+
+        assert_that(
+            self._secondary.fetch.mock_calls,
+            equal_to([])
+        )
+
+    def test_fetch_falls_back(self):
+        self._primary.fetch.side_effect = ValueError('owm is down')
+
+        assert_that(
+            self._subject.fetch(_LAT, _LON),
+            equal_to(self._secondary.fetch.return_value)
+        )
+
+        # the primary's breaker is now open, so it isn't tried again
+        self._subject.fetch(_LAT, _LON)
+
+        assert_that(
+            self._primary.fetch.mock_calls,
+            equal_to([
+                call(_LAT, _LON)
+            ])
+        )
+
+    def test_fetch_all_fail(self):
+        self._primary.fetch.side_effect = ValueError('owm is down')
+        self._secondary.fetch.side_effect = ValueError('also down')
+
+        assert_that(
+            calling(self._subject.fetch).with_args(_LAT, _LON),
+            raises(ValueError)
+        )
+
+    def test_fetch_timeout(self):
+        release = threading.Event()
+        self._primary.fetch.side_effect = lambda lat, lon: release.wait(5)
+
+        subject = ProviderChain(
+            providers=[self._primary, self._secondary],
+            timeout=0.05,
+        )
+
+        try:
+            assert_that(
+                subject.fetch(_LAT, _LON),
+                equal_to(self._secondary.fetch.return_value)
+            )
+        finally:
+            release.set()
+
+    def test_fetch_timeout_primary_hangs_every_tick(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self._primary.fetch.side_effect = lambda lat, lon: release.wait(5)
+
+        subject = ProviderChain(
+            providers=[self._primary, self._secondary],
+            timeout=0.1,
+            failure_threshold=10,
+        )
+
+        for _ in range(0, 4):
+            assert_that(
+                subject.fetch(_LAT, _LON),
+                equal_to(self._secondary.fetch.return_value)
+            )
+
+        assert_that(
+            [x.state for x in subject.breakers],
+            equal_to(['closed', 'closed'])
+        )
+
+    def test_fetch_forecast_skips_providers_without(self):
+        self._primary.forecasts = False
+
+        assert_that(
+            (self._subject.fetch_forecast(_LAT, _LON), self._primary.fetch_forecast.mock_calls),
+            equal_to((self._secondary.fetch_forecast.return_value, []))
+        )
+
+    def test_fetch_forecast_shares_breaker(self):
+        self._primary.fetch_forecast.side_effect = ValueError('owm is down')
+
+        self._subject.fetch_forecast(_LAT, _LON)
+
+        assert_that(
+            (self._subject.fetch(_LAT, _LON), self._primary.fetch.mock_calls),
+            equal_to((self._secondary.fetch.return_value, []))
+        )
@@ -0,0 +1,279 @@
+import datetime
+import itertools
+import math
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from away_from_home.comfort import apparent_temperature
+from away_from_home.composer import Composer
+from away_from_home.forecast import ForecastSeries
+from away_from_home.history import WeatherHistory
+from away_from_home.snapshot import WeatherSnapshot
+from away_from_home.weather import WeatherSource
+
+# replays a weather series through a real Composer, against stand-in Weather and Aircon objects, on a virtual clock;
+# a series is an (n, 4) array of (unix timestamp, temperature, humidity, wind_speed) rows, the layout of
+# WeatherHistory.samples(), so a recorded history can be replayed as well as a synthetic one
+#
+# run with: python -m away_from_home.simulator
+
+# replayed series don't carry sunrise / sunset
+_SUNRISE_HOUR = 6
+_SUNSET_HOUR = 19
+
+SimulationResult = namedtuple('SimulationResult', [
+    'on_threshold',
+    'off_threshold',
+    'ticks',
+    'actuations',
+    'on_seconds',
+    'mean_latency',
+    'max_latency',
+])
+
+
+class VirtualClock(object):
+    __slots__ = ('now',)
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def datetime(self):
+        return datetime.datetime.fromtimestamp(self.now)
+
+
+class ReplayWeather(WeatherSource):
+    # serves whichever sample was latest at the clock's time; the "forecast" is the series itself (perfect foresight),
+    # which makes pre-cooling look as good as it can be
+    def __init__(self, samples, clock, history_size=None):
+        samples = np.asarray(samples, dtype=np.float64)
+
+        self._times = samples[:, 0]
+        self._temperatures = samples[:, 1]
+        self._humidities = samples[:, 2]
+        self._wind_speeds = samples[:, 3]
+        self._apparent_temperatures = apparent_temperature(self._temperatures, self._humidities, self._wind_speeds)
+
+        self._clock = clock
+        self._forecast = ForecastSeries(None, self._times, self._temperatures)
+        self._history = WeatherHistory(history_size) if history_size is not None else None
+
+        self._index = -1
+        self._snapshot = None
+
+        # the clock usually hasn't reached the next sample; checking that is a float comparison rather than a search
+        self._next_time = float(self._times[0])
+
+    def _advance(self):
+        now = self._clock()
+        if self._index >= 0 and self._times[self._index] <= now < self._next_time:
+            return
+
+        index = int(np.searchsorted(self._times, now, side='right')) - 1
+        if index < 0:
+            raise ValueError('no weather before {0}'.format(self._clock()))
+
+        if index == self._index:
+            return
+
+        if self._history is not None:
+            for i in range(self._index + 1, index + 1):
+                self._history.append(self._times[i], self._temperatures[i], self._humidities[i], self._wind_speeds[i])
+
+        timestamp = datetime.datetime.fromtimestamp(self._times[index])
+
+        self._index = index
+        self._next_time = float(self._times[index + 1]) if index + 1 < len(self._times) else float('inf')
+        self._snapshot = WeatherSnapshot(
+            timestamp=timestamp,
+            temperature=float(self._temperatures[index]),
+            humidity=float(self._humidities[index]),
+            wind_speed=float(self._wind_speeds[index]),
+            apparent_temperature=round(float(self._apparent_temperatures[index]), 2),
+            sunrise=timestamp.replace(hour=_SUNRISE_HOUR, minute=0, second=0, microsecond=0),
+            sunset=timestamp.replace(hour=_SUNSET_HOUR, minute=0, second=0, microsecond=0),
+        )
+
+    def snapshot(self):
+        self._advance()
+
+        return self._snapshot
+
+    @property
+    def observed(self):
+        # unix time of the sample last served
+        return float(self._times[self._index]) if self._index >= 0 else None
+
+    @property
+    def history(self):
+        return self._history
+
+    def temperature_at(self, minutes=0):
+        return float(self._forecast.interpolate(self._clock() + minutes * 60))
+
+    def forecast_crossing(self, threshold, minutes):
+        now = self._clock()
+        crossing = self._forecast.first_crossing(threshold, now, now + minutes * 60)
+
+        return (crossing - now) / 60 if crossing is not None else None
+
+
+class FakeAircon(object):
+    # records each actuation as (unix time, 'on' or 'off') and counts time spent on
+    def __init__(self, clock):
+        self._clock = clock
+
+        self.actions = []
+
+        self._on_since = None
+        self._on_seconds = 0.0
+
+    @property
+    def actuations(self):
+        return len(self.actions)
+
+    def on(self):
+        self.actions.append((self._clock(), 'on'))
+
+        if self._on_since is None:
+            self._on_since = self._clock()
+
+    def off(self):
+        self.actions.append((self._clock(), 'off'))
+
+        if self._on_since is not None:
+            self._on_seconds += self._clock() - self._on_since
+            self._on_since = None
+
+    def on_seconds(self):
+        if self._on_since is None:
+            return self._on_seconds
+
+        return self._on_seconds + self._clock() - self._on_since
+
+
+def decision_latencies(samples, actions, on_threshold, off_threshold):
+    # for each actuation, seconds from the sample where the series first reached the threshold it answers (at or above
+    # on_threshold for on, at or below off_threshold for off, after the actuation before it) to the actuation;
+    # negative when the actuation came first (pre-cooling) and left out when the series didn't get there before the
+    # next actuation (e.g. a policy acting on the time of day)
+    samples = np.asarray(samples, dtype=np.float64)
+    times = samples[:, 0]
+    temperatures = samples[:, 1]
+
+    latencies = []
+    for i, (when, action) in enumerate(actions):
+        start = int(np.searchsorted(times, actions[i - 1][0], side='right')) if i > 0 else 0
+        end = int(np.searchsorted(times, actions[i + 1][0], side='left')) if i + 1 < len(actions) else len(times)
+
+        window = temperatures[start:end]
+        reached = np.flatnonzero(window >= on_threshold if action == 'on' else window <= off_threshold)
+        if len(reached) > 0:
+            latencies.append(when - float(times[start + reached[0]]))
+
+    return latencies
+
+
+def simulate(samples, on_threshold, off_threshold, step=30, smoothed=False, pre_cool_minutes=None, history_size=None,
+             policy=None):
+    # runs Composer every step seconds (as the cron job would) from the first sample to the last
+    samples = np.asarray(samples, dtype=np.float64)
+
+    clock = VirtualClock(float(samples[0, 0]))
+    weather = ReplayWeather(samples, clock, history_size=history_size)
+    aircon = FakeAircon(clock)
+
+    composer = Composer(
+        weather=weather,
+        aircon=aircon,
+        on_threshold=on_threshold,
+        off_threshold=off_threshold,
+        smoothed=smoothed,
+        pre_cool_minutes=pre_cool_minutes,
+        policy=policy,
+        clock=clock.datetime,
+    )
+
+    ticks = 0
+    end = float(samples[-1, 0])
+    while clock.now <= end:
+        composer.run()
+        ticks += 1
+        clock.now += step
+
+    clock.now = end
+
+    latencies = decision_latencies(samples, aircon.actions, on_threshold, off_threshold)
+
+    return SimulationResult(
+        on_threshold=on_threshold,
+        off_threshold=off_threshold,
+        ticks=ticks,
+        actuations=aircon.actuations,
+        on_seconds=aircon.on_seconds(),
+        mean_latency=sum(latencies) / len(latencies) if len(latencies) > 0 else None,
+        max_latency=max(latencies) if len(latencies) > 0 else None,
+    )
+
+
+def _simulate(args):
+    samples, on_threshold, off_threshold, kwargs = args
+
+    return simulate(samples, on_threshold, off_threshold, **kwargs)
+
+
+def sweep(samples, on_thresholds, off_thresholds, processes=None, **kwargs):
+    # simulates every (on, off) pair with off below on, spread over processes (default one per core); other keyword
+    # arguments go to simulate()
+    pairs = [(on, off) for on, off in itertools.product(on_thresholds, off_thresholds) if off < on]
+
+    work = [(samples, on, off, kwargs) for on, off in pairs]
+
+    if processes == 1:
+        return [_simulate(x) for x in work]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_simulate, work, chunksize=max(1, len(work) // ((processes or os.cpu_count()) * 4))))
+
+
+def synthetic_summer(start, days=92, period=1800, seed=1991):
+    # a daily cycle between roughly 18 and 32 degrees (hottest mid afternoon) with day to day drift and noise; humidity
+    # runs opposite to temperature and the wind picks up in the afternoon
+    random = np.random.RandomState(seed)
+
+    times = start + np.arange(0, days * 86400, period, dtype=np.float64)
+    hours = (times - start) / 3600.0
+
+    cycle = np.sin(2 * math.pi * (hours % 24 - 9) / 24)
+    drift = np.repeat(random.normal(0, 2.5, days), 86400 // period)[:len(times)]
+
+    temperature = 25 + 7 * cycle + drift + random.normal(0, 0.5, len(times))
+    humidity = np.clip(55 - 25 * cycle + random.normal(0, 5, len(times)), 5, 100)
+    wind_speed = np.clip(3 + 3 * cycle + random.normal(0, 1, len(times)), 0, None)
+
+    return np.column_stack((times, temperature, humidity, wind_speed))
+
+
+if __name__ == '__main__':
+    import time
+
+    start = time.mktime(datetime.datetime(year=2017, month=12, day=1).timetuple())
+    summer = synthetic_summer(start)
+
+    before = time.time()
+    results = sweep(summer, [28, 29, 30, 31], [25, 26, 27, 28])
+    elapsed = time.time() - before
+
+    print('{0} threshold pairs over {1} days in {2:.1f}s'.format(len(results), 92, elapsed))
+    print('    {0:>4} {1:>4} {2:>10} {3:>10} {4:>12}'.format('on', 'off', 'actuations', 'on hours', 'decision (s)'))
+    for result in sorted(results, key=lambda x: (x.on_threshold, x.off_threshold)):
+        print('    {0:>4} {1:>4} {2:>10} {3:>10.1f} {4:>12.1f}'.format(
+            result.on_threshold, result.off_threshold, result.actuations, result.on_seconds / 3600,
+            result.mean_latency or 0
+        ))
@@ -0,0 +1,156 @@
+import datetime
+import time
+import unittest
+
+import numpy as np
+from hamcrest import assert_that, equal_to, close_to, calling, raises
+
+from away_from_home.simulator import FakeAircon, ReplayWeather, VirtualClock, simulate, sweep, synthetic_summer
+from away_from_home.simulator import decision_latencies
+
+_START = time.mktime(datetime.datetime(year=2017, month=12, day=1).timetuple())
+
+
+def _samples(temperatures, period=600):
+    return np.asarray([
+        (_START + i * period, temperature, 25.0, 0.0)
+        for i, temperature in enumerate(temperatures)
+    ])
+
+
+class ReplayWeatherTest(unittest.TestCase):
+    def setUp(self):
+        self._clock = VirtualClock(_START)
+        self._subject = ReplayWeather(_samples([20, 26, 32]), self._clock, history_size=4)
+
+    def test_snapshot_before_first_sample(self):
+        self._clock.now -= 1
+
+        assert_that(
+            calling(self._subject.snapshot),
+            raises(ValueError)
+        )
+
+    def test_snapshot_latest_sample(self):
+        self._clock.now += 1199
+
+        snapshot = self._subject.snapshot()
+
+        assert_that(
+            (snapshot.temperature, snapshot.timestamp, self._subject.observed, len(self._subject.history)),
+            equal_to((26.0, datetime.datetime.fromtimestamp(_START + 600), _START + 600, 2))
+        )
+
+        self._clock.now += 1
+
+        assert_that(
+            (self._subject.snapshot().temperature, len(self._subject.history)),
+            equal_to((32.0, 3))
+        )
+
+    def test_forecast(self):
+        assert_that(
+            (self._subject.temperature_at(15), self._subject.forecast_crossing(29, 30)),
+            equal_to((29.0, 15.0))
+        )
+
+
+class FakeAirconTest(unittest.TestCase):
+    def test_counts(self):
+        clock = VirtualClock(_START)
+        subject = FakeAircon(clock)
+
+        clock.now += 630
+        subject.on()
+        clock.now += 600
+        subject.on()
+        subject.off()
+        clock.now += 100
+
+        assert_that(
+            (subject.actuations, subject.on_seconds(), subject.actions),
+            equal_to((3, 600.0, [(_START + 630, 'on'), (_START + 1230, 'on'), (_START + 1230, 'off')]))
+        )
+
+
+class FunctionsTest(unittest.TestCase):
+    def test_decision_latencies(self):
+        samples = _samples([26, 30, 30, 26, 26])
+        actions = [(_START + 0, 'off'), (_START + 900, 'on'), (_START + 1800, 'off')]
+
+        assert_that(
+            decision_latencies(samples, actions, 29, 27),
+            equal_to([0.0, 300.0, 0.0])
+        )
+
+    def test_decision_latencies_ahead(self):
+        samples = _samples([26, 28, 30])
+        actions = [(_START + 700, 'on')]
+
+        assert_that(
+            decision_latencies(samples, actions, 29, 27),
+            equal_to([-500.0])
+        )
+
+    def test_decision_latencies_never_reached(self):
+        samples = _samples([26, 28, 28])
+        actions = [(_START + 700, 'on'), (_START + 1300, 'off')]
+
+        assert_that(
+            decision_latencies(samples, actions, 29, 27),
+            equal_to([])
+        )
+
+
+class SimulateTest(unittest.TestCase):
+    def test_simulate(self):
+        result = simulate(_samples([26, 30, 30, 28, 26, 26, 30]), 29, 27, step=60)
+
+        assert_that(
+            (result.ticks, result.actuations, result.on_seconds, result.max_latency),
+            equal_to((61, 4, 1800.0, 0.0))
+        )
+
+    def test_simulate_latency(self):
+        result = simulate(_samples([26, 30, 30]), 29, 27, step=420)
+
+        assert_that(
+            (result.actuations, result.mean_latency),
+            equal_to((2, 120.0))
+        )
+
+    def test_simulate_latency_smoothed(self):
+        result = simulate(_samples([26, 26, 30, 30, 30, 30]), 29, 27, step=60, smoothed=True, history_size=3)
+
+        assert_that(
+            (result.actuations, result.max_latency),
+            equal_to((2, 1200.0))
+        )
+
+    def test_sweep(self):
+        samples = _samples([26, 30, 30, 28, 26, 26, 30])
+
+        results = sweep(samples, [29, 30], [27, 29], processes=1, step=60)
+
+        assert_that(
+            [(x.on_threshold, x.off_threshold, x.actuations) for x in results],
+            equal_to([(29, 27, 4), (30, 27, 4), (30, 29, 4)])
+        )
+
+        assert_that(
+            sweep(samples, [29, 30], [27, 29], processes=2, step=60),
+            equal_to(results)
+        )
+
+    def test_synthetic_summer(self):
+        samples = synthetic_summer(_START, days=10)
+
+        assert_that(
+            samples.shape,
+            equal_to((480, 4))
+        )
+
+        assert_that(
+            float(samples[:, 1].mean()),
+            close_to(25, 2)
+        )
@@ -0,0 +1,90 @@
+import datetime
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import closing
+from logging import getLogger
+from threading import RLock
+
+# an immutable record of a single observation; built once per refresh and shared by every reader until the next one
+WeatherSnapshot = namedtuple('WeatherSnapshot', [
+    'timestamp',
+    'temperature',
+    'humidity',
+    'wind_speed',
+    'apparent_temperature',
+    'sunrise',
+    'sunset',
+])
+
+_DATETIME_FIELDS = {'timestamp', 'sunrise', 'sunset'}
+
+_CREATE_TABLE = 'CREATE TABLE IF NOT EXISTS snapshots (key TEXT PRIMARY KEY, {0})'.format(
+    ', '.join('{0} REAL'.format(x) for x in WeatherSnapshot._fields)
+)
+
+_SELECT = 'SELECT {0} FROM snapshots WHERE key = ?'.format(
+    ', '.join(WeatherSnapshot._fields)
+)
+
+_UPSERT = 'INSERT OR REPLACE INTO snapshots (key, {0}) VALUES (?, {1})'.format(
+    ', '.join(WeatherSnapshot._fields), ', '.join('?' for _ in WeatherSnapshot._fields)
+)
+
+
+def to_unix(value):
+    return time.mktime(value.timetuple()) + value.microsecond / 1e6
+
+
+# a flat list of floats (datetimes as unix time); compact, and JSON / SQLite friendly
+def to_row(snapshot):
+    return [
+        to_unix(value) if field in _DATETIME_FIELDS else value
+        for field, value in zip(WeatherSnapshot._fields, snapshot)
+    ]
+
+
+def from_row(row):
+    return WeatherSnapshot(*[
+        datetime.datetime.fromtimestamp(value) if field in _DATETIME_FIELDS else value
+        for field, value in zip(WeatherSnapshot._fields, row)
+    ])
+
+
+class SnapshotCache(object):
+    # keeps the last snapshot per key in a small SQLite file so a restarted process can make its first decision from
+    # disk rather than the network; a connection is opened per call so it's safe to use from any thread
+    def __init__(self, path):
+        self._path = path
+
+        self._lock = RLock()
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug('__init__(); path=%r', path)
+
+        with self._connect() as conn:
+            conn.execute(_CREATE_TABLE)
+
+    def _connect(self):
+        return closing(sqlite3.connect(self._path))
+
+    def load(self, key):
+        with self._lock, self._connect() as conn:
+            row = conn.execute(_SELECT, (key,)).fetchone()
+
+        snapshot = from_row(row) if row is not None else None
+
+        self._logger.debug('load(); key=%r, snapshot=%s', key, snapshot)
+
+        return snapshot
+
+    def save(self, key, snapshot):
+        self._logger.debug('save(); key=%r, snapshot=%s', key, snapshot)
+
+        # a failure to persist shouldn't stop the observation being used
+        try:
+            with self._lock, self._connect() as conn:
+                with conn:
+                    conn.execute(_UPSERT, [key] + to_row(snapshot))
+        except sqlite3.Error as e:
+            self._logger.warning('save(); failed to persist snapshot; error=%r', e)
@@ -0,0 +1,63 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from hamcrest import assert_that, equal_to
+
+from away_from_home.snapshot import WeatherSnapshot, SnapshotCache
+
+_TEST_TIMESTAMP = datetime.datetime(year=1991, month=2, day=6, hour=13, minute=37, second=1, microsecond=500000)
+
+_SNAPSHOT = WeatherSnapshot(
+    timestamp=_TEST_TIMESTAMP,
+    temperature=32.0,
+    humidity=25.0,
+    wind_speed=5.0,
+    apparent_temperature=28.41,
+    sunrise=_TEST_TIMESTAMP - datetime.timedelta(hours=8),
+    sunset=_TEST_TIMESTAMP + datetime.timedelta(hours=5),
+)
+
+
+class SnapshotCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._path = os.path.join(self._tempdir, 'weather.db')
+
+        self._subject = SnapshotCache(self._path)
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+    def test_load_missing(self):
+        assert_that(
+            self._subject.load('-31.9,115.9'),
+            equal_to(None)
+        )
+
+    def test_save_load(self):
+        self._subject.save('-31.9,115.9', _SNAPSHOT)
+
+        assert_that(
+            self._subject.load('-31.9,115.9'),
+            equal_to(_SNAPSHOT)
+        )
+
+    def test_save_replaces(self):
+        self._subject.save('-31.9,115.9', _SNAPSHOT)
+        self._subject.save('-31.9,115.9', _SNAPSHOT._replace(temperature=20.0))
+
+        assert_that(
+            self._subject.load('-31.9,115.9').temperature,
+            equal_to(20.0)
+        )
+
+    def test_survives_reopen(self):
+        self._subject.save('-31.9,115.9', _SNAPSHOT)
+
+        assert_that(
+            SnapshotCache(self._path).load('-31.9,115.9'),
+            equal_to(_SNAPSHOT)
+        )
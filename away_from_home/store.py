@@ -1,11 +1,197 @@
+import os
+from logging import getLogger
+from threading import Condition, RLock
+
+from away_from_home.journal import Journal
+
+_PAYLOAD = 'store'
+
+
 class Store(object):
-    def __init__(self, heartbeat):
-        self._heartbeat = heartbeat
+    # a key / value store that can be watched; subscribers are called (on the setting thread, in the order the changes
+    # were made) whenever a key's value changes, and wait_for() blocks until a key satisfies a predicate
+    #
+    # given a heartbeat, keys starting with one of the replicated prefixes are replicated from the active node to its
+    # standby peers, piggybacked on the heartbeats; every change bumps a local version, the active node sends the keys
+    # changed since the oldest version its peers have acknowledged and each standby acknowledges what it has applied,
+    # so a lost heartbeat just means the delta goes again with the next one (values must be JSON serialisable)
+    #
+    # given a path, keys starting with one of the persisted prefixes are also kept in a Journal there and recovered
+    # when the store is created, so they survive a restart
+    def __init__(self, heartbeat=None, replicated=(), path=None, persisted=(), compact_every=1000, sync=False):
+        self._replicated = tuple(replicated)
+        self._persisted = tuple(persisted)
 
         self._data = {}
+        self._subscribers = {}
+
+        self._version = 0
+        self._versions = {}
+        self._acks = {}
+        self._applied = {}
+
+        self._condition = Condition()
+
+        # held while a change is applied and delivered so subscribers see changes in order; re-entrant so a subscriber
+        # can itself set a key
+        self._notify_lock = RLock()
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug(
+            '__init__(); heartbeat=%s, replicated=%s, path=%r, persisted=%s, compact_every=%s, sync=%s',
+            heartbeat, self._replicated, path, self._persisted, compact_every, sync
+        )
+
+        self._journal = None
+        if path is not None:
+            self._open_journal(path, compact_every, sync)
+
+        self._heartbeat = None
+        if heartbeat is not None:
+            self.replicate(heartbeat)
+
+    def replicate(self, heartbeat):
+        # for when the heartbeat is built after (and publishes into) the store
+        self._heartbeat = heartbeat
+        self._heartbeat.add_payload(_PAYLOAD, self._produce, self._consume)
+
+    def _open_journal(self, path, compact_every, sync):
+        # losing state across a restart is better than not starting, so a journal that can't be opened is logged and
+        # the store runs in memory
+        try:
+            directory = os.path.dirname(path)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+
+            self._journal = Journal(path, compact_every=compact_every, sync=sync)
+            self._recover()
+        except OSError as e:
+            self._logger.error('_open_journal(); keeping state in memory only; path=%r, error=%r', path, e)
+            self._journal = None
+
+    def _recover(self):
+        for key, value in self._journal.load().items():
+            if not self._is_persisted(key):
+                continue
+
+            self._data[key] = value
+
+            if self._is_replicated(key):
+                self._version += 1
+                self._versions[key] = self._version
+
+    def _is_replicated(self, key):
+        return len(self._replicated) > 0 and key.startswith(self._replicated)
+
+    def _is_persisted(self, key):
+        return self._journal is not None and len(self._persisted) > 0 and key.startswith(self._persisted)
 
     def set(self, key, value):
-        self._data.update({key: value})
+        with self._notify_lock:
+            with self._condition:
+                old_value = self._data.get(key)
+                changed = key not in self._data or old_value != value
+
+                self._data.update({key: value})
+
+                if not changed:
+                    return
+
+                if self._is_replicated(key):
+                    self._version += 1
+                    self._versions[key] = self._version
+
+                if self._is_persisted(key):
+                    try:
+                        self._journal.append(key, value)
+                    except (IOError, OSError, ValueError) as e:
+                        # a failure to persist shouldn't stop the change being used
+                        self._logger.warning('set(); failed to persist key=%r; error=%r', key, e)
+
+                self._condition.notify_all()
+
+                subscribers = list(self._subscribers.get(key, []))
+
+            for callback in subscribers:
+                try:
+                    callback(key, value, old_value)
+                except Exception as e:
+                    self._logger.warning('set(); subscriber=%s for key=%r failed; error=%r', callback, key, e)
+
+    def get(self, key, default=None):
+        with self._condition:
+            return self._data.get(key, default)
+
+    def subscribe(self, key, callback):
+        # callback(key, value, old_value); returns a function that unsubscribes it
+        with self._condition:
+            self._subscribers.setdefault(key, []).append(callback)
+
+        return lambda: self.unsubscribe(key, callback)
+
+    def unsubscribe(self, key, callback):
+        with self._condition:
+            subscribers = self._subscribers.get(key, [])
+            if callback in subscribers:
+                subscribers.remove(callback)
+
+            if len(subscribers) == 0:
+                self._subscribers.pop(key, None)
+
+    def wait_for(self, key, predicate, timeout=None):
+        # True once predicate(value) holds (immediately if it already does), False if timeout seconds pass first
+        with self._condition:
+            return self._condition.wait_for(lambda: key in self._data and predicate(self._data[key]), timeout)
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+
+    def _produce(self):
+        # called as each heartbeat is sent; {'a': {origin: version applied}, 'd': [since, version, {key: value}]}
+        with self._condition:
+            payload = {}
+
+            if len(self._applied) > 0:
+                payload['a'] = dict(self._applied)
+
+            if self._heartbeat.active and len(self._versions) > 0:
+                peers = [x.uuid for x in self._heartbeat.peers]
+                since = min([self._acks.get(x, 0) for x in peers]) if len(peers) > 0 else self._version
+
+                if since < self._version:
+                    payload['d'] = [
+                        since,
+                        self._version,
+                        {k: self._data[k] for k, v in self._versions.items() if v > since},
+                    ]
+
+            return payload if len(payload) > 0 else None
+
+    def _consume(self, uuid, payload):
+        # called as each heartbeat is received from peer uuid
+        acks = payload.get('a')
+        if acks is not None:
+            with self._condition:
+                self._acks[uuid] = acks.get(self._heartbeat.uuid, 0)
+
+        delta = payload.get('d')
+        if delta is None:
+            return
+
+        since, version, values = delta
+
+        with self._condition:
+            applied = self._applied.get(uuid, 0)
+
+            # a delta from before what we've got (a reordered datagram) or one that skips a gap is no use; the next
+            # heartbeat will carry what we need once our ack is seen
+            if version <= applied or since > applied:
+                return
+
+            self._applied[uuid] = version
+
+        self._logger.debug('_consume(); uuid=%r, since=%s, version=%s, keys=%s', uuid, since, version, list(values))
 
-    def get(self, key):
-        return self._data.get(key)
+        for key, value in values.items():
+            self.set(key, value)
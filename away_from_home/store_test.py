@@ -0,0 +1,272 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from hamcrest import assert_that, equal_to
+from mock import MagicMock, call
+
+from away_from_home.heartbeat import Peer
+from away_from_home.store import Store
+
+
+class FakeHeartbeat(object):
+    def __init__(self, uuid, active):
+        self.uuid = uuid
+        self.active = active
+        self.peers = []
+        self.payload = None
+
+    def add_payload(self, name, produce, consume):
+        self.payload = (produce, consume)
+
+    def send_to(self, other):
+        # through JSON, as it would go over the wire
+        payload = self.payload[0]()
+        if payload is not None:
+            other.payload[1](self.uuid, json.loads(json.dumps(payload)))
+
+        return payload
+
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        self._subject = Store()
+
+    def test_get_missing(self):
+        assert_that(
+            (self._subject.get('a'), self._subject.get('a', 'default')),
+            equal_to((None, 'default'))
+        )
+
+    def test_set_get(self):
+        self._subject.set('a', 1)
+
+        assert_that(
+            self._subject.get('a'),
+            equal_to(1)
+        )
+
+    def test_subscribe(self):
+        callback = MagicMock()
+        self._subject.subscribe('a', callback)
+
+        self._subject.set('a', 1)
+        self._subject.set('a', 1)
+        self._subject.set('b', 1)
+        self._subject.set('a', 2)
+
+        assert_that(
+            callback.mock_calls,
+            equal_to([
+                call('a', 1, None),
+                call('a', 2, 1),
+            ])
+        )
+
+    def test_unsubscribe(self):
+        callback = MagicMock()
+        unsubscribe = self._subject.subscribe('a', callback)
+
+        unsubscribe()
+        self._subject.set('a', 1)
+
+        assert_that(
+            callback.mock_calls,
+            equal_to([])
+        )
+
+    def test_failing_subscriber_does_not_stop_others(self):
+        calls = []
+
+        def failing(key, value, old_value):
+            raise Exception('boom')
+
+        self._subject.subscribe('a', failing)
+        self._subject.subscribe('a', lambda key, value, old_value: calls.append(value))
+
+        self._subject.set('a', 1)
+
+        assert_that(
+            (self._subject.get('a'), calls),
+            equal_to((1, [1]))
+        )
+
+    def test_subscriber_can_set(self):
+        self._subject.subscribe('a', lambda key, value, old_value: self._subject.set('b', value * 2))
+
+        self._subject.set('a', 2)
+
+        assert_that(
+            self._subject.get('b'),
+            equal_to(4)
+        )
+
+    def test_wait_for_already_true(self):
+        self._subject.set('a', True)
+
+        assert_that(
+            self._subject.wait_for('a', lambda x: x, timeout=0),
+            equal_to(True)
+        )
+
+    def test_wait_for_timeout(self):
+        self._subject.set('a', False)
+
+        assert_that(
+            self._subject.wait_for('a', lambda x: x, timeout=0.01),
+            equal_to(False)
+        )
+
+    def test_wait_for_set_from_another_thread(self):
+        timer = threading.Timer(0.01, self._subject.set, args=('a', True))
+        timer.start()
+
+        assert_that(
+            self._subject.wait_for('a', lambda x: x, timeout=1),
+            equal_to(True)
+        )
+
+        timer.join()
+
+
+class ReplicatedStoreTest(unittest.TestCase):
+    def setUp(self):
+        self._active_heartbeat = FakeHeartbeat('active', True)
+        self._standby_heartbeat = FakeHeartbeat('standby', False)
+        self._active_heartbeat.peers = [Peer(uuid='standby', priority=2, last_seen=None)]
+        self._standby_heartbeat.peers = [Peer(uuid='active', priority=1, last_seen=None)]
+
+        self._active = Store(self._active_heartbeat, replicated=['weather.', 'composer.'])
+        self._standby = Store(self._standby_heartbeat, replicated=['weather.', 'composer.'])
+
+    def test_replicates_only_replicated_keys(self):
+        self._active.set('composer.last_action', 'on')
+        self._active.set('heartbeat.active', True)
+
+        self._active_heartbeat.send_to(self._standby_heartbeat)
+
+        assert_that(
+            (self._standby.get('composer.last_action'), self._standby.get('heartbeat.active')),
+            equal_to(('on', None))
+        )
+
+    def test_resends_until_acknowledged(self):
+        self._active.set('composer.last_action', 'on')
+
+        # lost on the way
+        self._active_heartbeat.payload[0]()
+
+        assert_that(
+            self._active_heartbeat.send_to(self._standby_heartbeat),
+            equal_to({'d': [0, 1, {'composer.last_action': 'on'}]})
+        )
+
+        self._standby_heartbeat.send_to(self._active_heartbeat)
+
+        assert_that(
+            self._active_heartbeat.send_to(self._standby_heartbeat),
+            equal_to(None)
+        )
+
+    def test_sends_only_changes_since_acknowledged(self):
+        self._active.set('composer.last_action', 'on')
+        self._active_heartbeat.send_to(self._standby_heartbeat)
+        self._standby_heartbeat.send_to(self._active_heartbeat)
+
+        self._active.set('weather.x', [1.0, 2.0])
+
+        assert_that(
+            self._active_heartbeat.send_to(self._standby_heartbeat),
+            equal_to({'d': [1, 2, {'weather.x': [1.0, 2.0]}]})
+        )
+
+        assert_that(
+            self._standby.get('weather.x'),
+            equal_to([1.0, 2.0])
+        )
+
+    def test_ignores_delta_with_gap(self):
+        self._active.set('composer.last_action', 'on')
+        self._standby._applied['active'] = 0
+
+        self._standby._consume('active', {'d': [1, 2, {'weather.x': [1.0]}]})
+
+        assert_that(
+            self._standby.get('weather.x'),
+            equal_to(None)
+        )
+
+    def test_standby_does_not_send(self):
+        self._standby.set('composer.last_action', 'off')
+
+        assert_that(
+            self._standby_heartbeat.send_to(self._active_heartbeat),
+            equal_to(None)
+        )
+
+
+class PersistentStoreTest(unittest.TestCase):
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._path = os.path.join(self._tempdir, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+    def _store(self):
+        store = Store(path=self._path, persisted=['composer.'])
+        self.addCleanup(store.close)
+
+        return store
+
+    def test_recovers_persisted_keys(self):
+        store = self._store()
+        store.set('composer.last_action', 'on')
+        store.set('heartbeat.active', True)
+        store.close()
+
+        store = self._store()
+
+        assert_that(
+            (store.get('composer.last_action'), store.get('heartbeat.active')),
+            equal_to(('on', None))
+        )
+
+    def test_unchanged_not_appended(self):
+        store = self._store()
+        store.set('composer.last_action', 'on')
+        store.set('composer.last_action', 'on')
+        store.close()
+
+        with open(self._path + '.log') as f:
+            assert_that(
+                len(f.readlines()),
+                equal_to(1)
+            )
+
+    def test_creates_directory(self):
+        self._path = os.path.join(self._tempdir, 'missing', 'store')
+
+        store = self._store()
+        store.set('composer.last_action', 'on')
+
+        assert_that(
+            os.path.exists(self._path + '.log'),
+            equal_to(True)
+        )
+
+    def test_unusable_path_keeps_state_in_memory(self):
+        with open(os.path.join(self._tempdir, 'file'), 'w'):
+            pass
+        self._path = os.path.join(self._tempdir, 'file', 'store')
+
+        store = self._store()
+        store.set('composer.last_action', 'on')
+
+        assert_that(
+            (store.get('composer.last_action'), store._journal),
+            equal_to(('on', None))
+        )
@@ -0,0 +1,10 @@
+# shared by the tests
+
+
+class FakeClock(object):
+    # stands in for time.time; tests move it along by setting now
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+from collections import deque
+from logging import getLogger
+
+import numpy as np
+
+# per-run traces made of timed spans; Tracer.trace() starts a trace on the calling thread and span() (called from
+# anywhere, e.g. deep inside Weather or Aircon) times a step of whatever trace is running on that thread, or does
+# nothing at all if there isn't one, so code can be instrumented without passing a tracer through it
+#
+# a finished trace is a dict like
+#
+#     {'name': 'composer.run', 'start': 1509743779.1, 'duration_ms': 2105.3, 'error': None, 'spans': [
+#         {'name': 'weather.snapshot', 'depth': 0, 'offset_ms': 0.1, 'duration_ms': 1.2, 'error': None},
+#         {'name': 'aircon.on', 'depth': 0, 'offset_ms': 1.4, 'duration_ms': 2103.8, 'error': None},
+#         {'name': 'aircon.send', 'depth': 1, 'offset_ms': 1.5, 'duration_ms': 3.1, 'error': None},
+#         ...
+#     ]}
+#
+# with any keyword arguments to trace() / span() merged in
+
+_local = threading.local()
+
+
+class _NoSpan(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span(object):
+    __slots__ = ('_trace', '_record', '_started')
+
+    def __init__(self, trace, name, attributes):
+        self._trace = trace
+        self._record = dict(attributes, name=name)
+
+    def __enter__(self):
+        trace = self._trace
+
+        self._record['depth'] = trace.depth
+        trace.depth += 1
+        trace.spans.append(self._record)
+
+        self._started = time.perf_counter()
+        self._record['offset_ms'] = (self._started - trace.started) * 1e3
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._record['duration_ms'] = (time.perf_counter() - self._started) * 1e3
+        self._record['error'] = repr(exc_value) if exc_value is not None else None
+
+        self._trace.depth -= 1
+
+        return False
+
+
+class _Trace(object):
+    __slots__ = ('tracer', 'record', 'spans', 'depth', 'started')
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.spans = []
+        self.record = dict(attributes, name=name, spans=self.spans)
+        self.depth = 0
+
+    def __enter__(self):
+        _local.trace = self
+
+        self.record['start'] = time.time()
+        self.started = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.record['duration_ms'] = (time.perf_counter() - self.started) * 1e3
+        self.record['error'] = repr(exc_value) if exc_value is not None else None
+
+        _local.trace = None
+
+        self.tracer._finish(self.record)
+
+        return False
+
+
+def span(name, **attributes):
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return _NO_SPAN
+
+    return _Span(trace, name, attributes)
+
+
+class Tracer(object):
+    # keeps the last capacity traces in memory and, given a path, appends every trace to it as a line of JSON
+    def __init__(self, capacity=1000, path=None):
+        self._traces = deque(maxlen=capacity)
+        self._path = path
+
+        self._lock = threading.RLock()
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug('__init__(); capacity=%s, path=%r', capacity, path)
+
+    def trace(self, name, **attributes):
+        # inside a trace already running on this thread (e.g. an evaluation triggered by the run's own weather fetch)
+        # this is just a span of it
+        if getattr(_local, 'trace', None) is not None:
+            return span(name, **attributes)
+
+        return _Trace(self, name, attributes)
+
+    def _finish(self, record):
+        with self._lock:
+            self._traces.append(record)
+
+            if self._path is None:
+                return
+
+            # a trace that can't be written shouldn't break the run it describes
+            try:
+                with open(self._path, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+            except (IOError, OSError, TypeError, ValueError) as e:
+                self._logger.warning('_finish(); failed to write trace; error=%r', e)
+
+    def traces(self):
+        # oldest first
+        with self._lock:
+            return list(self._traces)
+
+    def durations(self, name):
+        # of every trace or span called name in the buffer, in milliseconds
+        durations = []
+
+        for record in self.traces():
+            if record['name'] == name:
+                durations.append(record['duration_ms'])
+
+            durations.extend(x['duration_ms'] for x in record['spans'] if x['name'] == name)
+
+        return durations
+
+    def percentiles(self, name, percentiles=(50, 90, 99)):
+        durations = self.durations(name)
+        if len(durations) == 0:
+            return None
+
+        return dict(zip(percentiles, np.percentile(durations, percentiles).tolist()))
@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from hamcrest import assert_that, equal_to, calling, raises
+
+from away_from_home.tracing import Tracer, span
+
+
+def _shape(record):
+    # without the timings
+    return (record['name'], record['error'], [(x['name'], x['depth'], x['error']) for x in record['spans']])
+
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._path = os.path.join(self._tempdir, 'traces.jsonl')
+
+        self._subject = Tracer(capacity=2, path=self._path)
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+    def test_span_without_trace_does_nothing(self):
+        with span('nothing'):
+            pass
+
+        assert_that(
+            self._subject.traces(),
+            equal_to([])
+        )
+
+    def test_trace(self):
+        with self._subject.trace('run', zone='lounge'):
+            with span('fetch'):
+                with span('connect', ip='1.2.3.4'):
+                    pass
+            with span('decide'):
+                pass
+
+        record = self._subject.traces()[0]
+
+        assert_that(
+            _shape(record),
+            equal_to(('run', None, [('fetch', 0, None), ('connect', 1, None), ('decide', 0, None)]))
+        )
+
+        assert_that(
+            (record['zone'], record['spans'][1]['ip']),
+            equal_to(('lounge', '1.2.3.4'))
+        )
+
+        assert_that(
+            record['duration_ms'] >= record['spans'][0]['duration_ms'] >= record['spans'][1]['duration_ms'],
+            equal_to(True)
+        )
+
+    def test_errors_recorded(self):
+        def run():
+            with self._subject.trace('run'):
+                with span('send'):
+                    raise IOError('zmote unreachable')
+
+        assert_that(
+            calling(run),
+            raises(IOError)
+        )
+
+        assert_that(
+            _shape(self._subject.traces()[0]),
+            equal_to(('run', "OSError('zmote unreachable')", [('send', 0, "OSError('zmote unreachable')")]))
+        )
+
+        with span('after'):
+            pass
+
+    def test_nested_trace_is_span(self):
+        with self._subject.trace('run'):
+            with self._subject.trace('handle'):
+                pass
+
+        assert_that(
+            [_shape(x) for x in self._subject.traces()],
+            equal_to([('run', None, [('handle', 0, None)])])
+        )
+
+    def test_bounded_and_written(self):
+        for i in range(0, 3):
+            with self._subject.trace('run', i=i):
+                pass
+
+        assert_that(
+            [x['i'] for x in self._subject.traces()],
+            equal_to([1, 2])
+        )
+
+        with open(self._path) as f:
+            assert_that(
+                [json.loads(x)['i'] for x in f],
+                equal_to([0, 1, 2])
+            )
+
+    def test_percentiles(self):
+        self._subject = Tracer(capacity=100)
+        for i in range(0, 10):
+            with self._subject.trace('run'):
+                pass
+
+        for record, duration in zip(self._subject.traces(), range(1, 11)):
+            record['duration_ms'] = float(duration)
+
+        assert_that(
+            (self._subject.percentiles('run', (50, 90)), self._subject.percentiles('missing')),
+            equal_to(({50: 5.5, 90: 9.1}, None))
+        )
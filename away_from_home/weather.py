@@ -1,172 +1,469 @@
 import datetime
-import inspect
+import time
 from logging import getLogger
-from math import exp
+from threading import Thread, Condition, Event
 
 from pyowm import OWM
 
-from away_from_home.expirer import ExpiringBool
+from away_from_home.comfort import get_apparent_temperature
+from away_from_home.expirer import ExpiringValue
+from away_from_home.forecast import ForecastSeries
+from away_from_home.history import WeatherHistory
+from away_from_home.provider import OWMProvider, ProviderChain
+from away_from_home.snapshot import WeatherSnapshot, SnapshotCache, from_row, to_row, to_unix
+from away_from_home.tracing import span
 
+_REFRESH_AHEAD = 0.8
 
-def get_apparent_temperature(temperature, humidity, wind_speed):
-    Ta = float(temperature)
-    rh = float(humidity)
-    ws = float(wind_speed)
-    e = rh / 100 * 6.105 * exp((17.27 * Ta) / (237.7 + Ta))
+STORE_KEY_PREFIX = 'weather.'
 
-    return round(Ta + (0.33 * e) - (0.70 * ws) - 4.00, 2)
 
+# anything that can produce a WeatherSnapshot; the per-field properties all read from a single snapshot() call
+class WeatherSource(object):
+    def snapshot(self):
+        raise NotImplementedError()
 
-class Weather(object):
-    def __init__(self, owm_key, lat, lon, cache_period):
+    @property
+    def history(self):
+        return None
+
+    def temperature_at(self, minutes=0):
+        return None
+
+    def forecast_crossing(self, threshold, minutes):
+        return None
+
+    def _notify(self, snapshot):
+        for callback in list(getattr(self, '_listeners', [])):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                getLogger(self.__class__.__name__).warning('_notify(); listener=%s failed; error=%r', callback, e)
+
+    def subscribe(self, callback):
+        # callback(snapshot), with each new snapshot the source gets, on the thread that got it; returns a function
+        # that unsubscribes it
+        listeners = getattr(self, '_listeners', None)
+        if listeners is None:
+            listeners = self._listeners = []
+
+        listeners.append(callback)
+
+        return lambda: listeners.remove(callback)
+
+    @property
+    def temperature(self):
+        return self.snapshot().temperature
+
+    @property
+    def humidity(self):
+        return self.snapshot().humidity
+
+    @property
+    def wind_speed(self):
+        return self.snapshot().wind_speed
+
+    @property
+    def apparent_temperature(self):
+        return self.snapshot().apparent_temperature
+
+    @property
+    def sunrise(self):
+        return self.snapshot().sunrise
+
+    @property
+    def sunset(self):
+        return self.snapshot().sunset
+
+
+class Weather(WeatherSource):
+    def __init__(self, owm_key, lat, lon, cache_period, background_refresh=False, max_staleness=None, timeout=None,
+                 cache_path=None, limiter=None, history_size=None, forecast_period=None, provider=None, store=None,
+                 clock=time.monotonic):
         self._lat = lat
         self._lon = lon
 
         self._owm = OWM(owm_key)
 
-        self._need_to_update = ExpiringBool(cache_period)
+        # where observations come from; by default OWM alone, behind a circuit breaker so an outage fails fast
+        self._provider = provider if provider is not None else ProviderChain([OWMProvider(self._owm)])
+
+        self._cache_period = cache_period
+        self._fresh = ExpiringValue(cache_period, clock=clock)
+
+        # every age in here is measured on this (monotonic) clock from when an observation or forecast was fetched,
+        # less however old it already was then (by its wall clock timestamp, e.g. one loaded from disk), so a wall
+        # clock step can't stop the worker refreshing or make readers wait on weather that isn't stale
+        self._clock = clock
+
+        # an optional RateLimiter shared by every Weather instance (and process); when its budget runs low the
+        # effective cache period is stretched rather than spending the last of it
+        self._limiter = limiter
 
-        self._weather = None
+        # in background refresh mode readers are served the last observation while a worker refreshes it ahead of
+        # expiry; readers only block (for at most timeout seconds) if the observation is older than max_staleness
+        self._background_refresh = background_refresh
+        self._refresh_ahead = cache_period * _REFRESH_AHEAD
+        self._max_staleness = max_staleness if max_staleness is not None else cache_period * 3
+        self._timeout = timeout
 
-        self._humidity = None
-        self._temperature = None
-        self._wind_speed = None
-        self._apparent_temperature = None
-        self._sunrise = None
-        self._sunset = None
+        self._refresh_thread = Thread(
+            target=self._refresh
+        )
+
+        self._stopped = False
+        self._condition = Condition()
+        self._wake = Event()
+
+        # after a failed refresh the worker waits 1s, 2s, 4s... (at most refresh_ahead) before trying again, rather
+        # than spending a request (and a limiter token) every second for the length of an outage
+        self._refresh_failures = 0
+        self._retry_at = None
+
+        self._snapshot = None
+        self._fetched_at = None
+
+        # called with each new snapshot (fetched or adopted from the store), on the thread that got it
+        self._listeners = []
+
+        # optionally keep the last history_size observations for smoothing
+        self._history = WeatherHistory(history_size) if history_size is not None else None
+
+        # optionally fetch the 3-hourly forecast every forecast_period seconds (through the same limiter) and
+        # interpolate from the last observation toward it between fetches
+        self._forecast_period = forecast_period
+        self._forecast = None
+        self._forecast_fetched_at = None
+
+        # a failed forecast fetch is retried after a minute, then two and so on up to forecast_period; in background
+        # refresh mode it's only ever fetched by the worker
+        self._forecast_failures = 0
+        self._forecast_retry_at = None
 
         self._logger = getLogger(self.__class__.__name__)
-        self._logger.debug('{0}(); owm_key={1}, lat={2}, lon={3}, cache_period={4}'.format(
-            inspect.currentframe().f_code.co_name, repr(owm_key), lat, lon, cache_period
-        ))
+        self._logger.debug(
+            '__init__(); owm_key=%r, lat=%s, lon=%s, cache_period=%s, background_refresh=%s, max_staleness=%s, '
+            'timeout=%s, cache_path=%r, limiter=%s, history_size=%s, forecast_period=%s, provider=%s, store=%s',
+            owm_key, lat, lon, cache_period, background_refresh, max_staleness, timeout, cache_path, limiter,
+            history_size, forecast_period, self._provider, store
+        )
+
+        # optionally persist the last observation so a restart within cache_period doesn't need to hit OWM
+        self._cache = SnapshotCache(cache_path) if cache_path is not None else None
+        self._cache_key = '{0},{1}'.format(lat, lon)
+
+        if self._cache is not None:
+            self._load()
+
+        # optionally publish each observation to a Store and adopt newer ones that arrive there (i.e. replicated from
+        # the active node), so a standby taking over already has current weather
+        self._store = store
+        self._store_key = STORE_KEY_PREFIX + self._cache_key
+
+        # the forecast too, so a restart (with a persisted store) doesn't have to fetch it either
+        self._forecast_store_key = STORE_KEY_PREFIX + 'forecast.' + self._cache_key
+
+        if self._store is not None:
+            stored = self._store.get(self._store_key)
+            if stored is not None:
+                self._handle_stored(self._store_key, stored, None)
+
+            stored = self._store.get(self._forecast_store_key)
+            if stored is not None:
+                self._handle_stored_forecast(self._forecast_store_key, stored, None)
+
+            self._store.subscribe(self._store_key, self._handle_stored)
+            self._store.subscribe(self._forecast_store_key, self._handle_stored_forecast)
+
+    def _load(self):
+        snapshot = self._cache.load(self._cache_key)
+        if snapshot is None:
+            return
+
+        with self._condition:
+            self._set_snapshot(snapshot, age=(datetime.datetime.now() - snapshot.timestamp).total_seconds())
+
+        self._logger.info('_load(); snapshot=%s', snapshot)
+
+    def _set_snapshot(self, snapshot, age=0):
+        self._snapshot = snapshot
+        self._fetched_at = self._clock() - max(age, 0)
+        self._fresh.set(snapshot, age=age)
+
+    def _set_forecast(self, forecast, age=0):
+        self._forecast = forecast
+        self._forecast_fetched_at = self._clock() - max(age, 0)
+
+    def _handle_stored(self, key, value, old_value):
+        snapshot = from_row(value)
+
+        with self._condition:
+            # including our own, published by _fetch()
+            if self._snapshot is not None and snapshot.timestamp <= self._snapshot.timestamp:
+                return
+
+            self._set_snapshot(snapshot, age=(datetime.datetime.now() - snapshot.timestamp).total_seconds())
+
+            if self._history is not None:
+                self._history.append(
+                    to_unix(snapshot.timestamp), snapshot.temperature, snapshot.humidity, snapshot.wind_speed
+                )
+
+            self._condition.notify_all()
+
+        if self._cache is not None:
+            self._cache.save(self._cache_key, snapshot)
+
+        self._logger.info('_handle_stored(); adopted snapshot=%s', snapshot)
+
+        self._notify(snapshot)
+
+    def _handle_stored_forecast(self, key, value, old_value):
+        forecast = ForecastSeries.from_row(value)
+
+        with self._condition:
+            if self._forecast is not None and forecast.fetched <= self._forecast.fetched:
+                return
+
+            self._set_forecast(forecast, age=(datetime.datetime.now() - forecast.fetched).total_seconds())
+
+        self._logger.info('_handle_stored_forecast(); adopted forecast=%s', forecast)
 
     def _check_need_to_update(self):
-        need_to_update = self._weather is None or self._need_to_update.value
+        need_to_update = self._snapshot is None or self._fresh.stale
 
-        self._logger.debug('{0}(); need_to_update={1}'.format(
-            inspect.currentframe().f_code.co_name, need_to_update
-        ))
+        self._logger.debug('_check_need_to_update(); need_to_update=%s', need_to_update)
 
         return need_to_update
 
-    def _update(self):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
-
-        if self._check_need_to_update():
-            self._weather = self._owm.weather_at_coords(
-                lat=self._lat,
-                lon=self._lon,
-            ).get_weather()
-
-            self._temperature = float(self._weather.get_temperature(unit='celsius').get('temp'))
-            self._humidity = float(self._weather.get_humidity())
-            self._wind_speed = float(self._weather.get_wind().get('speed'))
-            self._apparent_temperature = get_apparent_temperature(
-                self._temperature, self._humidity, self._wind_speed,
-            )
-            self._sunrise = datetime.datetime.fromtimestamp(self._weather.get_sunrise_time(timeformat='unix'))
-            self._sunset = datetime.datetime.fromtimestamp(self._weather.get_sunset_time(timeformat='unix'))
+    def _check_need_to_refresh(self, now):
+        need_to_refresh = self._snapshot is None or now - self._fetched_at >= self._refresh_ahead
 
-            self._logger.debug(
-                '{0}(); temperature={1}, humidity={2}, sunrise={3}, sunset={4}, apparent_temperature={5}'.format(
-                    inspect.currentframe().f_code.co_name,
-                    self._temperature,
-                    self._humidity,
-                    self._sunrise,
-                    self._sunset,
-                    self._apparent_temperature
-                ))
+        self._logger.debug('_check_need_to_refresh(); need_to_refresh=%s', need_to_refresh)
 
-            self._need_to_update.value = False
+        return need_to_refresh
 
-    @property
-    def temperature(self):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
+    def _check_budget(self, now, period):
+        if self._limiter is None:
+            return True
 
-        self._update()
-        temperature = self._temperature
+        # with something to serve, wait out the (possibly stretched) period and don't queue for a token
+        if self._snapshot is not None:
+            if now - self._fetched_at < self._limiter.stretch(period):
+                return False
 
-        self._logger.debug('{0}(); temperature={1}'.format(
-            inspect.currentframe().f_code.co_name, temperature
-        ))
+            return self._limiter.acquire(blocking=False)
 
-        return temperature
+        with span('weather.budget'):
+            return self._limiter.acquire(timeout=self._timeout)
 
-    @property
-    def humidity(self):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
+    def _check_too_stale(self, now):
+        return self._snapshot is None or now - self._fetched_at > self._max_staleness
 
-        self._update()
-        humidity = self._humidity
+    def _fetch(self):
+        self._logger.debug('_fetch()')
 
-        self._logger.debug('{0}(); humidity={1}'.format(
-            inspect.currentframe().f_code.co_name, humidity
-        ))
+        snapshot = self._provider.fetch(self._lat, self._lon)
 
-        return humidity
+        with self._condition:
+            self._set_snapshot(snapshot)
 
-    @property
-    def wind_speed(self):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
+            if self._history is not None:
+                self._history.append(
+                    to_unix(snapshot.timestamp), snapshot.temperature, snapshot.humidity, snapshot.wind_speed
+                )
 
-        self._update()
-        wind_speed = self._wind_speed
+            self._condition.notify_all()
 
-        self._logger.debug('{0}(); wind_speed={1}'.format(
-            inspect.currentframe().f_code.co_name, wind_speed
-        ))
+        if self._cache is not None:
+            self._cache.save(self._cache_key, snapshot)
 
-        return wind_speed
+        if self._store is not None:
+            self._store.set(self._store_key, to_row(snapshot))
 
-    @property
-    def apparent_temperature(self):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
+        self._logger.debug('_fetch(); snapshot=%s', snapshot)
 
-        self._update()
-        apparent_temperature = self._apparent_temperature
+        self._notify(snapshot)
 
-        self._logger.debug('{0}(); apparent_temperature={1}'.format(
-            inspect.currentframe().f_code.co_name, apparent_temperature
-        ))
+    def _check_need_to_update_forecast(self, now):
+        if self._forecast_period is None:
+            return False
 
-        return apparent_temperature
+        if self._forecast_retry_at is not None and now < self._forecast_retry_at:
+            return False
 
-    @property
-    def sunrise(self):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
+        return self._forecast is None or now - self._forecast_fetched_at >= self._forecast_period
 
-        self._update()
-        sunrise = self._sunrise
+    def _fetch_forecast(self):
+        self._logger.debug('_fetch_forecast()')
+
+        # through the provider, so with its timeout and circuit breaker
+        forecast = self._provider.fetch_forecast(self._lat, self._lon)
+
+        with self._condition:
+            self._set_forecast(forecast)
+
+        if self._store is not None:
+            self._store.set(self._forecast_store_key, forecast.to_row())
+
+        self._logger.debug('_fetch_forecast(); forecast=%s', forecast)
+
+    def _update_forecast(self):
+        now = self._clock()
+        if not self._check_need_to_update_forecast(now):
+            return
+
+        # the forecast is a nice-to-have; never queue for it or let it fail the caller
+        if self._limiter is not None and not self._limiter.acquire(blocking=False):
+            return
+
+        try:
+            with span('weather.forecast'):
+                self._fetch_forecast()
+        except Exception as e:
+            self._forecast_failures += 1
+
+            delay = min(60 * 2 ** (self._forecast_failures - 1), self._forecast_period)
+            self._forecast_retry_at = now + delay
+
+            self._logger.warning('_update_forecast(); failed to fetch forecast, retrying in %ss; error=%r', delay, e)
+        else:
+            self._forecast_failures = 0
+            self._forecast_retry_at = None
+
+    def _backoff(self, now):
+        self._refresh_failures += 1
+
+        delay = min(2 ** (self._refresh_failures - 1), self._refresh_ahead)
+        self._retry_at = now + delay
+
+        return delay
 
-        self._logger.debug('{0}(); sunrise={1}'.format(
-            inspect.currentframe().f_code.co_name, sunrise
-        ))
+    def _refresh(self, test_mode=False):
+        while not self._stopped:
+            now = self._clock()
 
-        return sunrise
+            backing_off = self._retry_at is not None and now < self._retry_at
+
+            if not backing_off and self._check_need_to_refresh(now) and self._check_budget(now, self._refresh_ahead):
+                try:
+                    self._fetch()
+                except Exception as e:
+                    delay = self._backoff(now)
+                    self._logger.warning('_refresh(); failed to refresh weather, retrying in %ss; error=%r', delay, e)
+                else:
+                    self._refresh_failures = 0
+                    self._retry_at = None
+
+            self._update_forecast()
+
+            if test_mode:
+                break
+
+            if self._retry_at is not None:
+                delay = self._retry_at - self._clock()
+            elif self._snapshot is None:
+                delay = 1
+            else:
+                delay = self._fetched_at + self._refresh_ahead - self._clock()
+
+            self._wake.wait(max(delay, 1))
+            self._wake.clear()
+
+    def _wait_for_refresh(self):
+        self._logger.debug('_wait_for_refresh()')
+
+        self._wake.set()
+
+        with self._condition:
+            self._condition.wait_for(
+                lambda: not self._check_too_stale(self._clock()),
+                timeout=self._timeout,
+            )
+
+        if self._check_too_stale(self._clock()):
+            raise ValueError('weather older than max_staleness of {0}s and refresh did not finish within {1}s'.format(
+                self._max_staleness, self._timeout
+            ))
+
+    def _update(self):
+        self._logger.debug('_update()')
+
+        if not self._background_refresh:
+            if self._check_need_to_update() and self._check_budget(self._clock(), self._cache_period):
+                try:
+                    with span('weather.fetch'):
+                        self._fetch()
+                except Exception as e:
+                    # fall back to the last good observation for as long as it's within max_staleness
+                    if self._check_too_stale(self._clock()):
+                        raise
+
+                    self._logger.warning('_update(); serving last good snapshot; error=%r', e)
+
+            self._update_forecast()
+
+            return
+
+        if self._check_too_stale(self._clock()):
+            with span('weather.wait_for_refresh'):
+                self._wait_for_refresh()
+        elif self._check_need_to_update():
+            self._wake.set()
 
     @property
-    def sunset(self):
-        self._logger.debug('{0}()'.format(
-            inspect.currentframe().f_code.co_name
-        ))
+    def history(self):
+        return self._history
+
+    @property
+    def forecast(self):
+        return self._forecast
+
+    def temperature_at(self, minutes=0):
+        # served from what's cached; doesn't trigger a refresh (call snapshot() for that)
+        snapshot = self._snapshot
+        forecast = self._forecast
+        if snapshot is None or forecast is None:
+            return None
+
+        temperature = forecast.interpolate(
+            time.time() + minutes * 60, to_unix(snapshot.timestamp), snapshot.temperature
+        )
+
+        return float(temperature) if temperature is not None else None
 
+    def forecast_crossing(self, threshold, minutes):
+        # minutes from now until the interpolated temperature first reaches threshold within the next minutes, or None
+        snapshot = self._snapshot
+        forecast = self._forecast
+        if snapshot is None or forecast is None:
+            return None
+
+        now = time.time()
+        crossing = forecast.first_crossing(
+            threshold, now, now + minutes * 60, to_unix(snapshot.timestamp), snapshot.temperature
+        )
+
+        return (crossing - now) / 60 if crossing is not None else None
+
+    def snapshot(self):
         self._update()
-        sunset = self._sunset
+        snapshot = self._snapshot
+
+        if snapshot is None:
+            raise ValueError('no weather available; OWM request budget exhausted')
+
+        self._logger.debug('snapshot(); snapshot=%s', snapshot)
+
+        return snapshot
+
+    def start(self):
+        if self._background_refresh:
+            self._refresh_thread.start()
 
-        self._logger.debug('{0}(); sunset={1}'.format(
-            inspect.currentframe().f_code.co_name, sunset
-        ))
+    def stop(self):
+        self._stopped = True
 
-        return sunset
+        if self._background_refresh:
+            self._wake.set()
+            self._refresh_thread.join()
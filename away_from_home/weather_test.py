@@ -1,10 +1,18 @@
 import datetime
+import os
+import shutil
+import tempfile
 import unittest
 
-from hamcrest import assert_that, equal_to, close_to
+from hamcrest import assert_that, equal_to, close_to, calling, raises
 from mock import patch, MagicMock, call
 
-from away_from_home.weather import Weather, get_apparent_temperature
+from away_from_home.forecast import ForecastSeries
+from away_from_home.history import WeatherHistory
+from away_from_home.snapshot import SnapshotCache, to_row, to_unix
+from away_from_home.store import Store
+from away_from_home.testing import FakeClock
+from away_from_home.weather import Weather, WeatherSnapshot, get_apparent_temperature
 
 _TEST_TIMESTAMP = datetime.datetime(year=1991, month=2, day=6)
 
@@ -14,6 +22,29 @@ _LON = 115.894571
 _CACHE_PERIOD = 300
 
 
+def _observation_weather():
+    weather = MagicMock()
+    weather.get_temperature.return_value = {'temp': 32}
+    weather.get_humidity.return_value = 25
+    weather.get_wind.return_value = {'speed': 5, 'deg': 330}
+    weather.get_sunrise_time.return_value = 1509743779
+    weather.get_sunset_time.return_value = 1509792245
+
+    return weather
+
+
+def _snapshot(timestamp):
+    return WeatherSnapshot(
+        timestamp=timestamp,
+        temperature=32.0,
+        humidity=25.0,
+        wind_speed=5.0,
+        apparent_temperature=28.41,
+        sunrise=_TEST_TIMESTAMP,
+        sunset=_TEST_TIMESTAMP,
+    )
+
+
 class FunctionsTest(unittest.TestCase):
     def test_get_apparent_temperature(self):
         assert_that(
@@ -23,14 +54,16 @@ class FunctionsTest(unittest.TestCase):
 
 
 class WeatherTest(unittest.TestCase):
-    @patch('away_from_home.weather.ExpiringBool')
+    @patch('away_from_home.weather.ExpiringValue')
     @patch('away_from_home.weather.OWM')
-    def setUp(self, owm, expiring_bool):
+    def setUp(self, owm, expiring_value):
+        self._clock = FakeClock()
         self._subject = Weather(
             owm_key=_OWM_KEY,
             lat=_LAT,
             lon=_LON,
             cache_period=_CACHE_PERIOD,
+            clock=self._clock,
         )
 
         assert_that(
@@ -41,9 +74,9 @@ class WeatherTest(unittest.TestCase):
         )
 
         assert_that(
-            expiring_bool.mock_calls,
+            expiring_value.mock_calls,
             equal_to([
-                call(300)
+                call(300, clock=self._clock)
             ])
         )
 
@@ -54,8 +87,8 @@ class WeatherTest(unittest.TestCase):
         )
 
     def test_check_need_to_update_not_needed(self):
-        self._subject._weather = MagicMock()
-        self._subject._need_to_update.value = False
+        self._subject._snapshot = MagicMock()
+        self._subject._fresh.stale = False
 
         assert_that(
             self._subject._check_need_to_update(),
@@ -63,8 +96,8 @@ class WeatherTest(unittest.TestCase):
         )
 
     def test_check_need_to_update_needed(self):
-        self._subject._weather = MagicMock()
-        self._subject._need_to_update.value = True
+        self._subject._snapshot = MagicMock()
+        self._subject._fresh.stale = True
 
         assert_that(
             self._subject._check_need_to_update(),
@@ -111,35 +144,629 @@ class WeatherTest(unittest.TestCase):
         )
 
         assert_that(
-            self._subject._temperature,
+            self._subject._snapshot.temperature,
             equal_to(32.0)
         )
         assert_that(
-            self._subject._humidity,
+            self._subject._snapshot.humidity,
             equal_to(25.0)
         )
         assert_that(
-            self._subject._wind_speed,
+            self._subject._snapshot.wind_speed,
             equal_to(5.0)
         )
         assert_that(
-            self._subject._apparent_temperature,
+            self._subject._snapshot.apparent_temperature,
             equal_to(28.41)
         )
         assert_that(
-            self._subject._sunrise,
+            self._subject._snapshot.sunrise,
             equal_to(datetime.datetime.strptime(
                 '2017-11-04 05:16:19', '%Y-%m-%d %H:%M:%S'
             ))
         )
         assert_that(
-            self._subject._sunset,
+            self._subject._snapshot.sunset,
             equal_to(datetime.datetime.strptime(
                 '2017-11-04 18:44:05', '%Y-%m-%d %H:%M:%S'
             ))
         )
 
         assert_that(
-            self._subject._need_to_update.value,
+            self._subject._fresh.mock_calls,
+            equal_to([
+                call.set(self._subject._snapshot, age=0)
+            ])
+        )
+
+    def test_update_serves_last_good_snapshot(self):
+        self._subject._set_snapshot(_snapshot(_TEST_TIMESTAMP), age=400)
+        self._subject._fresh.stale = True
+        self._subject._provider = MagicMock()
+        self._subject._provider.fetch.side_effect = ValueError('all weather providers failed')
+
+        assert_that(
+            self._subject.snapshot(),
+            equal_to(self._subject._snapshot)
+        )
+
+    def test_update_too_stale_to_serve(self):
+        self._subject._set_snapshot(_snapshot(_TEST_TIMESTAMP), age=1000)
+        self._subject._fresh.stale = True
+        self._subject._provider = MagicMock()
+        self._subject._provider.fetch.side_effect = ValueError('all weather providers failed')
+
+        assert_that(
+            calling(self._subject.snapshot),
+            raises(ValueError)
+        )
+
+    def test_fetch_appends_history(self):
+        self._subject._history = WeatherHistory(4)
+        self._subject._owm.weather_at_coords.return_value.get_weather.return_value = _observation_weather()
+
+        self._subject._fetch()
+
+        assert_that(
+            (len(self._subject.history), self._subject.history.mean),
+            equal_to((1, 32.0))
+        )
+
+    def test_snapshot(self):
+        self._subject._update = MagicMock()
+        self._subject._snapshot = _snapshot(_TEST_TIMESTAMP)
+
+        assert_that(
+            self._subject.snapshot(),
+            equal_to(_snapshot(_TEST_TIMESTAMP))
+        )
+
+        assert_that(
+            self._subject._update.mock_calls,
+            equal_to([
+                call()
+            ])
+        )
+
+    def test_snapshot_immutable(self):
+        assert_that(
+            calling(setattr).with_args(_snapshot(_TEST_TIMESTAMP), 'temperature', 0.0),
+            raises(AttributeError)
+        )
+
+    def test_properties_read_snapshot(self):
+        self._subject.snapshot = MagicMock()
+        self._subject.snapshot.return_value = _snapshot(_TEST_TIMESTAMP)
+
+        assert_that(
+            (self._subject.temperature, self._subject.humidity, self._subject.wind_speed),
+            equal_to((32.0, 25.0, 5.0))
+        )
+
+
+class WeatherBackgroundRefreshTest(unittest.TestCase):
+    @patch('away_from_home.weather.Thread')
+    @patch('away_from_home.weather.OWM')
+    def setUp(self, owm, thread):
+        self._clock = FakeClock()
+        self._subject = Weather(
+            owm_key=_OWM_KEY,
+            lat=_LAT,
+            lon=_LON,
+            cache_period=_CACHE_PERIOD,
+            background_refresh=True,
+            max_staleness=900,
+            timeout=0,
+            clock=self._clock,
+        )
+
+        assert_that(
+            thread.mock_calls,
+            equal_to([
+                call(target=self._subject._refresh),
+            ])
+        )
+
+        self._subject._fetch = MagicMock()
+
+    def test_check_need_to_refresh_ahead_of_expiry(self):
+        self._subject._set_snapshot(_snapshot(_TEST_TIMESTAMP))
+
+        assert_that(
+            self._subject._check_need_to_refresh(1239.0),
+            equal_to(False)
+        )
+
+        assert_that(
+            self._subject._check_need_to_refresh(1240.0),
+            equal_to(True)
+        )
+
+    def test_check_too_stale(self):
+        self._subject._set_snapshot(_snapshot(_TEST_TIMESTAMP))
+
+        assert_that(
+            self._subject._check_too_stale(1900.0),
             equal_to(False)
         )
+
+        assert_that(
+            self._subject._check_too_stale(1901.0),
+            equal_to(True)
+        )
+
+    def test_refresh_ignores_wall_clock_step(self):
+        # fetched, then the wall clock stepped back a day
+        self._subject._fetch.side_effect = lambda: self._subject._set_snapshot(
+            _snapshot(datetime.datetime.now() + datetime.timedelta(days=1))
+        )
+        self._subject._refresh(test_mode=True)
+
+        self._clock.now += 240
+        self._subject._refresh(test_mode=True)
+
+        assert_that(
+            len(self._subject._fetch.mock_calls),
+            equal_to(2)
+        )
+
+    def test_refresh(self):
+        self._subject._refresh(test_mode=True)
+
+        assert_that(
+            self._subject._fetch.mock_calls,
+            equal_to([
+                call()
+            ])
+        )
+
+    def test_refresh_swallows_errors(self):
+        self._subject._fetch.side_effect = ValueError('owm is down')
+
+        self._subject._refresh(test_mode=True)
+
+        assert_that(
+            self._subject._fetch.mock_calls,
+            equal_to([
+                call()
+            ])
+        )
+
+    def test_refresh_backs_off(self):
+        self._subject._fetch.side_effect = ValueError('owm is down')
+
+        for _ in range(0, 5):
+            self._subject._refresh(test_mode=True)
+
+        assert_that(
+            (len(self._subject._fetch.mock_calls), self._subject._refresh_failures),
+            equal_to((1, 1))
+        )
+
+        for failures in range(2, 12):
+            self._subject._retry_at = self._clock()
+            self._subject._refresh(test_mode=True)
+
+        assert_that(
+            (len(self._subject._fetch.mock_calls), self._subject._retry_at - self._clock()),
+            equal_to((11, 240.0))
+        )
+
+        self._subject._fetch.side_effect = None
+        self._subject._retry_at = self._clock()
+        self._subject._refresh(test_mode=True)
+
+        assert_that(
+            (self._subject._refresh_failures, self._subject._retry_at),
+            equal_to((0, None))
+        )
+
+    def test_update_serves_stale_and_wakes_worker(self):
+        self._subject._set_snapshot(_snapshot(_TEST_TIMESTAMP), age=600)
+        self._subject._fresh = MagicMock()
+        self._subject._fresh.stale = True
+
+        assert_that(
+            self._subject.temperature,
+            equal_to(32.0)
+        )
+
+        assert_that(
+            self._subject._fetch.mock_calls,
+            equal_to([])
+        )
+
+        assert_that(
+            self._subject._wake.is_set(),
+            equal_to(True)
+        )
+
+    def test_update_too_stale(self):
+        self._subject._set_snapshot(_snapshot(_TEST_TIMESTAMP), age=1000)
+
+        assert_that(
+            calling(self._subject._update),
+            raises(ValueError)
+        )
+
+    def test_start_stop(self):
+        self._subject._refresh_thread = MagicMock()
+
+        self._subject.start()
+        self._subject.stop()
+
+        assert_that(
+            self._subject._refresh_thread.mock_calls,
+            equal_to([
+                call.start(),
+                call.join(),
+            ])
+        )
+
+
+class WeatherCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tempdir = tempfile.mkdtemp()
+        self._path = os.path.join(self._tempdir, 'weather.db')
+
+    def tearDown(self):
+        shutil.rmtree(self._tempdir)
+
+    @patch('away_from_home.weather.OWM')
+    def _weather(self, owm):
+        return Weather(
+            owm_key=_OWM_KEY,
+            lat=_LAT,
+            lon=_LON,
+            cache_period=_CACHE_PERIOD,
+            cache_path=self._path,
+        )
+
+    def test_restart_within_cache_period_uses_disk(self):
+        SnapshotCache(self._path).save(
+            '{0},{1}'.format(_LAT, _LON), _snapshot(datetime.datetime.now() - datetime.timedelta(seconds=60))
+        )
+
+        subject = self._weather()
+
+        assert_that(
+            subject.temperature,
+            equal_to(32.0)
+        )
+
+        assert_that(
+            subject._owm.mock_calls,
+            equal_to([])
+        )
+
+    def test_restart_after_cache_period_fetches(self):
+        SnapshotCache(self._path).save(
+            '{0},{1}'.format(_LAT, _LON), _snapshot(datetime.datetime.now() - datetime.timedelta(seconds=600))
+        )
+
+        subject = self._weather()
+        subject._fetch = MagicMock()
+
+        subject.snapshot()
+
+        assert_that(
+            subject._fetch.mock_calls,
+            equal_to([
+                call()
+            ])
+        )
+
+    def test_fetch_saves_to_disk(self):
+        subject = self._weather()
+        subject._owm.weather_at_coords.return_value.get_weather.return_value = _observation_weather()
+
+        subject._fetch()
+
+        assert_that(
+            SnapshotCache(self._path).load('{0},{1}'.format(_LAT, _LON)),
+            equal_to(subject._snapshot)
+        )
+
+
+class WeatherLimiterTest(unittest.TestCase):
+    @patch('away_from_home.weather.OWM')
+    def setUp(self, owm):
+        self._subject = Weather(
+            owm_key=_OWM_KEY,
+            lat=_LAT,
+            lon=_LON,
+            cache_period=_CACHE_PERIOD,
+            limiter=MagicMock(),
+        )
+
+        self._subject._fetch = MagicMock()
+
+    def test_update_waits_out_stretched_period(self):
+        self._subject._limiter.stretch.return_value = 1200
+        self._subject._set_snapshot(_snapshot(datetime.datetime.now() - datetime.timedelta(seconds=600)), age=600)
+
+        self._subject._update()
+
+        assert_that(
+            self._subject._fetch.mock_calls,
+            equal_to([])
+        )
+
+        assert_that(
+            self._subject._limiter.mock_calls,
+            equal_to([
+                call.stretch(_CACHE_PERIOD)
+            ])
+        )
+
+    def test_update_spends_token(self):
+        self._subject._limiter.stretch.return_value = _CACHE_PERIOD
+        self._subject._limiter.acquire.return_value = True
+        self._subject._set_snapshot(_snapshot(datetime.datetime.now() - datetime.timedelta(seconds=600)), age=600)
+
+        self._subject._update()
+
+        assert_that(
+            self._subject._limiter.mock_calls,
+            equal_to([
+                call.stretch(_CACHE_PERIOD),
+                call.acquire(blocking=False),
+            ])
+        )
+
+        assert_that(
+            self._subject._fetch.mock_calls,
+            equal_to([
+                call()
+            ])
+        )
+
+    def test_snapshot_budget_exhausted(self):
+        self._subject._limiter.acquire.return_value = False
+
+        assert_that(
+            calling(self._subject.snapshot),
+            raises(ValueError)
+        )
+
+        assert_that(
+            self._subject._limiter.mock_calls,
+            equal_to([
+                call.acquire(timeout=None)
+            ])
+        )
+
+
+class WeatherForecastTest(unittest.TestCase):
+    @patch('away_from_home.weather.OWM')
+    def setUp(self, owm):
+        self._clock = FakeClock()
+        self._subject = Weather(
+            owm_key=_OWM_KEY,
+            lat=_LAT,
+            lon=_LON,
+            cache_period=_CACHE_PERIOD,
+            forecast_period=3600,
+            clock=self._clock,
+        )
+
+    def _forecast(self, *points):
+        weathers = []
+        for reference_time, temperature in points:
+            weather = MagicMock()
+            weather.get_reference_time.return_value = reference_time
+            weather.get_temperature.return_value = {'temp': temperature}
+            weathers.append(weather)
+
+        self._subject._owm.three_hours_forecast_at_coords.return_value.get_forecast.return_value \
+            .get_weathers.return_value = weathers
+
+    def test_check_need_to_update_forecast(self):
+        assert_that(
+            self._subject._check_need_to_update_forecast(1000.0),
+            equal_to(True)
+        )
+
+        self._subject._set_forecast(ForecastSeries(fetched=_TEST_TIMESTAMP, times=[], temperatures=[]))
+
+        assert_that(
+            self._subject._check_need_to_update_forecast(4599.0),
+            equal_to(False)
+        )
+
+        assert_that(
+            self._subject._check_need_to_update_forecast(4600.0),
+            equal_to(True)
+        )
+
+    def test_fetch_forecast(self):
+        self._forecast((1509753600, 30.0), (1509742800, 27.0))
+
+        self._subject._fetch_forecast()
+
+        assert_that(
+            self._subject._owm.mock_calls[0],
+            equal_to(call.three_hours_forecast_at_coords(lat=_LAT, lon=_LON))
+        )
+
+        assert_that(
+            (self._subject.forecast.times.tolist(), self._subject.forecast.temperatures.tolist()),
+            equal_to(([1509742800.0, 1509753600.0], [27.0, 30.0]))
+        )
+
+    def test_update_forecast_swallows_errors(self):
+        self._subject._owm.three_hours_forecast_at_coords.side_effect = ValueError('owm is down')
+
+        self._subject._update_forecast()
+
+        assert_that(
+            self._subject.forecast,
+            equal_to(None)
+        )
+
+    def test_update_forecast_backs_off(self):
+        self._subject._owm.three_hours_forecast_at_coords.side_effect = ValueError('owm is down')
+
+        for _ in range(0, 5):
+            self._subject._update_forecast()
+
+        assert_that(
+            len(self._subject._owm.three_hours_forecast_at_coords.mock_calls),
+            equal_to(1)
+        )
+
+        self._subject._forecast_retry_at = self._clock()
+        self._subject._update_forecast()
+
+        assert_that(
+            (len(self._subject._owm.three_hours_forecast_at_coords.mock_calls),
+             self._subject._forecast_retry_at - self._clock()),
+            equal_to((2, 120))
+        )
+
+    def test_temperature_at_and_crossing(self):
+        now = datetime.datetime.now()
+        self._subject._snapshot = _snapshot(now)._replace(temperature=26.0)
+        self._forecast((to_unix(now) + 3 * 3600, 32.0))
+        self._subject._fetch_forecast()
+
+        assert_that(
+            self._subject.temperature_at(90),
+            close_to(29.0, 0.01)
+        )
+
+        assert_that(
+            self._subject.forecast_crossing(29.0, 120),
+            close_to(90.0, 0.01)
+        )
+
+        assert_that(
+            self._subject.forecast_crossing(29.0, 60),
+            equal_to(None)
+        )
+
+    def test_temperature_at_no_forecast(self):
+        self._subject._snapshot = _snapshot(_TEST_TIMESTAMP)
+
+        assert_that(
+            self._subject.temperature_at(30),
+            equal_to(None)
+        )
+
+
+class WeatherStoreTest(unittest.TestCase):
+    @patch('away_from_home.weather.OWM')
+    def setUp(self, owm):
+        self._store = Store()
+        self._subject = Weather(
+            owm_key=_OWM_KEY,
+            lat=_LAT,
+            lon=_LON,
+            cache_period=_CACHE_PERIOD,
+            provider=MagicMock(),
+            history_size=4,
+            store=self._store,
+        )
+        self._key = 'weather.{0},{1}'.format(_LAT, _LON)
+
+    def test_fetch_publishes(self):
+        snapshot = _snapshot(_TEST_TIMESTAMP)
+        self._subject._provider.fetch.return_value = snapshot
+
+        self._subject._fetch()
+
+        assert_that(
+            (self._store.get(self._key), len(self._subject.history)),
+            equal_to((to_row(snapshot), 1))
+        )
+
+    def test_adopts_newer_from_store(self):
+        snapshot = _snapshot(datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(seconds=60))
+
+        self._store.set(self._key, to_row(snapshot))
+
+        assert_that(
+            (self._subject.snapshot(), self._subject._provider.fetch.mock_calls, len(self._subject.history)),
+            equal_to((snapshot, [], 1))
+        )
+
+    def test_ignores_older_from_store(self):
+        snapshot = _snapshot(datetime.datetime.now().replace(microsecond=0))
+        self._subject._snapshot = snapshot
+
+        self._store.set(self._key, to_row(snapshot._replace(
+            timestamp=snapshot.timestamp - datetime.timedelta(seconds=60), temperature=20.0
+        )))
+
+        assert_that(
+            self._subject._snapshot,
+            equal_to(snapshot)
+        )
+
+
+    def test_forecast_published_and_adopted(self):
+        forecast = ForecastSeries(
+            fetched=datetime.datetime.now().replace(microsecond=0), times=[1509742800.0], temperatures=[27.0]
+        )
+        self._subject._provider.fetch_forecast.return_value = forecast
+
+        self._subject._fetch_forecast()
+
+        with patch('away_from_home.weather.OWM'):
+            restarted = Weather(
+                owm_key=_OWM_KEY,
+                lat=_LAT,
+                lon=_LON,
+                cache_period=_CACHE_PERIOD,
+                provider=MagicMock(),
+                forecast_period=3600,
+                store=self._store,
+            )
+
+        restarted._update_forecast()
+
+        assert_that(
+            (restarted.forecast.fetched, restarted.forecast.temperatures.tolist(), restarted._provider.mock_calls),
+            equal_to((forecast.fetched, [27.0], []))
+        )
+
+
+class WeatherSubscribeTest(unittest.TestCase):
+    @patch('away_from_home.weather.OWM')
+    def setUp(self, owm):
+        self._subject = Weather(
+            owm_key=_OWM_KEY,
+            lat=_LAT,
+            lon=_LON,
+            cache_period=_CACHE_PERIOD,
+            provider=MagicMock(),
+        )
+
+    def test_notified_on_fetch(self):
+        snapshot = _snapshot(_TEST_TIMESTAMP)
+        self._subject._provider.fetch.return_value = snapshot
+        callback = MagicMock()
+        failing = MagicMock(side_effect=Exception('boom'))
+
+        self._subject.subscribe(failing)
+        self._subject.subscribe(callback)
+        self._subject._fetch()
+
+        assert_that(
+            callback.mock_calls,
+            equal_to([
+                call(snapshot)
+            ])
+        )
+
+    def test_unsubscribe(self):
+        self._subject._provider.fetch.return_value = _snapshot(_TEST_TIMESTAMP)
+        callback = MagicMock()
+
+        self._subject.subscribe(callback)()
+        self._subject._fetch()
+
+        assert_that(
+            callback.mock_calls,
+            equal_to([])
+        )
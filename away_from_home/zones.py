@@ -0,0 +1,156 @@
+from collections import namedtuple
+from logging import getLogger
+from threading import RLock
+
+import numpy as np
+
+from away_from_home.aircon import AirconGroup
+
+Zone = namedtuple('Zone', ['name', 'aircon', 'weather', 'on_threshold', 'off_threshold'])
+
+_UNKNOWN = -1
+_OFF = 0
+_ON = 1
+
+
+class ZoneComposer(object):
+    # Composer for many zones at once; the zone table is held as parallel arrays (thresholds, an index into the distinct
+    # weather sources, last state) so each run() reads every distinct weather source once, decides every zone in a few
+    # vectorised operations and only dispatches to the aircons whose state changes; one scheduler job runs the lot
+    def __init__(self, zones, smoothed=False, pre_cool_minutes=None, max_workers=None, deadline=30):
+        self._zones = list(zones)
+
+        self._aircons = [x.aircon for x in self._zones]
+
+        # with max_workers, changed zones are switched concurrently (through an AirconGroup, within deadline seconds)
+        # rather than one after another
+        self._group = None
+        if max_workers is not None:
+            self._group = AirconGroup(enumerate(self._aircons), max_workers=max_workers, deadline=deadline)
+
+        # zones commonly share a weather source (e.g. FleetWeather for nearby sites), so each is read once per run
+        self._weathers = []
+        weather_indices = []
+        for zone in self._zones:
+            for i, weather in enumerate(self._weathers):
+                if weather is zone.weather:
+                    break
+            else:
+                i = len(self._weathers)
+                self._weathers.append(zone.weather)
+
+            weather_indices.append(i)
+
+        self._weather_indices = np.asarray(weather_indices, dtype=np.intp)
+        self._on_thresholds = np.asarray([x.on_threshold for x in self._zones], dtype=np.float64)
+        self._off_thresholds = np.asarray([x.off_threshold for x in self._zones], dtype=np.float64)
+        self._states = np.full(len(self._zones), _UNKNOWN, dtype=np.int8)
+
+        # as for Composer
+        self._smoothed = smoothed
+        self._pre_cool_minutes = pre_cool_minutes
+
+        self._lock = RLock()
+
+        self._logger = getLogger(self.__class__.__name__)
+        self._logger.debug(
+            '__init__(); zones=%s, weathers=%s, smoothed=%s, pre_cool_minutes=%s, max_workers=%s, deadline=%s',
+            len(self._zones), len(self._weathers), smoothed, pre_cool_minutes, max_workers, deadline
+        )
+
+    @property
+    def states(self):
+        # zone name -> 'on', 'off' or None if we've not acted on it yet
+        with self._lock:
+            return {
+                zone.name: {_ON: 'on', _OFF: 'off'}.get(int(state))
+                for zone, state in zip(self._zones, self._states)
+            }
+
+    def _get_temperature(self, weather):
+        # snapshot() first either way, as that's what keeps a Weather (and its history) up to date
+        snapshot = weather.snapshot()
+
+        if self._smoothed:
+            history = weather.history
+            if history is not None and len(history) > 0:
+                return history.mean
+
+        return snapshot.temperature
+
+    def _read_weathers(self):
+        # nan for a source that fails, which leaves its zones as they are
+        temperatures = np.full(len(self._weathers), np.nan, dtype=np.float64)
+        forecasts = np.full(len(self._weathers), np.nan, dtype=np.float64)
+
+        for i, weather in enumerate(self._weathers):
+            try:
+                temperatures[i] = self._get_temperature(weather)
+            except Exception as e:
+                self._logger.warning('_read_weathers(); failed to read weather=%s; error=%r', weather, e)
+                continue
+
+            if self._pre_cool_minutes is not None:
+                forecast = weather.temperature_at(self._pre_cool_minutes)
+                if forecast is not None:
+                    forecasts[i] = forecast
+
+        return temperatures, forecasts
+
+    def _decide(self, temperatures, forecasts):
+        temperatures = temperatures[self._weather_indices]
+        forecasts = forecasts[self._weather_indices]
+
+        # comparisons with nan are False, so a missing reading or forecast never changes a zone
+        with np.errstate(invalid='ignore'):
+            want_on = (temperatures >= self._on_thresholds) | (forecasts >= self._on_thresholds)
+            want_off = ~want_on & (temperatures <= self._off_thresholds)
+
+        states = np.where(want_on, _ON, np.where(want_off, _OFF, self._states)).astype(np.int8)
+
+        return states, np.nonzero(states != self._states)[0]
+
+    def _dispatch(self, index, state):
+        zone = self._zones[index]
+
+        self._logger.debug('_dispatch(); zone=%r, state=%s', zone.name, state)
+
+        try:
+            if state == _ON:
+                zone.aircon.on()
+            else:
+                zone.aircon.off()
+        except Exception as e:
+            # left as it was, so it's tried again next run
+            self._logger.warning('_dispatch(); failed to switch zone=%r; error=%r', zone.name, e)
+            return
+
+        self._states[index] = state
+
+    def _dispatch_concurrently(self, changed, states):
+        results = self._group.command({int(x): 'on' if states[x] == _ON else 'off' for x in changed})
+
+        for index, error in results.items():
+            if error is not None:
+                # as for _dispatch
+                zone = self._zones[index]
+                self._logger.warning('_dispatch_concurrently(); failed to switch zone=%r; error=%r', zone.name, error)
+                continue
+
+            self._states[index] = states[index]
+
+    def run(self):
+        self._logger.debug('run()')
+
+        with self._lock:
+            temperatures, forecasts = self._read_weathers()
+            states, changed = self._decide(temperatures, forecasts)
+
+            self._logger.debug('run(); changed=%s of %s zones', len(changed), len(self._zones))
+
+            if self._group is not None and len(changed) > 0:
+                self._dispatch_concurrently(changed, states)
+                return
+
+            for index in changed:
+                self._dispatch(index, states[index])
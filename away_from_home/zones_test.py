@@ -0,0 +1,163 @@
+import datetime
+import unittest
+
+import numpy as np
+from hamcrest import assert_that, equal_to
+from mock import MagicMock, call
+
+from away_from_home.snapshot import WeatherSnapshot
+from away_from_home.zones import Zone, ZoneComposer
+
+_TEST_TIMESTAMP = datetime.datetime(year=1991, month=2, day=6)
+
+
+def _weather(temperature):
+    weather = MagicMock()
+    weather.snapshot.return_value = WeatherSnapshot(
+        timestamp=_TEST_TIMESTAMP,
+        temperature=temperature,
+        humidity=25.0,
+        wind_speed=5.0,
+        apparent_temperature=temperature,
+        sunrise=_TEST_TIMESTAMP,
+        sunset=_TEST_TIMESTAMP,
+    )
+    weather.temperature_at.return_value = None
+
+    return weather
+
+
+class ZoneComposerTest(unittest.TestCase):
+    def setUp(self):
+        self._hot = _weather(30)
+        self._mild = _weather(28)
+
+        self._zones = [
+            Zone(name='a', aircon=MagicMock(), weather=self._hot, on_threshold=29, off_threshold=27),
+            Zone(name='b', aircon=MagicMock(), weather=self._hot, on_threshold=31, off_threshold=30),
+            Zone(name='c', aircon=MagicMock(), weather=self._mild, on_threshold=29, off_threshold=27),
+        ]
+
+        self._subject = ZoneComposer(self._zones)
+
+    def test_weathers_deduplicated(self):
+        assert_that(
+            (len(self._subject._weathers), list(self._subject._weather_indices)),
+            equal_to((2, [0, 0, 1]))
+        )
+
+    def test_run(self):
+        self._subject.run()
+
+        assert_that(
+            [x.aircon.mock_calls for x in self._zones],
+            equal_to([[call.on()], [call.off()], []])
+        )
+
+        assert_that(
+            (self._hot.snapshot.mock_calls, self._subject.states),
+            equal_to(([call()], {'a': 'on', 'b': 'off', 'c': None}))
+        )
+
+    def test_run_dispatches_only_changes(self):
+        self._subject.run()
+        for zone in self._zones:
+            zone.aircon.reset_mock()
+
+        self._mild.snapshot.return_value = self._mild.snapshot.return_value._replace(temperature=26)
+        self._subject.run()
+
+        assert_that(
+            [x.aircon.mock_calls for x in self._zones],
+            equal_to([[], [], [call.off()]])
+        )
+
+    def test_failed_weather_leaves_zones(self):
+        self._hot.snapshot.side_effect = ValueError('owm is down')
+
+        self._subject.run()
+
+        assert_that(
+            [x.aircon.mock_calls for x in self._zones],
+            equal_to([[], [], []])
+        )
+
+    def test_failed_dispatch_retried(self):
+        self._zones[0].aircon.on.side_effect = [IOError('zmote unreachable'), None]
+
+        self._subject.run()
+
+        assert_that(
+            self._subject.states['a'],
+            equal_to(None)
+        )
+
+        self._subject.run()
+
+        assert_that(
+            (self._zones[0].aircon.on.mock_calls, self._subject.states['a']),
+            equal_to(([call(), call()], 'on'))
+        )
+
+    def test_pre_cool(self):
+        self._subject._pre_cool_minutes = 60
+        self._mild.temperature_at.return_value = 29.5
+
+        self._subject.run()
+
+        assert_that(
+            (self._subject.states['c'], self._mild.temperature_at.mock_calls),
+            equal_to(('on', [call(60)]))
+        )
+
+    def test_smoothed(self):
+        self._subject._smoothed = True
+        self._hot.history.__len__.return_value = 1
+        self._hot.history.mean = 26.0
+
+        self._subject.run()
+
+        assert_that(
+            self._subject.states,
+            equal_to({'a': 'off', 'b': 'off', 'c': None})
+        )
+
+    def test_smoothed_still_reads_snapshot(self):
+        self._subject._smoothed = True
+        self._hot.history.__len__.return_value = 1
+        self._hot.history.mean = 26.0
+
+        for _ in range(0, 3):
+            self._subject.run()
+
+        assert_that(
+            self._hot.snapshot.mock_calls,
+            equal_to([call()] * 3)
+        )
+
+    def test_decide_many(self):
+        zones = [
+            Zone(name=str(i), aircon=MagicMock(), weather=self._hot, on_threshold=float(i), off_threshold=i - 1.0)
+            for i in range(0, 500)
+        ]
+        subject = ZoneComposer(zones)
+
+        states, changed = subject._decide(np.asarray([30.0]), np.asarray([np.nan]))
+
+        assert_that(
+            (int((states == 1).sum()), int((states == 0).sum()), len(changed)),
+            equal_to((31, 469, 500))
+        )
+
+    def test_run_concurrently(self):
+        subject = ZoneComposer(self._zones, max_workers=4)
+        self.addCleanup(subject._group.close)
+
+        self._zones[1].aircon.off.side_effect = IOError('zmote unreachable')
+
+        subject.run()
+
+        assert_that(
+            ([x.aircon.mock_calls for x in self._zones], subject.states),
+            equal_to(([[call.on()], [call.off()], []], {'a': 'on', 'b': None, 'c': None}))
+        )
@@ -0,0 +1,50 @@
+import timeit
+from math import exp
+
+import numpy as np
+
+from away_from_home.comfort import apparent_temperature, heat_index, humidex
+
+# compares computing apparent temperature for a summer of hourly samples with a per-sample python loop (the old
+# math.exp based implementation) against the vectorised comfort module
+#
+# run with: python -m benchmarks.comfort_benchmark
+
+_HOURS = 92 * 24
+
+
+def _scalar_apparent_temperature(temperature, humidity, wind_speed):
+    e = humidity / 100 * 6.105 * exp((17.27 * temperature) / (237.7 + temperature))
+
+    return temperature + (0.33 * e) - (0.70 * wind_speed) - 4.00
+
+
+def loop(temperature, humidity, wind_speed):
+    return [
+        _scalar_apparent_temperature(t, h, w)
+        for t, h, w in zip(temperature.tolist(), humidity.tolist(), wind_speed.tolist())
+    ]
+
+
+def vectorised(temperature, humidity, wind_speed):
+    return apparent_temperature(temperature, humidity, wind_speed)
+
+
+def all_indices(temperature, humidity, wind_speed):
+    return (
+        apparent_temperature(temperature, humidity, wind_speed),
+        heat_index(temperature, humidity),
+        humidex(temperature, humidity),
+    )
+
+
+if __name__ == '__main__':
+    random = np.random.RandomState(1991)
+    temperature = random.uniform(15, 42, _HOURS)
+    humidity = random.uniform(10, 90, _HOURS)
+    wind_speed = random.uniform(0, 12, _HOURS)
+
+    print('{0} hourly samples'.format(_HOURS))
+    for func in [loop, vectorised, all_indices]:
+        seconds = min(timeit.repeat(lambda: func(temperature, humidity, wind_speed), number=20, repeat=5)) / 20
+        print('    {0:<12} {1:8.3f} ms'.format(func.__name__, seconds * 1e3))
@@ -0,0 +1,43 @@
+import inspect
+import logging
+import timeit
+
+# compares the per-call cost of the old eager debug logging (inspect.currentframe() plus str.format on every call) with
+# the lazy form now used throughout away_from_home, for a logger with DEBUG disabled and enabled
+#
+# run with: python -m benchmarks.log_benchmark
+
+_NUMBER = 200000
+
+_logger = logging.getLogger('log_benchmark')
+_logger.addHandler(logging.NullHandler())
+_logger.propagate = False
+
+
+def eager(temperature, above_on_threshold):
+    _logger.debug('{0}(); temperature={1}, above_on_threshold={2}'.format(
+        inspect.currentframe().f_code.co_name, temperature, above_on_threshold
+    ))
+
+
+def lazy(temperature, above_on_threshold):
+    _logger.debug(
+        '_check_above_on_threshold(); temperature=%s, above_on_threshold=%s', temperature, above_on_threshold
+    )
+
+
+def baseline(temperature, above_on_threshold):
+    pass
+
+
+def _per_call_ns(func):
+    return min(timeit.repeat(lambda: func(29.5, True), number=_NUMBER, repeat=5)) / _NUMBER * 1e9
+
+
+if __name__ == '__main__':
+    for level in [logging.INFO, logging.DEBUG]:
+        _logger.setLevel(level)
+
+        print('level={0}'.format(logging.getLevelName(level)))
+        for func in [baseline, eager, lazy]:
+            print('    {0:<8} {1:8.1f} ns/call'.format(func.__name__, _per_call_ns(func)))
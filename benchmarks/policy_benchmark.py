@@ -0,0 +1,26 @@
+import datetime
+import timeit
+
+from away_from_home.policy import compile_policy
+from away_from_home.snapshot import WeatherSnapshot
+
+# the cost of one decision by a compiled policy of a few typical rules
+#
+# run with: python -m benchmarks.policy_benchmark
+
+_RULES = [
+    {'action': 'off', 'when': {'daylight': False, 'last_action': 'on'}},
+    {'action': 'on', 'when': {'apparent_temperature': {'>=': 29}, 'time': {'between': ['08:00', '21:00']}}},
+    {'action': 'on', 'when': {'forecast_temperature': {'>=': 29}}},
+    {'action': 'off', 'when': {'temperature': {'<=': 27}}},
+]
+
+if __name__ == '__main__':
+    now = datetime.datetime.now().replace(hour=12)
+    snapshot = WeatherSnapshot(now, 28.0, 25.0, 5.0, 28.0, now.replace(hour=6), now.replace(hour=19))
+    policy = compile_policy(_RULES)
+
+    number = 100000
+    seconds = min(timeit.repeat(lambda: policy.decide(snapshot, now, 'on', 28.5), number=number, repeat=5)) / number
+    print('{0} rules, no match (every rule tried)'.format(len(_RULES)))
+    print('    {0:<12} {1:8.3f} us'.format('decide', seconds * 1e6))
@@ -0,0 +1,67 @@
+import datetime
+import timeit
+
+from away_from_home.composer import Composer
+from away_from_home.snapshot import WeatherSnapshot
+from away_from_home.zones import Zone, ZoneComposer
+
+# compares a tick over many zones as one Composer each against a single batched ZoneComposer; aircons do nothing, so
+# this is only the cost of deciding (and the zones sit in a steady state, as they do for most ticks)
+#
+# run with: python -m benchmarks.zones_benchmark
+
+_ZONES = 500
+_WEATHERS = 20
+
+
+class _Aircon(object):
+    def on(self):
+        pass
+
+    def off(self):
+        pass
+
+
+class _Weather(object):
+    history = None
+
+    def __init__(self, temperature):
+        now = datetime.datetime.now()
+        self._snapshot = WeatherSnapshot(now, temperature, 25.0, 5.0, temperature, now, now)
+
+    def snapshot(self):
+        return self._snapshot
+
+    def temperature_at(self, minutes=0):
+        return None
+
+    def forecast_crossing(self, threshold, minutes):
+        return None
+
+
+def per_zone(composers):
+    for composer in composers:
+        composer.run()
+
+
+def batched(zone_composer):
+    zone_composer.run()
+
+
+if __name__ == '__main__':
+    weathers = [_Weather(20.0 + i * 0.5) for i in range(0, _WEATHERS)]
+    zones = [
+        Zone(str(i), _Aircon(), weathers[i % _WEATHERS], 25.0 + (i % 7), 23.0 + (i % 7))
+        for i in range(0, _ZONES)
+    ]
+
+    composers = [Composer(x.weather, x.aircon, x.on_threshold, x.off_threshold) for x in zones]
+    zone_composer = ZoneComposer(zones)
+
+    per_zone(composers)
+    batched(zone_composer)
+
+    print('{0} zones over {1} weather sources'.format(_ZONES, _WEATHERS))
+    for name, func in [('per_zone', lambda: per_zone(composers)), ('batched', lambda: batched(zone_composer))]:
+        seconds = min(timeit.repeat(func, number=20, repeat=5)) / 20
+        print('    {0:<12} {1:8.3f} ms'.format(name, seconds * 1e3))
@@ -3,17 +3,71 @@ OWM_KEY = 'abcdefabcdefabcdefabcdefabcdefab'
 LAT = -31.946041
 LON = 115.920222
 CACHE_PERIOD = 300
+BACKGROUND_REFRESH = False
+MAX_STALENESS = 900
+REFRESH_TIMEOUT = 10
+CACHE_PATH = '/tmp/away_from_home_weather.db'
+HISTORY_SIZE = 12
+FORECAST_PERIOD = 3600
 
-# aircon
+# weather providers (tried in order; a provider is skipped for PROVIDER_RESET_TIMEOUT seconds after
+# PROVIDER_FAILURE_THRESHOLD consecutive failures)
+OWM_FALLBACK_KEY = None
+PROVIDER_TIMEOUT = 5
+PROVIDER_FAILURE_THRESHOLD = 3
+PROVIDER_RESET_TIMEOUT = 300
+
+# owm request budget (shared by every process using the same OWM_BUDGET_PATH)
+OWM_REQUESTS_PER_MINUTE = 60
+OWM_BURST = 10
+OWM_BUDGET_PATH = '/tmp/away_from_home_owm_budget.db'
+
+# aircon (IP to skip discovery; otherwise the zmote with UUID is discovered, remembered in the store and re-discovered
+# every ZMOTE_DISCOVERY_TTL seconds in the background)
+IP = None
 UUID = 'CI001abcde'
+ZMOTE_DISCOVERY_TTL = 3600
 RETRIES = 2
+ZMOTE_IDLE_TIMEOUT = 60
+IR_RETRY_INTERVAL = 1
+
+# what turning the aircon on sets it to (see away_from_home/fujitsu.py), e.g.
+# {'mode': 'cool', 'setpoint': 24, 'fan': 'auto', 'swing': 'off'}; None to send the recorded codes (cool at 18, fan low)
+FUJITSU_STATE = None
 
 # composer
 ON_THRESHOLD = 29
 OFF_THRESHOLD = 27
+SMOOTHED = False
+PRE_COOL_MINUTES = None
+
+# a list of rules to decide with in place of ON_THRESHOLD / OFF_THRESHOLD (see away_from_home/policy.py), e.g.
+# [
+#     {'action': 'on', 'when': {'apparent_temperature': {'>=': 29}, 'time': {'between': ['08:00', '21:00']}}},
+#     {'action': 'on', 'when': {'forecast_temperature': {'>=': 29}}},
+#     {'action': 'off', 'when': {'temperature': {'<=': 27}}},
+# ]
+POLICY = None
 
 # scheduler
 CRON_SECONDS = '0,30'
 
+# evaluate each new observation as it arrives (best with BACKGROUND_REFRESH); cron then only runs as a safety net,
+# on the minutes in SAFETY_NET_CRON_MINUTES
+EVENT_DRIVEN = False
+SAFETY_NET_CRON_MINUTES = '*/5'
+
 # heartbeat
 HA_PRIORITY = 2
+
+# state (last weather, last aircon action) that survives a restart; None to keep it in memory only
+STORE_PATH = '/tmp/away_from_home_store'
+STORE_COMPACT_EVERY = 1000
+
+# logging
+TRACE_PATH = '/tmp/away_from_home_trace'
+
+# every Composer run is traced (weather, decision and aircon steps, timed); the last DECISION_TRACE_BUFFER_SIZE are
+# kept in memory and, if DECISION_TRACE_PATH is set, all are appended to it as JSON lines
+DECISION_TRACE_BUFFER_SIZE = 1000
+DECISION_TRACE_PATH = None